@@ -2,16 +2,20 @@
 import http.server
 import socketserver
 import json
-import os
-import hashlib
 import uuid
 import urllib.parse
+import threading
+import time
 from datetime import datetime, timedelta
 from http.cookies import SimpleCookie
+from session_store import open_session_store, SessionSweeper, DEFAULT_BACKEND
+from json_file_cache import JSONFileCache
+from password_hashing import default_hasher, HashingBusy
 
 PORT = 8001
 USERS_FILE = "users.json"
 SESSIONS_FILE = "sessions.json"
+SESSION_BACKEND = DEFAULT_BACKEND
 
 class User:
     def __init__(self, username, password_hash, email="", created_at=None):
@@ -30,89 +34,121 @@ class User:
     
     @staticmethod
     def hash_password(password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        return default_hasher().hash(password)
 
 class SessionManager:
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls):
+        """プロセス内で共有するインスタンス"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
     def __init__(self):
         self.sessions = self.load_sessions()
     
     def load_sessions(self):
-        if os.path.exists(SESSIONS_FILE):
-            try:
-                with open(SESSIONS_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return open_session_store(SESSIONS_FILE, SESSION_BACKEND)
     
     def save_sessions(self):
-        with open(SESSIONS_FILE, 'w') as f:
-            json.dump(self.sessions, f)
+        self.sessions.flush()
     
     def create_session(self, username):
         session_id = str(uuid.uuid4())
+        now = datetime.now()
         self.sessions[session_id] = {
             'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(hours=24)).isoformat()
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(hours=24)).isoformat(),
+            'expires_ts': int(now.timestamp()) + 24 * 60 * 60
         }
-        self.save_sessions()
         return session_id
     
     def validate_session(self, session_id):
-        if session_id not in self.sessions:
+        # 他プロセスが書き換えていれば読み直す
+        self.sessions.refresh()
+        session = self.sessions.get(session_id)
+        if session is None:
             return None
         
-        session = self.sessions[session_id]
-        if datetime.fromisoformat(session['expires_at']) < datetime.now():
-            del self.sessions[session_id]
-            self.save_sessions()
+        if session['expires_ts'] < time.time():
+            # スイーパーや他のリクエストが先に削除していてもよい
+            self.sessions.delete_many([session_id])
             return None
         
         return session['username']
     
     def destroy_session(self, session_id):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            self.save_sessions()
+        self.sessions.delete_many([session_id])
 
 class UserManager:
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls):
+        """プロセス内で共有するインスタンス"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
     def __init__(self):
-        self.users = self.load_users()
+        # users.json はmtime/サイズが変わったときだけ読み直す
+        self.cache = JSONFileCache(USERS_FILE, indent=2)
+        self.lock = threading.RLock()
+    
+    @property
+    def users(self):
+        return self.cache.get()
     
     def load_users(self):
-        if os.path.exists(USERS_FILE):
-            try:
-                with open(USERS_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        self.cache.reload()
+        return self.cache.value
     
     def save_users(self):
-        with open(USERS_FILE, 'w') as f:
-            json.dump(self.users, f, indent=2)
+        self.cache.save()
     
     def create_user(self, username, password, email=""):
-        if username in self.users:
-            return False, "ユーザー名は既に使用されています"
-        
-        user = User(username, User.hash_password(password), email)
-        self.users[username] = user.to_dict()
-        self.save_users()
+        with self.lock:
+            users = self.users
+            if username in users:
+                return False, "ユーザー名は既に使用されています"
+            
+            user = User(username, User.hash_password(password), email)
+            users = dict(users)
+            users[username] = user.to_dict()
+            self.cache.save(users)
         return True, "ユーザーを作成しました"
     
     def authenticate(self, username, password):
-        if username not in self.users:
+        user = self.users.get(username)
+        if user is None:
             return False
         
-        user = self.users[username]
-        return user['password_hash'] == User.hash_password(password)
+        hasher = default_hasher()
+        if not hasher.verify(password, user['password_hash']):
+            return False
+        
+        # 従来のSHA-256はログイン成功時に新しい形式へ移行
+        if hasher.needs_rehash(user['password_hash']):
+            self.update_password_hash(username, User.hash_password(password))
+        return True
+    
+    def update_password_hash(self, username, password_hash):
+        with self.lock:
+            users = dict(self.users)
+            users[username] = dict(users[username], password_hash=password_hash)
+            self.cache.save(users)
 
 class AuthHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
-        self.user_manager = UserManager()
-        self.session_manager = SessionManager()
+        self.user_manager = UserManager.shared()
+        self.session_manager = SessionManager.shared()
         super().__init__(*args, **kwargs)
     
     def do_GET(self):
@@ -150,7 +186,22 @@ class AuthHandler(http.server.SimpleHTTPRequestHandler):
         username = params.get('username', [''])[0]
         password = params.get('password', [''])[0]
         
-        if self.user_manager.authenticate(username, password):
+        try:
+            authenticated = self.user_manager.authenticate(username, password)
+        except HashingBusy:
+            self.send_response(503)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            
+            response = {
+                'success': False,
+                'message': 'ただいま混み合っています。しばらくしてから再度お試しください'
+            }
+            self.wfile.write(json.dumps(response).encode())
+            return
+        
+        if authenticated:
             session_id = self.session_manager.create_session(username)
             
             self.send_response(200)
@@ -251,10 +302,13 @@ class AuthHandler(http.server.SimpleHTTPRequestHandler):
 
 def main():
     # デフォルトユーザーを作成
-    user_manager = UserManager()
+    user_manager = UserManager.shared()
     user_manager.create_user("demo", "demo123", "demo@example.com")
     user_manager.create_user("admin", "admin123", "admin@example.com")
     
+    # 期限切れセッションの定期削除
+    SessionSweeper(SessionManager.shared().sessions).start()
+    
     print(f"認証サーバーを起動しました: http://localhost:{PORT}")
     print("デフォルトユーザー:")
     print("  - demo / demo123")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+パスワードハッシュのベンチマーク
+ハッシュ用プールのワーカー数ごとに、同時ログインの処理件数（件/秒）を計測する
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from password_hashing import DEFAULT_ALGORITHM, DEFAULT_PARAMS, PasswordHasher, hash_password
+
+
+def run_benchmark(workers, logins, clients, algorithm, use_processes):
+    hasher = PasswordHasher(workers=workers, algorithm=algorithm, use_processes=use_processes,
+                            queue_size=clients, queue_timeout=60)
+    stored = hash_password('Analyst#2024', algorithm, DEFAULT_PARAMS[algorithm])
+
+    # ハンドラースレッドに見立てたクライアントから同時にログインさせる
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as handlers:
+        results = list(handlers.map(lambda _: hasher.verify('Analyst#2024', stored), range(logins)))
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+
+    assert all(results)
+    return logins / elapsed, elapsed / logins * 1000
+
+
+def main():
+    cpu_count = os.cpu_count() or 2
+    parser = argparse.ArgumentParser(description='パスワードハッシュのベンチマーク')
+    parser.add_argument('--pool-sizes', default=','.join(str(n) for n in sorted({1, 2, 4, cpu_count, cpu_count * 2})),
+                        help='計測するワーカー数（カンマ区切り）')
+    parser.add_argument('--logins', type=int, default=64, help='ログイン回数')
+    parser.add_argument('--clients', type=int, default=32, help='同時にログインするクライアント数')
+    parser.add_argument('--algorithm', default=DEFAULT_ALGORITHM, choices=sorted(DEFAULT_PARAMS))
+    parser.add_argument('--processes', action='store_true', help='スレッドではなくプロセスプールを使う')
+    args = parser.parse_args()
+
+    print(f"アルゴリズム: {args.algorithm} {DEFAULT_PARAMS[args.algorithm]}  CPU数: {cpu_count}")
+    print(f"{'ワーカー数':>8} {'件/秒':>10} {'平均(ms/件)':>12}")
+    print("-" * 34)
+    for workers in (int(n) for n in args.pool_sizes.split(',')):
+        throughput, per_login = run_benchmark(workers, args.logins, args.clients,
+                                              args.algorithm, args.processes)
+        print(f"{workers:>8} {throughput:>10.1f} {per_login:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
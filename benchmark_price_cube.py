@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+PriceCube のメモリ使用量ベンチマーク
+画面側と同じ辞書のリスト（originalData と detailData）と PriceCube で、
+同じ料金データを保持したときのメモリ使用量と保存・読み込み時間を比べる
+"""
+
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from price_cube import PriceCube
+
+ROOM_TYPES = ['ツイン', 'ダブル', 'シングル', '和室', 'スイート']
+PLAN_NAMES = ['素泊まり', '朝食付き', '2食付き', '連泊割', '早割30']
+
+
+def make_records(facilities, days, plans, seed=0):
+    """スクレイピング結果を取り込んだ後の originalData と同じ形式のデータ"""
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    records = []
+    for f in range(facilities):
+        facility = f"ホテル{f:04d}"
+        base = rng.randint(5, 30) * 1000
+        for d in range(days):
+            stay_date = (start + timedelta(days=d)).isoformat()
+            for p in range(plans):
+                price = 0 if rng.random() < 0.1 else base + rng.randint(-20, 40) * 100
+                records.append({
+                    'facility': facility,
+                    'date': stay_date,
+                    'price': price,
+                    'available': price > 0,
+                    'roomType': ROOM_TYPES[p % len(ROOM_TYPES)],
+                    'planName': PLAN_NAMES[p % len(PLAN_NAMES)],
+                    'url': f"https://example.com/hotels/{f:04d}?plan={p}",
+                    'fetchTime': '2025/05/28 10:00',
+                    'guests': 2
+                })
+    return records
+
+
+def build_detail_data(records):
+    """画面側の detailData（${facility}_${date} ごとのプラン一覧）"""
+    detail = {}
+    for record in records:
+        # JSの文字列連結と同じく、キーごとに新しい文字列を作る
+        key = '_'.join((record['facility'], record['date']))
+        detail.setdefault(key, []).append({
+            'price': record['price'],
+            'roomType': record['roomType'],
+            'planName': record['planName']
+        })
+    return detail
+
+
+def measure(build):
+    """build() の結果を保持するのに使ったメモリ（バイト）と時間"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PriceCube のメモリ使用量ベンチマーク')
+    parser.add_argument('--facilities', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--plans', type=int, default=3, help='施設・日付ごとのプラン数')
+    args = parser.parse_args()
+
+    # 実際の取り込み結果と同じく、行ごとに別の文字列オブジェクトを持たせる
+    records, records_bytes, _ = measure(lambda: [
+        {key: (value.encode().decode() if isinstance(value, str) else value) for key, value in record.items()}
+        for record in make_records(args.facilities, args.days, args.plans)])
+    detail, detail_bytes, _ = measure(lambda: build_detail_data(records))
+    cube, cube_bytes, build_time = measure(lambda: PriceCube.from_records(records))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'prices.cube')
+        start = time.perf_counter()
+        cube.save(path)
+        save_time = time.perf_counter() - start
+        file_size = os.path.getsize(path)
+        start = time.perf_counter()
+        loaded = PriceCube.load(path)
+        load_time = time.perf_counter() - start
+    assert loaded.record(len(loaded) - 1) == cube.record(len(cube) - 1)
+
+    dict_total = records_bytes + detail_bytes
+    print(f"行数: {len(records):,}（{args.facilities}施設 × {args.days}日 × {args.plans}プラン）")
+    print(f"{'形式':<32} {'メモリ(MB)':>12} {'1行あたり(B)':>14}")
+    print("-" * 62)
+    for label, size in [('辞書のリスト (originalData)', records_bytes),
+                        ('detailData', detail_bytes),
+                        ('辞書 合計', dict_total),
+                        ('PriceCube', cube_bytes)]:
+        print(f"{label:<32} {size / 1e6:>12.2f} {size / len(records):>14.1f}")
+    print(f"\n削減率: {(1 - cube_bytes / dict_total) * 100:.1f}%（{dict_total / cube_bytes:.0f}分の1）")
+    print(f"PriceCube 作成: {build_time:.2f}秒  保存: {save_time * 1000:.1f}ms  "
+          f"読み込み: {load_time * 1000:.1f}ms  ファイル: {file_size / 1e6:.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
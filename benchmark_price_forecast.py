@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+料金予測のベンチマーク
+曜日による変動のある料金行列（施設×日付）を作り、予測方法ごとに
+全施設の予測にかかる時間と、作成時の料金に対する誤差・予測区間の的中率を測る
+"""
+
+import argparse
+import time
+from array import array
+
+import numpy as np
+
+from price_forecast import METHODS, forecast_matrix
+from price_pivot import CELL_CLOSED, CELL_PRICE, PriceMatrix
+
+# 曜日（1970-01-01 からの日数 % 7）ごとの上乗せ額。金・土が高い
+WEEKDAY_MARKUP = np.array([0, 0, 0, 0, 1000, 3000, 2000])
+FIRST_DAY = 20089  # 2025-01-01
+
+
+def make_matrix(facilities, days, closed_rate, seed=0):
+    """施設ごとの基本料金 + 曜日の上乗せ + ばらつき。closed_rate の割合を満室にする"""
+    rng = np.random.default_rng(seed)
+    dates = np.arange(FIRST_DAY, FIRST_DAY + days)
+    base = rng.integers(5, 30, facilities)[:, None] * 1000
+    values = base + WEEKDAY_MARKUP[dates % 7] + rng.integers(-300, 300, (facilities, days))
+    mask = np.where(rng.random((facilities, days)) < closed_rate, CELL_CLOSED, CELL_PRICE)
+    matrix = PriceMatrix([f"ホテル{f:05d}" for f in range(facilities)], dates.tolist(),
+                         array('i', values.astype(np.int32).tobytes()),
+                         bytearray(mask.astype(np.uint8).tobytes()), 'min')
+    return matrix, base
+
+
+def main():
+    parser = argparse.ArgumentParser(description='料金予測のベンチマーク')
+    parser.add_argument('--facilities', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--horizon', type=int, default=14)
+    parser.add_argument('--closed-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    matrix, base = make_matrix(args.facilities, args.days, args.closed_rate)
+    forecast_days = FIRST_DAY + args.days + np.arange(args.horizon)
+    expected = base + WEEKDAY_MARKUP[forecast_days % 7]
+
+    print(f"{args.facilities:,}施設 × {args.days}日、{args.horizon}日先まで予測")
+    print(f"{'予測方法':<18} {'時間(ms)':>10} {'平均誤差(円)':>14} {'区間の的中率':>12}")
+    print("-" * 58)
+    for method in METHODS:
+        start = time.perf_counter()
+        forecast = forecast_matrix(matrix, method=method, horizon=args.horizon)
+        elapsed = time.perf_counter() - start
+        error = np.nanmean(np.abs(forecast.values - expected))
+        covered = np.nanmean((forecast.lower <= expected) & (expected <= forecast.upper))
+        print(f"{method:<18} {elapsed * 1000:>10.1f} {error:>14.0f} {covered * 100:>11.0f}%")
+
+
+if __name__ == "__main__":
+    main()
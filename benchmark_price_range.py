@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+期間集計の索引のベンチマーク
+施設数（既定 1万）× 2年分の日次の料金から RangeIndex を作り、いくつかの期間・施設の組で
+施設ごとの件数・平均・最小・最大を「条件に合う行を取り出して施設ごとにまとめる」方法と比べる。
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from price_range_index import RangeIndex
+from price_sketch import group_order
+
+FIRST_DAY = 20089  # 2025-01-01
+
+
+def make_observations(facilities, days, plans, seed=0):
+    """施設 × 日 × プランごとに1件（人数は2名）。施設ごとの基本料金に曜日と季節の変動を足す"""
+    rng = np.random.default_rng(seed)
+    facility = np.repeat(np.arange(facilities, dtype=np.int64), days * plans)
+    day = FIRST_DAY + np.tile(np.repeat(np.arange(days, dtype=np.int64), plans), facilities)
+    rows = len(facility)
+    base = rng.integers(5, 40, facilities) * 1000
+    season = 1 + 0.3 * np.sin((day - FIRST_DAY) / 365 * 2 * np.pi)
+    price = (base[facility] * season + np.where((day + 4) % 7 >= 5, 3000, 0)
+             + rng.normal(0, 1500, rows)).astype(np.int64) // 100 * 100
+    return np.full(rows, 2, dtype=np.int64), facility, day, np.maximum(price, 1000)
+
+
+def scan_stats(columns, start_day, end_day, facility_ids):
+    """条件に合う行を取り出して施設ごとの (施設番号, 件数, 合計, 最小, 最大) にまとめる"""
+    _, f, d, p = columns
+    keep = (d >= start_day) & (d <= end_day)
+    if facility_ids is not None:
+        keep &= np.isin(f, facility_ids)
+    f, p = f[keep], p[keep]
+    order, starts = group_order(f)
+    f, p = f[order], p[order]
+    heads = starts[:-1]
+    return (f[heads], np.diff(starts), np.add.reduceat(p, heads),
+            np.minimum.reduceat(p, heads), np.maximum.reduceat(p, heads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='期間集計の索引のベンチマーク')
+    parser.add_argument('--facilities', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--plans', type=int, default=1, help='施設・日ごとの観測数')
+    parser.add_argument('--repeat', type=int, default=3, help='条件ごとの計測回数（最小値を使う）')
+    args = parser.parse_args()
+
+    columns = make_observations(args.facilities, args.days, args.plans)
+    index = RangeIndex()
+    start = time.perf_counter()
+    index.add(*columns)
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(1)
+    some = sorted(rng.sample(range(args.facilities), 10))
+    many = sorted(rng.sample(range(args.facilities), args.facilities // 10))
+    last_day = FIRST_DAY + args.days - 1
+    week = (FIRST_DAY + 200, FIRST_DAY + 206)
+    quarter = (FIRST_DAY + 95, FIRST_DAY + 185)
+    cases = [
+        ('全施設 × 全期間', (FIRST_DAY, last_day, None)),
+        ('全施設 × 91日間', (*quarter, None)),
+        ('全施設 × 7日間', (*week, None)),
+        ('1/10の施設 × 91日間', (*quarter, many)),
+        ('10施設 × 91日間', (*quarter, some)),
+        ('10施設 × 全期間', (FIRST_DAY, last_day, some)),
+    ]
+
+    print(f"{len(columns[0]):,}件（{args.facilities:,}施設 × {args.days}日 × {args.plans}）  "
+          f"索引の作成: {build_time:.1f}秒  大きさ: {index.nbytes / 2**20:,.0f}MB")
+    print(f"{'条件':<22} {'施設':>7} {'件数':>11} {'走査(ms)':>10} {'索引(ms)':>10} {'一致':>5}")
+    print("-" * 72)
+    for label, (start_day, end_day, facility_ids) in cases:
+        scan_time = index_time = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            expected = scan_stats(columns, start_day, end_day, facility_ids)
+            scan_time = min(scan_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            result = index.query(start_day, end_day, facility_ids)
+            index_time = min(index_time, time.perf_counter() - start)
+        same = all(np.array_equal(a, b) for a, b in zip(expected, result))
+        print(f"{label:<22} {len(result[0]):>7,} {int(result[1].sum()):>11,} {scan_time * 1000:>10.1f} "
+              f"{index_time * 1000:>10.2f} {'○' if same else '×':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+分位点スケッチのベンチマーク
+料金の観測値（既定 1,000万件）から SketchIndex を作り、いくつかの絞り込み条件で
+中央値・p10・p90 を「条件に合う行を取り出して並べ替える」方法と比べる。
+誤差は順位の誤差（推定値の順位 / 件数 と 分位点 の差）で表す。
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from price_sketch import QUANTILES, SketchIndex
+
+FIRST_DAY = 20089  # 2025-01-01
+
+
+def make_observations(rows, facilities, days, seed=0):
+    """(人数, 施設番号, 日付, 料金)。施設ごとの基本料金に曜日と季節の変動を足す"""
+    rng = np.random.default_rng(seed)
+    facility = rng.integers(0, facilities, rows)
+    day = FIRST_DAY + rng.integers(0, days, rows)
+    guests = np.where(rng.random(rows) < 0.7, 2, 4)
+    base = rng.integers(5, 40, facilities) * 1000
+    season = 1 + 0.3 * np.sin((day - FIRST_DAY) / days * 2 * np.pi)
+    price = (base[facility] * season * (guests / 2) ** 0.5 + np.where(day % 7 >= 5, 3000, 0)
+             + rng.normal(0, 1500, rows)).astype(np.int64) // 100 * 100
+    return guests, facility, day, np.maximum(price, 1000)
+
+
+def exact_stats(columns, start_day, end_day, min_price, max_price, facility_ids, guests):
+    """条件に合う行を取り出して並べ替える"""
+    g, f, d, p = columns
+    keep = np.ones(len(p), dtype=bool)
+    if start_day is not None:
+        keep &= d >= start_day
+    if end_day is not None:
+        keep &= d <= end_day
+    if min_price is not None:
+        keep &= p >= min_price
+    if max_price is not None:
+        keep &= p <= max_price
+    if facility_ids is not None:
+        keep &= np.isin(f, facility_ids)
+    if guests is not None:
+        keep &= g == guests
+    return np.sort(p[keep])
+
+
+def rank_error(ordered, value, quantile):
+    """推定値の順位（同じ値の範囲）と分位点の差"""
+    n = len(ordered)
+    low = np.searchsorted(ordered, value, side='left') / n
+    high = np.searchsorted(ordered, value, side='right') / n
+    return 0.0 if low <= quantile <= high else min(abs(low - quantile), abs(high - quantile))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分位点スケッチのベンチマーク')
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--facilities', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=3, help='条件ごとの計測回数（最小値を使う）')
+    args = parser.parse_args()
+    random.seed(0)
+
+    columns = make_observations(args.rows, args.facilities, args.days)
+    index = SketchIndex()
+    start = time.perf_counter()
+    index.build(*columns)
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(1)
+    some = sorted(rng.sample(range(args.facilities), 10))
+    many = sorted(rng.sample(range(args.facilities), args.facilities // 4))
+    month = (FIRST_DAY + 90, FIRST_DAY + 119)
+    cases = [
+        ('全件', (None, None, None, None, None, None)),
+        ('人数=2', (None, None, None, None, None, 2)),
+        ('30日間', (*month, None, None, None, None)),
+        ('10施設', (None, None, None, None, some, None)),
+        ('10施設 × 30日間', (*month, None, None, some, None)),
+        ('1/4の施設 × 30日間', (*month, None, None, many, None)),
+        ('1/4の施設 × 半年', (FIRST_DAY + 30, FIRST_DAY + 211, None, None, many, None)),
+        ('料金 10,000〜20,000円', (None, None, 10000, 20000, None, None)),
+    ]
+
+    print(f"{args.rows:,}件（{args.facilities:,}施設 × {args.days}日）  スケッチ作成: {build_time:.1f}秒  "
+          f"葉の要素数: {len(index.item_values):,}  ノード: {len(index.node_keys):,}（{len(index.node_values):,}要素）")
+    print(f"{'条件':<22} {'件数':>11} {'並べ替え(ms)':>13} {'スケッチ(ms)':>13} {'順位の誤差(最大)':>16}")
+    print("-" * 82)
+    for label, filters in cases:
+        exact_time = sketch_time = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            ordered = exact_stats(columns, *filters)
+            exact_time = min(exact_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            stats = index.query(*filters)
+            sketch_time = min(sketch_time, time.perf_counter() - start)
+        error = max(rank_error(ordered, stats[name], quantile) for name, quantile in QUANTILES.items())
+        print(f"{label:<22} {len(ordered):>11,} {exact_time * 1000:>13.1f} {sketch_time * 1000:>13.1f} "
+              f"{error * 100:>15.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+セッションストアのベンチマーク
+既存セッション数を増やしながら、ログイン1回あたりのセッション作成時間を計測する
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from session_store import BACKENDS, open_session_store
+
+
+def make_session(user_id):
+    """hotel_secure_server と同じ形式のセッション"""
+    return {
+        'user_id': user_id,
+        'role': 'analyst',
+        'created_at': datetime.now().isoformat(),
+        'expires_at': (datetime.now() + timedelta(hours=24)).isoformat()
+    }
+
+
+def prepare_sessions_file(path, count):
+    """既存セッションを従来形式のJSONファイルとして用意"""
+    sessions = {str(uuid.uuid4()): make_session(f"user{i}") for i in range(count)}
+    with open(path, 'w') as f:
+        json.dump(sessions, f)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def run_benchmark(backend, existing, logins, work_dir):
+    path = os.path.join(work_dir, f"{backend}_{existing}.json")
+    prepare_sessions_file(path, existing)
+
+    store = open_session_store(path, backend)
+    latencies = []
+    for i in range(logins):
+        start = time.perf_counter()
+        store[str(uuid.uuid4())] = make_session(f"login{i}")
+        latencies.append(time.perf_counter() - start)
+    store.close()
+
+    return {
+        'backend': backend,
+        'existing_sessions': existing,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='セッションストアのベンチマーク')
+    parser.add_argument('--sizes', default='100,1000,10000,50000', help='既存セッション数（カンマ区切り）')
+    parser.add_argument('--logins', type=int, default=200, help='計測するログイン回数')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='計測するバックエンド')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    backends = args.backends.split(',')
+
+    work_dir = tempfile.mkdtemp(prefix='session_bench_')
+    try:
+        print(f"{'バックエンド':<10} {'既存セッション':>14} {'平均(ms)':>10} {'p95(ms)':>10}")
+        print("-" * 48)
+        for backend in backends:
+            for size in sizes:
+                result = run_benchmark(backend, size, args.logins, work_dir)
+                print(f"{result['backend']:<10} {result['existing_sessions']:>14,} "
+                      f"{result['mean_ms']:>10.3f} {result['p95_ms']:>10.3f}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク一式（取り込み・分析・配信）
+生成したデータを 1倍・10倍・100倍 の規模で実際のコードに通し、処理量と所要時間の分位点を
+JSON に書き出す。前回の JSON を --compare に渡すと、ケースごとの変化を表示する。
+
+    csv         TourismCSVHandler.import_csv_data（宿泊施設統計の CSV。1倍 = 1,000行）
+    analysis    SimpleTourismAnalyzer / OkinawaTourismAnalyzer のレポート作成（1倍 = 元のデータ）
+    secure      hotel_secure_server のログイン・認証チェック・静的ファイル
+    integrated  integrated_server のログイン・認証チェック・静的ファイル
+
+サーバーは一時ディレクトリ（画面のファイルだけをコピー）で同じプロセス内に HTTP で起動し、
+--concurrency 本の持続的接続からリクエストを送る（1倍のリクエスト数は HTTP_BASE_REQUESTS）。
+依存ライブラリ（pandas など）がないケースは skipped に理由を書いて飛ばす。
+
+使い方:
+    python3 benchmark_suite.py --scales 1 10 --output bench.json
+    python3 benchmark_suite.py --compare bench.json
+"""
+
+import argparse
+import contextlib
+import csv
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+GROUPS = ('csv', 'analysis', 'secure', 'integrated')
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_REPEAT = 5
+DEFAULT_CONCURRENCY = 8
+DEFAULT_OUTPUT = 'benchmark_results.json'
+# 1倍のときの規模
+CSV_BASE_ROWS = 1000
+HTTP_BASE_REQUESTS = {'login': 5, 'auth_check': 200, 'static': 100}
+# この割合より遅く（少なく）なったら --compare で印を付ける
+REGRESSION_THRESHOLD = 0.2
+
+# サーバーの作業ディレクトリにコピーするファイル（セッション・料金データなどはコピーしない）
+SERVER_FILES = [
+    "hotel_auth_config.json",
+    "login.html", "login_app.js", "login_style.css",
+    "hotel_price_analysis.html", "hotel_price_app.js", "hotel_price_style.css",
+    "hotel_price_analysis_v2.html", "hotel_price_app_v2.js", "hotel_price_style_v2.css",
+    "index.html", "app.js", "style.css",
+    "tourism_web.html", "tourism_app.js", "tourism_style.css", "tourism_data_for_web.json"
+]
+SECURE_STATIC = ['/hotel_price_analysis.html', '/hotel_price_style.css', '/hotel_price_app.js']
+INTEGRATED_STATIC = ['/index.html', '/app.js', '/style.css', '/tourism_web.html']
+SECURE_ACCOUNT = ('hotel_viewer', 'View@2024')
+INTEGRATED_ACCOUNT = ('demo', 'demo123')
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(case, scale, size, unit, latencies, elapsed, errors=0):
+    """1ケース分の結果（処理量は1秒あたりの unit の数）"""
+    processed = size * len(latencies) if unit != 'requests' else len(latencies)
+    return {
+        'case': case,
+        'scale': scale,
+        'size': size,
+        'unit': unit,
+        'runs': len(latencies),
+        'errors': errors,
+        'elapsed_sec': round(elapsed, 4),
+        'throughput_per_sec': round(processed / elapsed, 2) if elapsed > 0 else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p90': round(percentile(latencies, 90) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(max(latencies) * 1000, 3),
+        }
+    }
+
+
+def repeat_calls(function, repeat):
+    """function を repeat 回呼んだ所要時間の一覧と合計"""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - started
+
+
+# ---- CSV 取り込み ----
+
+def write_accommodation_csv(path, rows, seed):
+    """tourism_csv_handler の宿泊施設統計と同じ列の CSV"""
+    rng = random.Random(seed)
+    facility_types = ['リゾートホテル', 'シティホテル', 'ビジネスホテル', '民宿・ペンション', '簡易宿所']
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['年月', '施設タイプ', '客室数', '稼働率(%)', '平均宿泊料金(円)', '延べ宿泊者数'])
+        for i in range(rows):
+            month = i // len(facility_types)
+            writer.writerow([f"{2000 + month // 12}/{month % 12 + 1:02d}", facility_types[i % len(facility_types)],
+                             rng.randint(1000, 12000), round(rng.uniform(50, 95), 1),
+                             rng.randint(3000, 20000), rng.randint(10000, 500000)])
+
+
+def bench_csv(scales, repeat, results, skipped):
+    from tourism_csv_handler import TourismCSVHandler
+
+    handler = TourismCSVHandler()
+    for scale in scales:
+        rows = CSV_BASE_ROWS * scale
+        path = os.path.join(handler.data_dir, f"accommodation_x{scale}.csv")
+        write_accommodation_csv(path, rows, seed=scale)
+        outcome = {}
+
+        def run():
+            outcome['result'] = handler.import_csv_data(path, 'accommodation')
+
+        latencies, elapsed = repeat_calls(run, repeat)
+        if not outcome['result']['success'] or outcome['result']['count'] != rows:
+            raise RuntimeError(f"CSV の取り込みに失敗しました: {outcome['result'].get('error')}")
+        results.append(summarize('csv_import', scale, rows, 'rows', latencies, elapsed))
+
+
+# ---- 観光統計の分析 ----
+
+def scaled_tourism_data(scale, seed=0):
+    """okinawa_tourism_data と同じ形のデータを scale 倍の件数にする（年次は過去へ、月次は年を足す）"""
+    from okinawa_tourism_data import tourism_data
+
+    rng = random.Random(seed)
+    yearly = list(tourism_data['yearly'])
+    first = yearly[0]
+    extra_years = len(yearly) * (scale - 1)
+    past = []
+    for k in range(extra_years, 0, -1):
+        # 過去ほど少なく（最も古い年で最初の年の半分）
+        factor = (1 - 0.5 * k / extra_years) * rng.uniform(0.95, 1.05)
+        domestic, foreign = int(first['domestic'] * factor), int(first['foreign'] * factor)
+        past.append({'year': first['year'] - k, 'total': domestic + foreign, 'domestic': domestic, 'foreign': foreign})
+
+    monthly = []
+    for _ in range(scale):
+        for month in tourism_data['monthly_2023']:
+            factor = rng.uniform(0.9, 1.1)
+            domestic, foreign = int(month['domestic'] * factor), int(month['foreign'] * factor)
+            monthly.append({'month': month['month'], 'total': domestic + foreign,
+                            'domestic': domestic, 'foreign': foreign})
+
+    return dict(tourism_data, yearly=past + yearly, monthly_2023=monthly,
+                by_country_2023=tourism_data['by_country_2023'] * scale,
+                by_purpose_2023=tourism_data['by_purpose_2023'] * scale)
+
+
+def bench_analysis(scales, repeat, results, skipped):
+    import okinawa_tourism_data
+    from simple_tourism_analyzer import SimpleTourismAnalyzer
+
+    try:
+        from tourism_analyzer import OkinawaTourismAnalyzer
+    except ImportError as e:
+        OkinawaTourismAnalyzer = None
+        skipped.append({'case': 'pandas_analyzer_report', 'reason': str(e)})
+
+    for scale in scales:
+        data = scaled_tourism_data(scale)
+        size = len(data['yearly']) + len(data['monthly_2023'])
+
+        def simple_report():
+            analyzer = SimpleTourismAnalyzer()
+            analyzer.data = data
+            analyzer.generate_report()
+
+        latencies, elapsed = repeat_calls(simple_report, repeat)
+        results.append(summarize('simple_analyzer_report', scale, size, 'records', latencies, elapsed))
+
+        if OkinawaTourismAnalyzer is None:
+            continue
+
+        def pandas_report():
+            # OkinawaTourismAnalyzer は作成時に okinawa_tourism_data から DataFrame を作る
+            original = okinawa_tourism_data.tourism_data
+            okinawa_tourism_data.tourism_data = data
+            try:
+                analyzer = OkinawaTourismAnalyzer()
+            finally:
+                okinawa_tourism_data.tourism_data = original
+            analyzer.generate_report()
+
+        latencies, elapsed = repeat_calls(pandas_report, repeat)
+        results.append(summarize('pandas_analyzer_report', scale, size, 'records', latencies, elapsed))
+
+
+# ---- サーバー ----
+
+def login_request(path, username, password):
+    body = urllib.parse.urlencode({'username': username, 'password': password})
+
+    def request(conn, i):
+        conn.request('POST', path, body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    return request
+
+
+def get_request(paths, cookie):
+    def request(conn, i):
+        conn.request('GET', paths[i % len(paths)], headers={'Cookie': cookie, 'Accept-Encoding': 'gzip'})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    return request
+
+
+def login_cookie(port, path, username, password):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('POST', path, body=urllib.parse.urlencode({'username': username, 'password': password}),
+                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"ログインに失敗しました（HTTP {response.status}）")
+    return response.getheader('Set-Cookie').split(';')[0]
+
+
+def http_load(port, requests, concurrency, request):
+    """concurrency 本の持続的接続から合計 requests 回送り、(所要時間の一覧, 全体の時間, エラー数)"""
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, failed = [], 0
+        while True:
+            i = next(counter)
+            if i >= requests:
+                break
+            start = time.perf_counter()
+            try:
+                ok = request(conn, i) < 400
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                ok = False
+            local.append(time.perf_counter() - start)
+            failed += not ok
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, requests))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors[0]
+
+
+def bench_server(name, port, login_path, check_path, account, static_paths, scales, concurrency, results):
+    cookie = login_cookie(port, login_path, *account)
+    cases = [
+        ('login', login_request(login_path, *account)),
+        ('auth_check', get_request([check_path], cookie)),
+        ('static', get_request(static_paths, cookie)),
+    ]
+    for scale in scales:
+        for case, request in cases:
+            requests = HTTP_BASE_REQUESTS[case] * scale
+            latencies, elapsed, errors = http_load(port, requests, concurrency, request)
+            results.append(summarize(f"{name}_{case}", scale, requests, 'requests', latencies, elapsed, errors))
+
+
+def start_server(handler, workers):
+    from pooled_server import create_server
+
+    httpd = create_server(('127.0.0.1', 0), handler, workers=workers)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def bench_secure(scales, concurrency, results, skipped):
+    import hotel_secure_server
+    from content_encoding import available_encodings
+
+    server = hotel_secure_server.SecureHotelServer()
+    handler_class = hotel_secure_server.SecureHTTPHandler
+    handler_class.asset_cache.preload(hotel_secure_server.PRELOAD_ASSETS, available_encodings())
+    httpd = start_server(lambda *args, **kwargs: handler_class(*args, server_instance=server, **kwargs),
+                         concurrency)
+    try:
+        bench_server('secure', httpd.server_address[1], '/api/auth/login', '/api/auth/check',
+                     SECURE_ACCOUNT, SECURE_STATIC, scales, concurrency, results)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def bench_integrated(scales, concurrency, results, skipped):
+    import integrated_server
+    from content_encoding import available_encodings
+
+    integrated_server.UserManager.shared()
+    handler_class = integrated_server.IntegratedHTTPHandler
+    handler_class.asset_cache.preload(integrated_server.PRELOAD_ASSETS, available_encodings())
+    httpd = start_server(handler_class, concurrency)
+    try:
+        bench_server('integrated', httpd.server_address[1], '/api/auth/login', '/api/auth/check',
+                     INTEGRATED_ACCOUNT, INTEGRATED_STATIC, scales, concurrency, results)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+# ---- 結果 ----
+
+def print_result(result):
+    latency = result['latency_ms']
+    print(f"{result['case']:<26} {result['scale']:>5}x {result['size']:>9,} {result['unit']:<8} "
+          f"{result['throughput_per_sec']:>12,.1f}/s {latency['p50']:>9.2f} {latency['p90']:>9.2f} "
+          f"{latency['p99']:>9.2f} {result['errors']:>6}")
+
+
+def compare(previous, current, threshold=REGRESSION_THRESHOLD):
+    """前回の結果と比べた p50 と処理量の変化を表示（悪化したケースに印を付ける）"""
+    before = {(result['case'], result['scale']): result for result in previous['results']}
+    print(f"\n前回（{previous.get('started_at', '?')}）との比較")
+    print(f"{'ケース':<26} {'規模':>6} {'p50 前回':>10} {'p50 今回':>10} {'処理量の変化':>12}")
+    print("-" * 72)
+    for result in current['results']:
+        old = before.get((result['case'], result['scale']))
+        if old is None:
+            continue
+        ratio = result['throughput_per_sec'] / old['throughput_per_sec'] - 1
+        mark = ' ⚠' if ratio < -threshold or result['latency_ms']['p50'] > old['latency_ms']['p50'] * (1 + threshold) else ''
+        print(f"{result['case']:<26} {result['scale']:>5}x {old['latency_ms']['p50']:>10.2f} "
+              f"{result['latency_ms']['p50']:>10.2f} {ratio:>+11.1%}{mark}")
+
+
+def copy_server_files(source, target):
+    for name in SERVER_FILES:
+        path = os.path.join(source, name)
+        if os.path.exists(path):
+            shutil.copy(path, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='取り込み・分析・配信のベンチマーク一式')
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES), help='データ規模の倍率')
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=list(GROUPS), help='計測する対象')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='CSV・分析の規模ごとの実行回数')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='HTTP の同時接続数')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='結果の JSON')
+    parser.add_argument('--compare', help='比べる前回の結果の JSON')
+    parser.add_argument('--server-logs', action='store_true', help='サーバーのアクセスログを表示する')
+    args = parser.parse_args()
+
+    source = os.path.dirname(os.path.abspath(__file__))
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scales': args.scales,
+        'concurrency': args.concurrency,
+        'repeat': args.repeat,
+        'results': [],
+        'skipped': [],
+    }
+    results, skipped = report['results'], report['skipped']
+
+    # サーバーの設定・セッション・CSV は一時ディレクトリに作る
+    work_dir = tempfile.mkdtemp(prefix='hotel-benchmark-')
+    copy_server_files(source, work_dir)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    print(f"{'ケース':<26} {'規模':>6} {'件数':>9} {'単位':<8} {'処理量':>14} {'p50(ms)':>9} {'p90(ms)':>9} "
+          f"{'p99(ms)':>9} {'エラー':>6}")
+    print("-" * 110)
+    try:
+        for group in args.groups:
+            first = len(results)
+            if group == 'csv':
+                bench_csv(args.scales, args.repeat, results, skipped)
+            elif group == 'analysis':
+                bench_analysis(args.scales, args.repeat, results, skipped)
+            else:
+                # アクセスログは書き出す処理ごと計測に含め、表示だけ捨てる
+                with open(os.devnull, 'w') as devnull, \
+                        contextlib.redirect_stderr(sys.stderr if args.server_logs else devnull):
+                    if group == 'secure':
+                        bench_secure(args.scales, args.concurrency, results, skipped)
+                    else:
+                        bench_integrated(args.scales, args.concurrency, results, skipped)
+            for result in results[first:]:
+                print_result(result)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for item in skipped:
+        print(f"スキップ: {item['case']}（{item['reason']}）")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を {output} に保存しました")
+    if previous is not None:
+        compare(previous, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+圧縮転送（Content-Encoding）
+Accept-Encoding から gzip / brotli を選び、静的ファイルは圧縮済みの版をキャッシュに、
+JSON応答は一定サイズ以上のときだけその場で圧縮して返す
+"""
+
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 圧縮する Content-Type
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml')
+# これより小さい応答は圧縮しない（バイト）
+MIN_COMPRESS_BYTES = 1024
+# 動的なJSON応答を圧縮する閾値（バイト）
+JSON_COMPRESS_THRESHOLD = 4096
+
+
+def available_encodings():
+    """サーバーが対応する圧縮方式（優先順）"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encoding, available=None):
+    """Accept-Encoding から使う圧縮方式を選ぶ（圧縮しない場合は None）"""
+    if not accept_encoding:
+        return None
+    available = available or available_encodings()
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = qualities.get(encoding, qualities.get('*', 0.0))
+        # 同じ q ならサーバー側の優先順（br > gzip）
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding, fast=False):
+    """本文を圧縮（fast=True はその場で圧縮するJSON用の軽い設定）"""
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6 if fast else 9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=4 if fast else 11)
+    raise ValueError(f"未対応の圧縮方式: {encoding}")
+
+
+class JSONResponseMixin:
+    """JSON応答を Content-Length 付きで送り、大きければ圧縮するミックスイン"""
+
+    json_compress_threshold = JSON_COMPRESS_THRESHOLD
+
+    def send_json(self, status, response, headers=()):
+        body = json.dumps(response).encode()
+
+        encoding = None
+        compressible = len(body) >= self.json_compress_threshold
+        if compressible:
+            encoding = negotiate(self.headers.get('Accept-Encoding'))
+        if encoding:
+            body = compress(body, encoding, fast=True)
+
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-type', 'application/json')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_common_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_common_headers(self):
+        """応答に追加するヘッダー（サブクラスで上書き）"""
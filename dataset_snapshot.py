@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+データセットのスナップショット
+取り込み済みの料金データや観光統計を、列ごとの固定長バイナリファイルと小さな
+JSONマニフェストで保存する。読み込みは numpy.memmap で必要な列だけを開くので、
+サーバーの再起動はファイルを開くだけで済み、複数のサーバープロセスが
+OSのページキャッシュを共有できる。
+
+ディレクトリ構成:
+    <base>/CURRENT                 現在の世代名
+    <base>/<世代>/manifest.json    行数・列の dtype / 要素数・付加情報
+    <base>/<世代>/<列>.bin         列データ（リトルエンディアン）
+    <base>/<世代>/dictionaries.json 辞書（文字列の列の番号 -> 文字列）
+
+書き込みは新しい世代のディレクトリを作ってから CURRENT を差し替えるので、
+古い世代を開いているプロセスはそのまま読み続けられる。
+
+追加分だけの書き込み（SnapshotWriter.link / extend）では、前の世代の列ファイルを
+ハードリンクで共有し、前の世代の長さより後ろに追記する。前の世代を開いている
+プロセスはマニフェストの長さまでしか mmap しないので追記は見えない。
+辞書への追加分はマニフェストの dictionary_extensions に入れる。
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+DICTIONARIES_FILE = 'dictionaries.json'
+CURRENT_FILE = 'CURRENT'
+# 残しておく世代数（古い世代を開いたままのプロセスのため）
+KEEP_GENERATIONS = 2
+# これより古い書き込み途中のディレクトリは落ちたプロセスの残骸とみなす（秒）
+STALE_TMP_SECONDS = 3600
+# snapshot_tourism() で表以外の値を入れるスナップショット名
+EXTRAS_TABLE = 'extras'
+
+
+def write_snapshot(base, columns, dictionaries=None, meta=None):
+    """列（名前 -> 1次元の numpy 配列）を新しい世代として書き込み、世代名を返す"""
+    writer = SnapshotWriter(base)
+    writer.append(columns)
+    return writer.close(dictionaries, meta)
+
+
+class SnapshotWriter:
+    """列を少しずつ書き足して新しい世代を作る（close() で CURRENT を差し替える）
+
+    全体をメモリに載せられない大きなデータ（サンプルデータの生成など）用。
+    途中で例外が起きたら書き込み途中のディレクトリを消す。
+    """
+
+    def __init__(self, base):
+        os.makedirs(base, exist_ok=True)
+        self.base = base
+        self.generation = f"gen-{time.time_ns()}-{os.getpid()}"
+        self.tmp_dir = os.path.join(base, f".tmp-{self.generation}")
+        os.makedirs(self.tmp_dir)
+        self.files = {}
+        self.layout = {}
+        # 前の世代の辞書ファイルを使うときの追加分（名前 -> 文字列のリスト）
+        self.dictionary_extensions = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+    def append(self, columns):
+        """列ごとの配列を書き足す（同じ列の dtype は最初に書いたものにそろえる）"""
+        for name, values in columns.items():
+            values = np.ascontiguousarray(values)
+            if values.ndim != 1:
+                raise ValueError(f"列は1次元の配列にしてください: {name}")
+            info = self.layout.get(name)
+            if info is None:
+                dtype = values.dtype.newbyteorder('<') if values.dtype.byteorder == '>' else values.dtype
+                info = self.layout[name] = {'file': f"{name}.bin", 'dtype': dtype.str, 'length': 0}
+                self.files[name] = open(os.path.join(self.tmp_dir, info['file']), 'wb')
+            self.files[name].write(values.astype(info['dtype'], copy=False).tobytes())
+            info['length'] += len(values)
+
+    def written(self, name):
+        """書き込み済みの列の読み取り専用ビュー（書き足した分を読み直して索引を作るとき用）"""
+        info = self.layout[name]
+        self.files[name].flush()
+        if info['length'] == 0:
+            return np.empty(0, dtype=info['dtype'])
+        return np.memmap(os.path.join(self.tmp_dir, info['file']), dtype=info['dtype'], mode='r',
+                         shape=(info['length'],))
+
+    def link(self, snapshot, names):
+        """前の世代の列をそのまま使う（ハードリンク。できなければコピー）"""
+        for name in names:
+            info = snapshot.manifest['columns'][name]
+            link_or_copy(os.path.join(snapshot.path, info['file']), os.path.join(self.tmp_dir, info['file']))
+            self.layout[name] = dict(info)
+
+    def extend(self, snapshot, name, values, keep=None):
+        """前の世代の列の先頭 keep 要素（省略時は全部）に values を書き足す
+
+        全部を残すときはファイルをハードリンクで共有して追記する。ファイルが前の世代の
+        長さより長い（書き込み途中で落ちた残骸など）ときや、途中で切るときはコピーする。
+        """
+        info = snapshot.manifest['columns'][name]
+        itemsize = np.dtype(info['dtype']).itemsize
+        keep = info['length'] if keep is None else keep
+        source = os.path.join(snapshot.path, info['file'])
+        target = os.path.join(self.tmp_dir, info['file'])
+        if keep == info['length'] and os.path.getsize(source) == keep * itemsize:
+            link_or_copy(source, target)
+        else:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                dst.write(src.read(keep * itemsize))
+        self.files[name] = open(target, 'ab')
+        self.layout[name] = {'file': info['file'], 'dtype': info['dtype'], 'length': keep}
+        self.append({name: values})
+
+    def extend_dictionaries(self, snapshot, additions):
+        """前の世代の辞書に文字列を書き足す（辞書ファイルは共有し、追加分だけを持つ）"""
+        link_or_copy(os.path.join(snapshot.path, DICTIONARIES_FILE), os.path.join(self.tmp_dir, DICTIONARIES_FILE))
+        extensions = snapshot.manifest.get('dictionary_extensions', {})
+        self.dictionary_extensions = {name: extensions.get(name, []) + list(additions.get(name, []))
+                                      for name in set(extensions) | set(additions)}
+
+    def close(self, dictionaries=None, meta=None):
+        """マニフェストと辞書を書いて世代を切り替え、世代名を返す"""
+        for f in self.files.values():
+            f.close()
+        if self.dictionary_extensions is None:
+            with open(os.path.join(self.tmp_dir, DICTIONARIES_FILE), 'w', encoding='utf-8') as f:
+                json.dump(dictionaries or {}, f, ensure_ascii=False)
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'columns': self.layout,
+            'meta': meta or {}
+        }
+        if self.dictionary_extensions:
+            manifest['dictionary_extensions'] = self.dictionary_extensions
+        with open(os.path.join(self.tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        os.rename(self.tmp_dir, os.path.join(self.base, self.generation))
+        current_tmp = os.path.join(self.base, f"{CURRENT_FILE}.tmp")
+        with open(current_tmp, 'w') as f:
+            f.write(self.generation)
+        os.replace(current_tmp, os.path.join(self.base, CURRENT_FILE))
+        remove_old_generations(self.base, self.generation)
+        return self.generation
+
+    def abort(self):
+        """書き込み途中の世代を捨てる"""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def remove_old_generations(base, current):
+    """古い世代を削除（開いているプロセスのマッピングは削除後も有効）"""
+    generations = sorted((name for name in os.listdir(base) if name.startswith('gen-') and name != current),
+                         key=lambda name: int(name.split('-')[1]))
+    for name in generations[:max(0, len(generations) - (KEEP_GENERATIONS - 1))]:
+        shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        if name.startswith('.tmp-') and time.time() - os.path.getmtime(path) > STALE_TMP_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def open_snapshot(base):
+    """現在の世代を開く（なければ None）"""
+    generation = current_generation(base)
+    if generation is None:
+        return None
+    return Snapshot(os.path.join(base, generation))
+
+
+def current_generation(base):
+    """現在の世代名（なければ None）"""
+    try:
+        with open(os.path.join(base, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class Snapshot:
+    """1世代分のスナップショット。列と辞書は初めて使うときに開く"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"未対応のスナップショット形式: {self.manifest.get('format')}")
+        self.meta = self.manifest['meta']
+        self.arrays = {}
+        self.dictionaries = None
+
+    @property
+    def generation(self):
+        return os.path.basename(self.path)
+
+    @property
+    def names(self):
+        return list(self.manifest['columns'])
+
+    def __contains__(self, name):
+        return name in self.manifest['columns']
+
+    def column(self, name):
+        """列の読み取り専用ビュー（コピーしない）"""
+        values = self.arrays.get(name)
+        if values is None:
+            info = self.manifest['columns'][name]
+            dtype = np.dtype(info['dtype'])
+            if info['length'] == 0:
+                # 空のファイルは mmap できない
+                values = np.empty(0, dtype=dtype)
+            else:
+                values = np.memmap(os.path.join(self.path, info['file']), dtype=dtype, mode='r',
+                                   shape=(info['length'],))
+            self.arrays[name] = values
+        return values
+
+    def dictionary(self, name):
+        """文字列の列の辞書（追加分を含む）"""
+        if self.dictionaries is None:
+            with open(os.path.join(self.path, DICTIONARIES_FILE), encoding='utf-8') as f:
+                dictionaries = json.load(f)
+            for key, values in self.manifest.get('dictionary_extensions', {}).items():
+                dictionaries[key] = dictionaries.get(key, []) + values
+            self.dictionaries = dictionaries
+        return self.dictionaries.get(name, [])
+
+    @property
+    def rows(self):
+        """行数（write_table() で保存した表用。列がなければ 0）"""
+        columns = self.manifest['columns']
+        return next(iter(columns.values()))['length'] if columns else 0
+
+    @property
+    def fields(self):
+        """write_table() で保存した表の列名（元の並び順）"""
+        return self.meta.get('fields', self.names)
+
+    def values(self, name):
+        """列の値のリスト（応答を作るとき用。文字列の列は辞書で戻す）"""
+        values = self.column(name).tolist()
+        if name in self.meta.get('string_fields', []):
+            dictionary = self.dictionary(name)
+            values = [dictionary[code] for code in values]
+        return values
+
+
+def write_table(base, records, meta=None):
+    """辞書のリスト（観光統計の表など）を列に分けてスナップショットにする
+
+    整数は <i8、小数は <f8、それ以外は文字列にして辞書の番号（<i4）で持つ。
+    """
+    fields = list(records[0]) if records else []
+    columns, dictionaries, string_fields = {}, {}, []
+    for name in fields:
+        values = [record.get(name) for record in records]
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            columns[name] = np.array(values, dtype='<i8')
+        elif all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            columns[name] = np.array(values, dtype='<f8')
+        else:
+            dictionary, codes = np.unique(np.array([str(value) for value in values]), return_inverse=True)
+            columns[name] = codes.astype('<i4')
+            dictionaries[name] = dictionary.tolist()
+            string_fields.append(name)
+    return write_snapshot(base, columns, dictionaries,
+                          dict(meta or {}, fields=fields, string_fields=string_fields))
+
+
+def snapshot_tourism(json_path, base):
+    """tourism_data_for_web.json の表（年別・月別・国別）を表ごとのスナップショットにする"""
+    with open(json_path, encoding='utf-8') as f:
+        data = json.load(f)
+    extras = {}
+    for name, value in data.items():
+        if isinstance(value, list) and value and all(isinstance(record, dict) for record in value):
+            write_table(os.path.join(base, name), value)
+        else:
+            extras[name] = value
+    # 表以外（分析結果など）は extras のマニフェストの付加情報に入れる
+    write_snapshot(os.path.join(base, EXTRAS_TABLE), {}, meta=extras)
+
+
+def open_tourism(base):
+    """snapshot_tourism() で保存した表を開く（表名 -> Snapshot。なければ空の辞書）
+
+    列は問い合わせで使われたときに初めて mmap する。表以外の値は extras の meta にある。
+    """
+    if not os.path.isdir(base):
+        return {}
+    tables = {}
+    for name in sorted(os.listdir(base)):
+        snapshot = open_snapshot(os.path.join(base, name))
+        if snapshot is not None:
+            tables[name] = snapshot
+    return tables
+
+
+if __name__ == "__main__":
+    # 観光統計のスナップショット作成: python3 dataset_snapshot.py tourism_data_for_web.json tourism.snapshot
+    source = sys.argv[1] if len(sys.argv) > 1 else 'tourism_data_for_web.json'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'tourism.snapshot'
+    snapshot_tourism(source, target)
+    print(f"スナップショットを作成しました: {target}")
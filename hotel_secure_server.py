@@ -2,14 +2,34 @@
 import http.server
 import socketserver
 import json
-import hashlib
 import uuid
 import os
+import time
 import urllib.parse
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from http.cookies import SimpleCookie
 import ssl
 import argparse
+import threading
+from pooled_server import create_server, KeepAliveMixin, DEFAULT_WORKERS
+from session_store import open_session_store, SessionSweeper, BACKENDS, DEFAULT_BACKEND
+from json_file_cache import JSONFileCache
+from user_directory import UserDirectory
+from static_cache import CachedStaticMixin
+from metrics import REGISTRY, MetricsMixin
+from request_profiler import ProfilingMixin
+from content_encoding import JSONResponseMixin, available_encodings
+from password_hashing import PasswordHasher, HashingBusy, DEFAULT_WORKERS as DEFAULT_HASH_WORKERS
+from dataset_snapshot import open_tourism, EXTRAS_TABLE
+from price_store import PriceStore, MAX_QUERY_ROWS, parse_date
+from price_pivot import PivotCache, build_matrix, AGGREGATES
+from price_table import table_page, InvalidCursor, DEFAULT_PAGE_SIZE
+from price_ingest import ingest_csv, IngestError
+from price_sketch import SketchIndex
+from price_rollup import PriceRollup, month_of
+from price_range_index import RangeIndex
+from japanese_holidays import HolidayCalendar
+from price_forecast import forecast_matrix, DEFAULT_HORIZON, DEFAULT_INTERVAL, DEFAULT_WINDOW, DEFAULT_ALPHA
 
 # 設定
 PORT = 8443  # HTTPS用ポート
@@ -18,34 +38,105 @@ CERT_FILE = "server.crt"
 KEY_FILE = "server.key"
 CONFIG_FILE = "hotel_auth_config.json"
 SESSIONS_FILE = "hotel_sessions.json"
+PRICES_SNAPSHOT = "hotel_prices.snapshot"
+PRICES_FILE = "hotel_prices.json"  # 以前の保存形式（起動時にスナップショットへ移行）
+TOURISM_SNAPSHOT = "tourism.snapshot"  # python3 dataset_snapshot.py で作る観光統計
+CONFIG_CHECK_INTERVAL = 1.0  # 設定ファイルの変更を確認する間隔（秒）
+TLS_TICKETS = 2  # TLS 1.3 で1回のハンドシェイクごとに発行するセッションチケット数
+# 起動時にキャッシュへ読み込んで圧縮しておくファイル
+PRELOAD_ASSETS = [
+    "hotel_price_analysis.html", "hotel_price_app.js", "hotel_price_style.css",
+    "hotel_price_analysis_v2.html", "hotel_price_app_v2.js", "hotel_price_style_v2.css",
+    "tourism_data_for_web.json"
+]
 
 class SecureHotelServer:
-    def __init__(self):
-        self.config = self.load_config()
+    def __init__(self, session_backend=DEFAULT_BACKEND, hash_workers=DEFAULT_HASH_WORKERS):
+        # ワーカースレッド間で sessions を共有するためのロック（設定はユーザー索引ごと入れ替える）
+        self.lock = threading.RLock()
+        self.session_backend = session_backend
+        self.hasher = PasswordHasher(workers=hash_workers)
+        self.config_cache = self.load_config()
         self.sessions = self.load_sessions()
+        self.prices = self.load_prices()
+        self.saved_prices_version = self.prices.version
+        # 観光統計（表ごとのスナップショット。列は問い合わせで使うときに mmap する）
+        self.tourism = open_tourism(TOURISM_SNAPSHOT)
+        self.pivot_cache = PivotCache()
+        # 料金の分位点（中央値など）用のスケッチ。追加された行は問い合わせ時に取り込む
+        self.price_sketches = SketchIndex()
+        # 曜日・祝日別の集計表（取り込みのたびに追加分を足す）
+        self.holidays = HolidayCalendar()
+        self.price_rollups = PriceRollup(self.holidays)
+        # 施設ごとの期間集計（日付の累積和とスパーステーブル。取り込みのたびに追加分を足す）
+        self.price_ranges = RangeIndex()
+        # 集計表・期間集計は起動を待たせないようバックグラウンドで作る（先に問い合わせが来たらその場で取り込む）
+        self.price_index_lock = threading.Lock()
+        self.refresh_price_indexes()
         self.setup_default_users()
+        # /metrics で出す値（記録は MetricsMixin とセッションストアが行う）
+        REGISTRY.gauge('sessions_active', 'セッション数（期限切れで未削除のものを含む）', lambda: len(self.sessions))
+        REGISTRY.register_cache('static', CachedStaticMixin.asset_cache)
+        REGISTRY.register_cache('pivot', self.pivot_cache)
     
     def load_config(self):
-        """設定ファイルの読み込み"""
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return None
+        """設定ファイルの読み込み（変更されたらユーザー索引ごと作り直す）"""
+        return JSONFileCache(CONFIG_FILE, build=UserDirectory.from_config,
+                             check_interval=CONFIG_CHECK_INTERVAL, ensure_ascii=False, indent=2)
+    
+    @property
+    def config(self):
+        """設定ファイルの内容"""
+        self.config_cache.refresh()
+        return self.config_cache.data
+    
+    @property
+    def directory(self):
+        """ユーザー索引"""
+        return self.config_cache.get()
     
     def load_sessions(self):
         """セッション情報の読み込み"""
-        if os.path.exists(SESSIONS_FILE):
-            try:
-                with open(SESSIONS_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return open_session_store(SESSIONS_FILE, self.session_backend)
     
     def save_sessions(self):
-        """セッション情報の保存"""
-        with open(SESSIONS_FILE, 'w') as f:
-            json.dump(self.sessions, f)
+        """セッション情報の保存（変更はストアが逐次書き込むので未反映分のみ）"""
+        self.sessions.flush()
+    
+    def load_prices(self):
+        """料金データの読み込み（スナップショットを mmap するだけなので再起動がすぐ終わる）"""
+        prices = PriceStore.load(PRICES_SNAPSHOT)
+        if not len(prices) and os.path.exists(PRICES_FILE):
+            prices = PriceStore.load_json(PRICES_FILE)
+            prices.save(PRICES_SNAPSHOT)
+            os.replace(PRICES_FILE, f"{PRICES_FILE}.migrated")
+        return prices
+    
+    def save_prices(self):
+        """料金データの保存（取り込み済みの行だけだった場合は書き込まない）"""
+        version = self.prices.version
+        if version == self.saved_prices_version:
+            return
+        self.prices.save(PRICES_SNAPSHOT)
+        self.saved_prices_version = version
+        self.refresh_price_indexes()
+    
+    def refresh_price_indexes(self):
+        """集計表・期間集計への追加分の取り込みをバックグラウンドで始める
+
+        取り込み中なら何もしない（その後に追加された行は次の問い合わせか取り込みで足す）
+        """
+        if not self.price_index_lock.acquire(blocking=False):
+            return
+        
+        def refresh():
+            try:
+                self.price_rollups.refresh(self.prices)
+                self.price_ranges.refresh(self.prices)
+            finally:
+                self.price_index_lock.release()
+        
+        threading.Thread(target=refresh, name='price-index-refresh', daemon=True).start()
     
     def setup_default_users(self):
         """デフォルトユーザーの設定"""
@@ -72,16 +163,17 @@ class SecureHotelServer:
         }
         
         # 設定ファイルのユーザー情報を更新
+        config = self.config
         for user_id, user_info in default_users.items():
             user_exists = False
-            for user in self.config['users']:
+            for user in config['users']:
                 if user['id'] == user_id:
                     user['password'] = user_info['hashed']
                     user_exists = True
                     break
             
             if not user_exists:
-                self.config['users'].append({
+                config['users'].append({
                     "id": user_id,
                     "password": user_info['hashed'],
                     "role": user_info['role'],
@@ -89,48 +181,85 @@ class SecureHotelServer:
                     "email": f"{user_id}@hotelanalysis.com"
                 })
         
-        # 設定を保存
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, ensure_ascii=False, indent=2)
+        # 設定を保存（ユーザー索引も作り直される）
+        self.config_cache.save(config)
+    
+    @property
+    def session_expiry(self):
+        """セッション有効期間（秒）"""
+        return self.config['session']['expiry']
     
     def hash_password(self, password):
-        """パスワードのハッシュ化"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """パスワードのハッシュ化（KDFはハッシュ用プールで実行）"""
+        return self.hasher.hash(password)
     
     def create_session(self, user_id, user_role):
         """セッション作成"""
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            'user_id': user_id,
-            'role': user_role,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(seconds=self.config['session']['expiry'])).isoformat()
-        }
-        self.save_sessions()
+        now = datetime.now()
+        expiry = self.session_expiry
+        with self.lock:
+            self.sessions[session_id] = {
+                'user_id': user_id,
+                'role': user_role,
+                'created_at': now.isoformat(),
+                'expires_at': (now + timedelta(seconds=expiry)).isoformat(),
+                'expires_ts': int(now.timestamp()) + expiry
+            }
         return session_id
     
     def validate_session(self, session_id):
         """セッション検証"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if session is None:
             return None
         
-        session = self.sessions[session_id]
-        if datetime.fromisoformat(session['expires_at']) < datetime.now():
-            del self.sessions[session_id]
-            self.save_sessions()
+        if session['expires_ts'] < time.time():
+            self.destroy_session(session_id)
             return None
         
         return session
     
+    def destroy_session(self, session_id):
+        """セッション削除"""
+        with self.lock:
+            if session_id in self.sessions:
+                del self.sessions[session_id]
+    
     def authenticate(self, user_id, password):
         """ユーザー認証"""
-        for user in self.config['users']:
-            if user['id'] == user_id:
-                if user['password'] == self.hash_password(password):
-                    return user
-        return None
+        user = self.directory.get(user_id)
+        if user is None or not self.hasher.verify(password, user['password']):
+            return None
+        
+        # 従来のSHA-256やコストの古いハッシュはログイン成功時に移行
+        if self.hasher.needs_rehash(user['password']):
+            self.update_password(user_id, self.hash_password(password))
+        return user
+    
+    def update_password(self, user_id, password_hash):
+        """パスワードハッシュの更新"""
+        with self.lock:
+            config = self.config
+            for user in config['users']:
+                if user['id'] == user_id:
+                    user['password'] = password_hash
+                    break
+            self.config_cache.save(config)
+    
+    def get_user(self, user_id):
+        """ユーザー情報の取得"""
+        return self.directory.get(user_id)
+    
+    def get_permissions(self, role):
+        """ロールの権限一覧"""
+        return self.directory.permissions(role)
+    
+    def has_permission(self, role, permission):
+        """ロールが権限を持つかどうか"""
+        return self.directory.has_permission(role, permission)
 
-class SecureHTTPHandler(http.server.SimpleHTTPRequestHandler):
+class SecureHTTPHandler(KeepAliveMixin, MetricsMixin, ProfilingMixin, JSONResponseMixin, CachedStaticMixin, http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, server_instance=None, **kwargs):
         self.server_instance = server_instance
         super().__init__(*args, **kwargs)
@@ -150,20 +279,54 @@ class SecureHTTPHandler(http.server.SimpleHTTPRequestHandler):
                 self.redirect_to_login()
                 return
         
+        path, _, query = self.path.partition('?')
+        
         # 認証API
         if self.path == '/api/auth/check':
             self.handle_auth_check()
         elif self.path == '/api/auth/logout':
             self.handle_logout()
+        # 料金データAPI
+        elif path == '/api/prices':
+            self.handle_price_query(query)
+        elif path == '/api/prices/pivot':
+            self.handle_price_pivot(query)
+        elif path == '/api/prices/table':
+            self.handle_price_table(query)
+        elif path == '/api/prices/forecast':
+            self.handle_price_forecast(query)
+        elif path == '/api/prices/stats':
+            self.handle_price_stats(query)
+        elif path == '/api/prices/rollup':
+            self.handle_price_rollup(query)
+        elif path == '/api/prices/range_stats':
+            self.handle_price_range_stats(query)
+        elif path == '/api/holidays':
+            self.handle_holidays(query)
+        elif path == '/api/tourism':
+            self.handle_tourism(query)
+        elif path == '/api/prices/summary':
+            self.handle_price_summary()
+        elif path == '/metrics':
+            self.handle_metrics()
+        elif path == '/api/admin/profile':
+            self.handle_profile(query)
         else:
-            # 静的ファイルの提供
-            self.add_security_headers()
+            # 静的ファイルの提供（キャッシュから返し、未変更なら304）
             super().do_GET()
     
     def do_POST(self):
         """POSTリクエスト処理"""
+        path, _, query = self.path.partition('?')
+        
         if self.path == '/api/auth/login':
             self.handle_login()
+        elif self.path == '/api/prices':
+            self.handle_price_upload()
+        elif path == '/api/prices/upload':
+            self.handle_csv_upload(query)
+        elif path == '/api/admin/profile':
+            self.handle_profile_control(query)
         else:
             self.send_error(404)
     
@@ -179,33 +342,49 @@ class SecureHTTPHandler(http.server.SimpleHTTPRequestHandler):
         
         return False
     
+    def require_permission(self, permission):
+        """権限チェック（なければ 401 / 403 を返して None）"""
+        cookie = SimpleCookie(self.headers.get('Cookie'))
+        session_id = cookie.get('session_id')
+        session = self.server_instance.validate_session(session_id.value) if session_id else None
+        
+        if session is None:
+            self.send_json(401, {'success': False, 'message': 'ログインが必要です'})
+            return None
+        if not self.server_instance.has_permission(session['role'], permission):
+            self.send_json(403, {'success': False, 'message': '権限がありません'})
+            return None
+        return session
+    
     def redirect_to_login(self):
         """ログインページへリダイレクト"""
         self.send_response(302)
         self.send_header('Location', f'/login.html?redirect={urllib.parse.quote(self.path)}')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def handle_login(self):
         """ログイン処理"""
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length).decode('utf-8')
+        post_data = self.read_body().decode('utf-8')
         params = urllib.parse.parse_qs(post_data)
         
         user_id = params.get('username', [''])[0]
         password = params.get('password', [''])[0]
         
-        user = self.server_instance.authenticate(user_id, password)
+        try:
+            user = self.server_instance.authenticate(user_id, password)
+        except HashingBusy:
+            # ログインが集中してハッシュ処理の待ち行列が一杯
+            response = {
+                'success': False,
+                'message': 'ただいま混み合っています。しばらくしてから再度お試しください'
+            }
+            self.send_json(503, response, headers=[('Retry-After', '1')])
+            return
         
         if user:
             session_id = self.server_instance.create_session(user['id'], user['role'])
             
-            self.send_response(200)
-            self.send_header('Set-Cookie', 
-                f'session_id={session_id}; Path=/; HttpOnly; SameSite=Strict; Max-Age={self.server_instance.config["session"]["expiry"]}')
-            self.send_header('Content-type', 'application/json')
-            self.add_security_headers()
-            self.end_headers()
-            
             response = {
                 'success': True,
                 'user': {
@@ -214,18 +393,14 @@ class SecureHTTPHandler(http.server.SimpleHTTPRequestHandler):
                     'role': user['role']
                 }
             }
-            self.wfile.write(json.dumps(response).encode())
+            cookie = f'session_id={session_id}; Path=/; HttpOnly; SameSite=Strict; Max-Age={self.server_instance.session_expiry}'
+            self.send_json(200, response, headers=[('Set-Cookie', cookie)])
         else:
-            self.send_response(401)
-            self.send_header('Content-type', 'application/json')
-            self.add_security_headers()
-            self.end_headers()
-            
             response = {
                 'success': False,
                 'message': 'ユーザーIDまたはパスワードが正しくありません'
             }
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(401, response)
     
     def handle_auth_check(self):
         """認証状態チェック"""
@@ -236,16 +411,7 @@ class SecureHTTPHandler(http.server.SimpleHTTPRequestHandler):
             session = self.server_instance.validate_session(session_id.value)
             if session:
                 # ユーザー情報を取得
-                user = None
-                for u in self.server_instance.config['users']:
-                    if u['id'] == session['user_id']:
-                        user = u
-                        break
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.add_security_headers()
-                self.end_headers()
+                user = self.server_instance.get_user(session['user_id'])
                 
                 response = {
                     'authenticated': True,
@@ -253,37 +419,329 @@ class SecureHTTPHandler(http.server.SimpleHTTPRequestHandler):
                         'id': user['id'],
                         'name': user['name'],
                         'role': user['role'],
-                        'permissions': self.server_instance.config['roles'][user['role']]['permissions']
+                        'permissions': self.server_instance.get_permissions(user['role'])
                     }
                 }
-                self.wfile.write(json.dumps(response).encode())
+                self.send_json(200, response)
                 return
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.add_security_headers()
-        self.end_headers()
-        
-        response = {'authenticated': False}
-        self.wfile.write(json.dumps(response).encode())
+        self.send_json(200, {'authenticated': False})
     
     def handle_logout(self):
         """ログアウト処理"""
         cookie = SimpleCookie(self.headers.get('Cookie'))
         session_id = cookie.get('session_id')
         
-        if session_id and session_id.value in self.server_instance.sessions:
-            del self.server_instance.sessions[session_id.value]
-            self.server_instance.save_sessions()
+        if session_id:
+            self.server_instance.destroy_session(session_id.value)
         
-        self.send_response(200)
-        self.send_header('Set-Cookie', 'session_id=; Path=/; Max-Age=0')
-        self.send_header('Content-type', 'application/json')
-        self.add_security_headers()
-        self.end_headers()
+        self.send_json(200, {'success': True}, headers=[('Set-Cookie', 'session_id=; Path=/; Max-Age=0')])
+    
+    def parse_price_filters(self, params):
+        """料金データの絞り込み条件（不正な値は ValueError）"""
+        def number(name, convert=int):
+            value = params.get(name, [''])[0]
+            return convert(value) if value else None
+        
+        start, end = params.get('start', [None])[0], params.get('end', [None])[0]
+        if any(value and parse_date(value) is None for value in (start, end)):
+            raise ValueError(start, end)
+        return {
+            'start': start,
+            'end': end,
+            'min_price': number('min_price', float),
+            'max_price': number('max_price', float),
+            # facility は複数指定可（?facility=A&facility=B）
+            'facilities': params.get('facility'),
+            'guests': number('guests')
+        }
+    
+    def handle_price_query(self, query):
+        """料金データの絞り込み（一致した行だけを返す）"""
+        if not self.require_permission('view'):
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        try:
+            filters = self.parse_price_filters(params)
+            limit = min(int(params.get('limit', [0])[0] or 0) or MAX_QUERY_ROWS, MAX_QUERY_ROWS)
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '検索条件が正しくありません'})
+            return
+        
+        prices = self.server_instance.prices
+        rows = prices.query(**filters)
+        
+        response = {
+            'success': True,
+            'total': len(rows),
+            'truncated': len(rows) > limit,
+            'data': [prices.row(row) for row in rows[:limit]]
+        }
+        self.send_json(200, response)
+    
+    def price_matrix(self, filters, aggregate):
+        """絞り込み条件ごとにキャッシュした施設×日付の料金行列"""
+        prices = self.server_instance.prices
+        facilities = filters['facilities']
+        key = (filters['start'], filters['end'], filters['min_price'], filters['max_price'],
+               frozenset(facilities) if facilities is not None else None, filters['guests'], aggregate)
+        # version は検索前に読む（検索中に追加されても次回作り直される）
+        version = prices.version
+        return self.server_instance.pivot_cache.get(
+            key, version, lambda: build_matrix(prices, prices.query(**filters), aggregate))
+    
+    def handle_price_pivot(self, query):
+        """施設×日付の料金行列（ヒートマップ・表用。同じ日の複数プランは min / median で集約）"""
+        if not self.require_permission('view'):
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        aggregate = params.get('aggregate', ['min'])[0]
+        try:
+            filters = self.parse_price_filters(params)
+            if aggregate not in AGGREGATES:
+                raise ValueError(aggregate)
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '検索条件が正しくありません'})
+            return
+        
+        matrix = self.price_matrix(filters, aggregate)
+        self.send_json(200, dict(success=True, **matrix.to_json(self.server_instance.prices.format_date)))
+    
+    def handle_price_table(self, query):
+        """料金表の1ページ（sort=name|average|min|max, order=asc|desc, cursor で続き）"""
+        if not self.require_permission('view'):
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        
+        def param(name, default):
+            return params.get(name, [default])[0]
+        
+        aggregate = param('aggregate', 'min')
+        try:
+            filters = self.parse_price_filters(params)
+            if aggregate not in AGGREGATES:
+                raise ValueError(aggregate)
+            matrix = self.price_matrix(filters, aggregate)
+            page = table_page(matrix, sort=param('sort', 'name'), order=param('order', 'asc'),
+                              cursor=param('cursor', None), limit=int(param('limit', DEFAULT_PAGE_SIZE)),
+                              summary=param('summary', 'average'),
+                              format_date=self.server_instance.prices.format_date)
+        except InvalidCursor:
+            self.send_json(400, {'success': False, 'message': 'カーソルが正しくありません'})
+            return
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '検索条件が正しくありません'})
+            return
+        
+        self.send_json(200, dict(success=True, **page))
+    
+    def handle_price_stats(self, query):
+        """料金の統計（件数・平均・最小・最大・p10・中央値・p90）。分位点はスケッチの結合による近似"""
+        if not self.require_permission('view'):
+            return
+        
+        try:
+            filters = self.parse_price_filters(urllib.parse.parse_qs(query))
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '検索条件が正しくありません'})
+            return
+        
+        server = self.server_instance
+        self.send_json(200, dict(success=True, **server.price_sketches.stats(server.prices, **filters)))
+    
+    def handle_price_rollup(self, query):
+        """曜日別・祝日別・月別の料金集計（group=weekday|holiday|weekday_holiday|month。期間は月単位）"""
+        if not self.require_permission('view'):
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        try:
+            filters = self.parse_price_filters(params)
+            if filters['min_price'] is not None or filters['max_price'] is not None:
+                raise ValueError('料金帯')
+            months = [int(month_of(parse_date(filters[name]))) if filters[name] else None
+                      for name in ('start', 'end')]
+            server = self.server_instance
+            pool = server.prices.pools['facility'].ids
+            facility_ids = None
+            if filters['facilities'] is not None:
+                facility_ids = [pool[name] for name in filters['facilities'] if name in pool]
+            server.price_rollups.refresh(server.prices)
+            rows = server.price_rollups.query(params.get('group', ['weekday'])[0], months[0], months[1],
+                                              facility_ids, filters['guests'])
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '集計条件が正しくありません'})
+            return
+        
+        self.send_json(200, {'success': True, 'rows': rows})
+    
+    def handle_price_range_stats(self, query):
+        """期間の施設ごとの件数・平均・最小・最大と全体の統計（期間集計の索引で答える）"""
+        if not self.require_permission('view'):
+            return
+        
+        try:
+            filters = self.parse_price_filters(urllib.parse.parse_qs(query))
+            if filters['min_price'] is not None or filters['max_price'] is not None:
+                raise ValueError('料金帯')
+            del filters['min_price'], filters['max_price']
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '集計条件が正しくありません'})
+            return
+        
+        server = self.server_instance
+        self.send_json(200, dict(success=True, **server.price_ranges.stats(server.prices, **filters)))
+    
+    def handle_holidays(self, query):
+        """祝日表（?from=2025&to=2026。既定は今年）"""
+        if not self.require_permission('view'):
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        try:
+            first = int(params.get('from', [datetime.now().year])[0])
+            last = int(params.get('to', [first])[0])
+            holidays = self.server_instance.holidays.between(date(first, 1, 1), date(last, 12, 31))
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '年の指定が正しくありません'})
+            return
+        
+        self.send_json(200, {'success': True,
+                             'holidays': {day.isoformat(): name for day, name in holidays.items()}})
+    
+    def handle_tourism(self, query):
+        """観光統計の表（?table=yearly&fields=年,総数。table なしなら表と列の一覧）"""
+        if not self.require_permission('view'):
+            return
+        
+        tables = self.server_instance.tourism
+        params = urllib.parse.parse_qs(query)
+        name = params.get('table', [None])[0]
+        if name is None:
+            extras = tables.get(EXTRAS_TABLE)
+            self.send_json(200, {'success': True,
+                                 'tables': {key: {'fields': table.fields, 'rows': table.rows}
+                                            for key, table in tables.items() if key != EXTRAS_TABLE},
+                                 'extras': extras.meta if extras is not None else {}})
+            return
+        
+        table = tables.get(name)
+        fields = params['fields'][0].split(',') if 'fields' in params else (table.fields if table else [])
+        if table is None or name == EXTRAS_TABLE or any(field not in table for field in fields):
+            self.send_json(400, {'success': False, 'message': '表または列の指定が正しくありません'})
+            return
+        
+        # 指定された列だけを読む（ほかの列のファイルは開かない）
+        self.send_json(200, {'success': True, 'table': name,
+                             'columns': {field: table.values(field) for field in fields}})
+    
+    def handle_price_forecast(self, query):
+        """全施設の料金予測（method=seasonal_naive|weekday_average|exponential, horizon 日分と予測区間）"""
+        if not self.require_permission('view'):
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        
+        def param(name, default):
+            return params.get(name, [default])[0]
+        
+        aggregate = param('aggregate', 'min')
+        try:
+            filters = self.parse_price_filters(params)
+            if aggregate not in AGGREGATES:
+                raise ValueError(aggregate)
+            matrix = self.price_matrix(filters, aggregate)
+            forecast = forecast_matrix(matrix, method=param('method', 'weekday_average'),
+                                       horizon=int(param('horizon', DEFAULT_HORIZON)),
+                                       interval=float(param('interval', DEFAULT_INTERVAL)),
+                                       window=int(param('window', DEFAULT_WINDOW)),
+                                       alpha=float(param('alpha', DEFAULT_ALPHA)))
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '予測条件が正しくありません'})
+            return
+        
+        self.send_json(200, dict(success=True, **forecast.to_json(self.server_instance.prices.format_date)))
+    
+    def handle_price_summary(self):
+        """施設一覧・期間など絞り込み画面用の情報"""
+        if not self.require_permission('view'):
+            return
+        
+        self.send_json(200, dict(success=True, **self.server_instance.prices.summary()))
+    
+    def handle_metrics(self):
+        """メトリクス（Prometheus のテキスト形式。ユーザー管理の権限が必要）"""
+        if not self.require_permission('manage_users'):
+            return
+        
+        self.send_metrics()
+    
+    def handle_profile(self, query):
+        """リクエストの計測状態・統計（ユーザー管理の権限が必要）"""
+        if not self.require_permission('manage_users'):
+            return
+        
+        self.send_profile(query)
+    
+    def handle_profile_control(self, query):
+        """リクエストの計測の開始・停止（ユーザー管理の権限が必要）"""
+        if not self.require_permission('manage_users'):
+            return
+        
+        self.control_profile(query)
+    
+    def handle_price_upload(self):
+        """料金データの登録（{"guests": 2, "observations": [{facility, date, price, ...}]}）"""
+        if not self.require_permission('upload'):
+            return
+        
+        try:
+            payload = json.loads(self.read_body().decode('utf-8'))
+            observations = payload['observations']
+            guests = int(payload.get('guests', 2))
+            if not isinstance(observations, list):
+                raise TypeError(observations)
+        except (ValueError, KeyError, TypeError, AttributeError, OverflowError):
+            # guests が inf（1e400）のときは OverflowError
+            self.send_json(400, {'success': False, 'message': 'データの形式が正しくありません'})
+            return
         
-        response = {'success': True}
-        self.wfile.write(json.dumps(response).encode())
+        prices = self.server_instance.prices
+        counts = prices.add_many(observations, guests=guests)
+        self.server_instance.save_prices()
+        self.send_json(200, dict(success=True, count=prices.count(), **counts))
+    
+    def handle_csv_upload(self, query):
+        """スクレイピング結果CSVの取り込み（本文はCSVそのもの。受信しながら解析する）"""
+        if not self.require_permission('upload'):
+            return
+        
+        if self.headers.get('Content-Length') is None:
+            self.send_json(411, {'success': False, 'message': 'Content-Length が必要です'})
+            return
+        
+        params = urllib.parse.parse_qs(query)
+        encoding = params.get('encoding', [None])[0]
+        try:
+            guests = int(params.get('guests', [0])[0] or 0) or None
+            result = ingest_csv(self.body_stream(), self.server_instance.prices,
+                                encoding=encoding, guests=guests)
+        except IngestError as e:
+            self.send_json(400, {'success': False, 'message': str(e)})
+            return
+        except (ValueError, OverflowError):
+            self.send_json(400, {'success': False, 'message': '取り込み条件が正しくありません'})
+            return
+        
+        self.server_instance.save_prices()
+        self.send_json(200, dict(success=True, count=self.server_instance.prices.count(), **result))
+    
+    def send_common_headers(self):
+        """静的ファイル・APIの応答にセキュリティヘッダーを付ける"""
+        self.add_security_headers()
     
     def add_security_headers(self):
         """セキュリティヘッダーの追加"""
@@ -302,6 +760,17 @@ def create_self_signed_cert():
             -days 365 -nodes -subj "/C=JP/ST=Tokyo/L=Tokyo/O=HotelAnalysis/CN=localhost"
         """)
 
+def create_ssl_context():
+    """TLS設定（セッション再開を有効にしてハンドシェイクを省略できるようにする）"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(CERT_FILE, KEY_FILE)
+    # TLS 1.2: セッションチケット（サーバー側のセッションキャッシュも既定で有効）
+    context.options &= ~ssl.OP_NO_TICKET
+    # TLS 1.3: ハンドシェイクごとに発行するチケット数
+    context.num_tickets = TLS_TICKETS
+    return context
+
 def run_redirect_server():
     """HTTPからHTTPSへのリダイレクトサーバー"""
     class RedirectHandler(http.server.SimpleHTTPRequestHandler):
@@ -317,10 +786,18 @@ def run_redirect_server():
 def main():
     parser = argparse.ArgumentParser(description='Secure Hotel Price Analysis Server')
     parser.add_argument('--http-only', action='store_true', help='HTTPモードで起動（開発用）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'並行処理のワーカースレッド数（1でシングルスレッド、デフォルト: {DEFAULT_WORKERS}）')
+    parser.add_argument('--session-backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f'セッションの保存方式（デフォルト: {DEFAULT_BACKEND}）')
+    parser.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help=f'パスワードハッシュ用のワーカー数（デフォルト: {DEFAULT_HASH_WORKERS}）')
     args = parser.parse_args()
     
     # サーバーインスタンスの作成
-    server = SecureHotelServer()
+    server = SecureHotelServer(session_backend=args.session_backend, hash_workers=args.hash_workers)
+    SessionSweeper(server.sessions).start()
+    SecureHTTPHandler.asset_cache.preload(PRELOAD_ASSETS, available_encodings())
     
     print("\n" + "="*60)
     print("🏨 宿泊施設料金分析システム - セキュアサーバー")
@@ -331,15 +808,22 @@ def main():
     print("  閲覧者:     hotel_viewer / View@2024")
     print("\n⚠️  本番環境では必ずパスワードを変更してください！")
     
+    if args.workers > 1:
+        print(f"\n⚙️  並行処理: {args.workers} ワーカースレッド（HTTP/1.1 持続的接続）")
+    else:
+        # シングルスレッドではアイドル接続が他の利用者を塞ぐので持続的接続を使わない
+        SecureHTTPHandler.protocol_version = 'HTTP/1.0'
+        print("\n⚙️  並行処理: シングルスレッド")
+    
     if args.http_only:
         # HTTP モード（開発用）
-        PORT = 8001
+        port = 8001
         handler = lambda *args, **kwargs: SecureHTTPHandler(*args, server_instance=server, **kwargs)
         
-        with socketserver.TCPServer(("", PORT), handler) as httpd:
-            print(f"\n🌐 開発サーバー起動: http://localhost:{PORT}")
-            print(f"   ログイン: http://localhost:{PORT}/login.html")
-            print(f"   アプリ: http://localhost:{PORT}/hotel_price_analysis.html")
+        with create_server(("", port), handler, workers=args.workers) as httpd:
+            print(f"\n🌐 開発サーバー起動: http://localhost:{port}")
+            print(f"   ログイン: http://localhost:{port}/login.html")
+            print(f"   アプリ: http://localhost:{port}/hotel_price_analysis.html")
             print("\nCtrl+C で停止します")
             httpd.serve_forever()
     else:
@@ -349,19 +833,16 @@ def main():
         # HTTPSサーバーの起動
         handler = lambda *args, **kwargs: SecureHTTPHandler(*args, server_instance=server, **kwargs)
         
-        with socketserver.TCPServer(("", PORT), handler) as httpd:
-            # SSL設定
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            context.load_cert_chain(CERT_FILE, KEY_FILE)
-            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-            
+        # SSL設定（ハンドシェイクはワーカースレッド側で行う）
+        context = create_ssl_context()
+        
+        with create_server(("", PORT), handler, workers=args.workers, ssl_context=context) as httpd:
             print(f"\n🔒 HTTPSサーバー起動: https://localhost:{PORT}")
             print(f"   ログイン: https://localhost:{PORT}/login.html")
             print(f"   アプリ: https://localhost:{PORT}/hotel_price_analysis.html")
             print("\nCtrl+C で停止します")
             
             # HTTPリダイレクトサーバーを別スレッドで起動
-            import threading
             redirect_thread = threading.Thread(target=run_redirect_server, daemon=True)
             redirect_thread.start()
             
@@ -1,79 +1,112 @@
 #!/usr/bin/env python3
 import http.server
 import socketserver
-import json
 import os
-import hashlib
 import uuid
 import urllib.parse
+import threading
+import time
 from datetime import datetime, timedelta
 from http.cookies import SimpleCookie
+from session_store import open_session_store, SessionSweeper, DEFAULT_BACKEND
+from json_file_cache import JSONFileCache
+from static_cache import CachedStaticMixin
+from metrics import REGISTRY, MetricsMixin
+from request_profiler import ProfilingMixin
+from content_encoding import JSONResponseMixin, available_encodings
+from password_hashing import default_hasher, HashingBusy
 
 PORT = 8000
 USERS_FILE = "users.json"
 SESSIONS_FILE = "sessions.json"
+SESSION_BACKEND = DEFAULT_BACKEND
+# /metrics・リクエストの計測を使えるユーザー
+ADMIN_USERS = {"admin"}
+# 起動時にキャッシュへ読み込んで圧縮しておくファイル
+PRELOAD_ASSETS = [
+    "index.html", "app.js", "style.css",
+    "tourism_web.html", "tourism_app.js", "tourism_style.css", "tourism_data_for_web.json",
+    "hotel_price_analysis_v2.html", "hotel_price_app_v2.js", "hotel_price_style_v2.css"
+]
 
 class SessionManager:
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls):
+        """プロセス内で共有するインスタンス"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
     def __init__(self):
         self.sessions = self.load_sessions()
+        REGISTRY.gauge('sessions_active', 'セッション数（期限切れで未削除のものを含む）', lambda: len(self.sessions))
     
     def load_sessions(self):
-        if os.path.exists(SESSIONS_FILE):
-            try:
-                with open(SESSIONS_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return open_session_store(SESSIONS_FILE, SESSION_BACKEND)
     
     def save_sessions(self):
-        with open(SESSIONS_FILE, 'w') as f:
-            json.dump(self.sessions, f)
+        self.sessions.flush()
     
     def create_session(self, username):
         session_id = str(uuid.uuid4())
+        now = datetime.now()
         self.sessions[session_id] = {
             'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(hours=24)).isoformat()
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(hours=24)).isoformat(),
+            'expires_ts': int(now.timestamp()) + 24 * 60 * 60
         }
-        self.save_sessions()
         return session_id
     
     def validate_session(self, session_id):
-        if session_id not in self.sessions:
+        # 他プロセスが書き換えていれば読み直す
+        self.sessions.refresh()
+        session = self.sessions.get(session_id)
+        if session is None:
             return None
         
-        session = self.sessions[session_id]
-        if datetime.fromisoformat(session['expires_at']) < datetime.now():
-            del self.sessions[session_id]
-            self.save_sessions()
+        if session['expires_ts'] < time.time():
+            # スイーパーや他のリクエストが先に削除していてもよい
+            self.sessions.delete_many([session_id])
             return None
         
         return session['username']
     
     def destroy_session(self, session_id):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            self.save_sessions()
+        self.sessions.delete_many([session_id])
 
 class UserManager:
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls):
+        """プロセス内で共有するインスタンス"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
     def __init__(self):
-        self.users = self.load_users()
+        # users.json はmtime/サイズが変わったときだけ読み直す
+        self.cache = JSONFileCache(USERS_FILE, indent=2)
+        self.lock = threading.RLock()
         self.ensure_default_users()
     
+    @property
+    def users(self):
+        return self.cache.get()
+    
     def load_users(self):
-        if os.path.exists(USERS_FILE):
-            try:
-                with open(USERS_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        self.cache.reload()
+        return self.cache.value
     
     def save_users(self):
-        with open(USERS_FILE, 'w') as f:
-            json.dump(self.users, f, indent=2)
+        self.cache.save()
     
     def ensure_default_users(self):
         default_users = [
@@ -86,31 +119,46 @@ class UserManager:
                 self.create_user(username, password, email)
     
     def create_user(self, username, password, email=""):
-        if username in self.users:
-            return False, "ユーザー名は既に使用されています"
-        
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        self.users[username] = {
-            'username': username,
-            'password_hash': password_hash,
-            'email': email,
-            'created_at': datetime.now().isoformat()
-        }
-        self.save_users()
+        with self.lock:
+            users = self.users
+            if username in users:
+                return False, "ユーザー名は既に使用されています"
+            
+            password_hash = default_hasher().hash(password)
+            users = dict(users)
+            users[username] = {
+                'username': username,
+                'password_hash': password_hash,
+                'email': email,
+                'created_at': datetime.now().isoformat()
+            }
+            self.cache.save(users)
         return True, "ユーザーを作成しました"
     
     def authenticate(self, username, password):
-        if username not in self.users:
+        user = self.users.get(username)
+        if user is None:
+            return False
+        
+        hasher = default_hasher()
+        if not hasher.verify(password, user['password_hash']):
             return False
         
-        user = self.users[username]
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        return user['password_hash'] == password_hash
+        # 従来のSHA-256はログイン成功時に新しい形式へ移行
+        if hasher.needs_rehash(user['password_hash']):
+            self.update_password_hash(username, hasher.hash(password))
+        return True
+    
+    def update_password_hash(self, username, password_hash):
+        with self.lock:
+            users = dict(self.users)
+            users[username] = dict(users[username], password_hash=password_hash)
+            self.cache.save(users)
 
-class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
+class IntegratedHTTPHandler(MetricsMixin, ProfilingMixin, JSONResponseMixin, CachedStaticMixin, http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
-        self.user_manager = UserManager()
-        self.session_manager = SessionManager()
+        self.user_manager = UserManager.shared()
+        self.session_manager = SessionManager.shared()
         super().__init__(*args, **kwargs)
     
     def do_GET(self):
@@ -124,8 +172,15 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
                 self.handle_auth_check()
             elif self.path == '/api/auth/logout':
                 self.handle_logout()
+            else:
+                self.send_error(404)
+        elif self.path == '/metrics':
+            self.handle_metrics()
+        elif self.path.partition('?')[0] == '/api/admin/profile':
+            if self.require_admin():
+                self.send_profile(self.path.partition('?')[2])
         else:
-            # 静的ファイルの提供
+            # 静的ファイルの提供（キャッシュから返し、未変更なら304）
             super().do_GET()
     
     def do_POST(self):
@@ -133,6 +188,9 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
             self.handle_login()
         elif self.path == '/auth/register':
             self.handle_register()
+        elif self.path.partition('?')[0] == '/api/admin/profile':
+            if self.require_admin():
+                self.control_profile(self.path.partition('?')[2])
         else:
             self.send_error(404)
     
@@ -143,23 +201,33 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
         if session_id:
             username = self.session_manager.validate_session(session_id.value)
             if username:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                
                 response = {
                     'authenticated': True,
                     'username': username
                 }
-                self.wfile.write(json.dumps(response).encode())
+                self.send_json(200, response)
                 return
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
+        self.send_json(200, {'authenticated': False})
+    
+    def require_admin(self):
+        """管理者かどうか（違えば 401 / 403 を返して False）"""
+        cookie = SimpleCookie(self.headers.get('Cookie'))
+        session_id = cookie.get('session_id')
+        username = self.session_manager.validate_session(session_id.value) if session_id else None
         
-        response = {'authenticated': False}
-        self.wfile.write(json.dumps(response).encode())
+        if username is None:
+            self.send_json(401, {'success': False, 'message': 'ログインが必要です'})
+            return False
+        if username not in ADMIN_USERS:
+            self.send_json(403, {'success': False, 'message': '権限がありません'})
+            return False
+        return True
+    
+    def handle_metrics(self):
+        """メトリクス（Prometheus のテキスト形式。管理者のみ）"""
+        if self.require_admin():
+            self.send_metrics()
     
     def handle_login(self):
         content_length = int(self.headers['Content-Length'])
@@ -169,30 +237,31 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
         username = params.get('username', [''])[0]
         password = params.get('password', [''])[0]
         
-        if self.user_manager.authenticate(username, password):
+        try:
+            authenticated = self.user_manager.authenticate(username, password)
+        except HashingBusy:
+            response = {
+                'success': False,
+                'message': 'ただいま混み合っています。しばらくしてから再度お試しください'
+            }
+            self.send_json(503, response, headers=[('Retry-After', '1')])
+            return
+        
+        if authenticated:
             session_id = self.session_manager.create_session(username)
             
-            self.send_response(200)
-            self.send_header('Set-Cookie', f'session_id={session_id}; Path=/; HttpOnly')
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
             response = {
                 'success': True,
                 'message': 'ログインしました',
                 'username': username
             }
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(200, response, headers=[('Set-Cookie', f'session_id={session_id}; Path=/; HttpOnly')])
         else:
-            self.send_response(401)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
             response = {
                 'success': False,
                 'message': 'ユーザー名またはパスワードが正しくありません'
             }
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(401, response)
     
     def handle_register(self):
         content_length = int(self.headers['Content-Length'])
@@ -204,29 +273,17 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
         email = params.get('email', [''])[0]
         
         if len(username) < 3 or len(password) < 6:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
             response = {
                 'success': False,
                 'message': 'ユーザー名は3文字以上、パスワードは6文字以上必要です'
             }
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(400, response)
             return
         
         success, message = self.user_manager.create_user(username, password, email)
         
-        if success:
-            self.send_response(200)
-        else:
-            self.send_response(400)
-        
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        
         response = {'success': success, 'message': message}
-        self.wfile.write(json.dumps(response).encode())
+        self.send_json(200 if success else 400, response)
     
     def handle_logout(self):
         cookie = SimpleCookie(self.headers.get('Cookie'))
@@ -235,13 +292,8 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
         if session_id:
             self.session_manager.destroy_session(session_id.value)
         
-        self.send_response(200)
-        self.send_header('Set-Cookie', 'session_id=; Path=/; Max-Age=0')
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        
         response = {'success': True, 'message': 'ログアウトしました'}
-        self.wfile.write(json.dumps(response).encode())
+        self.send_json(200, response, headers=[('Set-Cookie', 'session_id=; Path=/; Max-Age=0')])
     
     def end_headers(self):
         # CORS対応（開発環境用）
@@ -253,6 +305,12 @@ class IntegratedHTTPHandler(http.server.SimpleHTTPRequestHandler):
 def main():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     
+    # 共有マネージャーを先に作成（デフォルトユーザーの作成もここで行う）
+    UserManager.shared()
+    REGISTRY.register_cache('static', IntegratedHTTPHandler.asset_cache)
+    SessionSweeper(SessionManager.shared().sessions).start()
+    IntegratedHTTPHandler.asset_cache.preload(PRELOAD_ASSETS, available_encodings())
+    
     print(f"統合サーバーを起動しました: http://localhost:{PORT}")
     print("\n利用可能なアプリケーション:")
     print(f"  - ログイン画面: http://localhost:{PORT}/login.html")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+日本の祝日表
+祝日法の規則（ハッピーマンデー、春分・秋分の日の計算式、振替休日、国民の休日、
+2019〜2021年の特例）から、指定した年の範囲の祝日を前もって計算しておく。
+日付は 1970-01-01 からの日数でも引けるので、numpy の配列でまとめて判定できる。
+"""
+
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+
+# 既定で用意する年の範囲（春分・秋分の日の計算式は 2099 年まで有効）
+DEFAULT_FIRST_YEAR = 2000
+DEFAULT_LAST_YEAR = 2050
+MIN_YEAR = 2000
+MAX_YEAR = 2099
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# 年ごとの特例
+SPECIAL_HOLIDAYS = {
+    date(2019, 5, 1): '天皇の即位の日',
+    date(2019, 10, 22): '即位礼正殿の儀の行われる日',
+}
+MOVED_HOLIDAYS = {
+    # 東京オリンピック・パラリンピックに伴う移動
+    2020: {'海の日': date(2020, 7, 23), 'スポーツの日': date(2020, 7, 24), '山の日': date(2020, 8, 10)},
+    2021: {'海の日': date(2021, 7, 22), 'スポーツの日': date(2021, 7, 23), '山の日': date(2021, 8, 8)},
+}
+
+
+def nth_monday(year, month, n):
+    """その月の第 n 月曜日"""
+    first = date(year, month, 1)
+    return first + timedelta(days=(7 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def equinox_day(year, base):
+    """春分（base=20.8431）・秋分（base=23.2488）の日（1980〜2099年の近似式）"""
+    return int(base + 0.242194 * (year - 1980) - (year - 1980) // 4)
+
+
+def statutory_holidays(year):
+    """振替休日・国民の休日を除いた、その年の祝日 {日付: 名前}"""
+    holidays = {
+        date(year, 1, 1): '元日',
+        nth_monday(year, 1, 2): '成人の日',
+        date(year, 2, 11): '建国記念の日',
+        date(year, 3, equinox_day(year, 20.8431)): '春分の日',
+        date(year, 5, 3): '憲法記念日',
+        date(year, 5, 5): 'こどもの日',
+        date(year, 9, equinox_day(year, 23.2488)): '秋分の日',
+        date(year, 11, 3): '文化の日',
+        date(year, 11, 23): '勤労感謝の日',
+    }
+    if year >= 2007:
+        holidays[date(year, 4, 29)] = '昭和の日'
+        holidays[date(year, 5, 4)] = 'みどりの日'
+    else:
+        holidays[date(year, 4, 29)] = 'みどりの日'
+    if year >= 2020:
+        holidays[date(year, 2, 23)] = '天皇誕生日'
+    elif year <= 2018:
+        holidays[date(year, 12, 23)] = '天皇誕生日'
+
+    moved = MOVED_HOLIDAYS.get(year, {})
+    if year >= 2003:
+        holidays[moved.get('海の日', nth_monday(year, 7, 3))] = '海の日'
+        holidays[nth_monday(year, 9, 3)] = '敬老の日'
+    else:
+        holidays[date(year, 7, 20)] = '海の日'
+        holidays[date(year, 9, 15)] = '敬老の日'
+    if year >= 2020:
+        holidays[moved.get('スポーツの日', nth_monday(year, 10, 2))] = 'スポーツの日'
+    else:
+        holidays[nth_monday(year, 10, 2)] = '体育の日'
+    if year >= 2016:
+        holidays[moved.get('山の日', date(year, 8, 11))] = '山の日'
+
+    holidays.update((day, name) for day, name in SPECIAL_HOLIDAYS.items() if day.year == year)
+    return holidays
+
+
+def holidays_of_year(year):
+    """その年の祝日・振替休日・国民の休日 {日付: 名前}"""
+    # 年をまたぐ振替休日・国民の休日はないので前後の年は見なくてよい
+    holidays = statutory_holidays(year)
+    for day in sorted(holidays):
+        if day.weekday() != 6:
+            continue
+        # 日曜日の祝日は、2007年以降は次の祝日でない日、それより前は翌日が振替休日
+        substitute = day + timedelta(days=1)
+        while year >= 2007 and substitute in holidays:
+            substitute += timedelta(days=1)
+        holidays.setdefault(substitute, '振替休日')
+
+    # 前後が祝日の平日は国民の休日
+    for day in sorted(holidays):
+        between = day + timedelta(days=2)
+        middle = day + timedelta(days=1)
+        if between in holidays and middle not in holidays and middle.weekday() != 6:
+            holidays[middle] = '国民の休日'
+    return dict(sorted(holidays.items()))
+
+
+class HolidayCalendar:
+    """年の範囲の祝日表（範囲外の日は祝日でないものとして扱う）"""
+
+    def __init__(self, first_year=DEFAULT_FIRST_YEAR, last_year=DEFAULT_LAST_YEAR):
+        if not MIN_YEAR <= first_year <= last_year <= MAX_YEAR:
+            raise ValueError(f"祝日表の年の範囲は {MIN_YEAR}〜{MAX_YEAR} 年です: {first_year}〜{last_year}")
+        self.first_year = first_year
+        self.last_year = last_year
+        self.names = {}
+        for year in range(first_year, last_year + 1):
+            self.names.update(holidays_of_year(year))
+
+        # 1970-01-01 からの日数で引く表
+        self.first_day = date(first_year, 1, 1).toordinal() - EPOCH_ORDINAL
+        last_day = date(last_year, 12, 31).toordinal() - EPOCH_ORDINAL
+        self.flags = np.zeros(last_day - self.first_day + 1, dtype=bool)
+        self.flags[[day.toordinal() - EPOCH_ORDINAL - self.first_day for day in self.names]] = True
+
+    def __contains__(self, day):
+        return day in self.names
+
+    def name(self, day):
+        """祝日名（祝日でなければ None）"""
+        return self.names.get(day)
+
+    def is_holiday(self, days):
+        """1970-01-01 からの日数（numpy 配列可）が祝日かどうか"""
+        offsets = np.asarray(days, dtype=np.int64) - self.first_day
+        inside = (offsets >= 0) & (offsets < len(self.flags))
+        return np.where(inside, self.flags[np.clip(offsets, 0, len(self.flags) - 1)], False)
+
+    def between(self, start, end):
+        """start〜end（date）の祝日 {日付: 名前}"""
+        return {day: name for day, name in self.names.items() if start <= day <= end}
+
+
+if __name__ == "__main__":
+    # 祝日の一覧: python3 japanese_holidays.py 2025
+    target_year = int(sys.argv[1]) if len(sys.argv) > 1 else date.today().year
+    for holiday, holiday_name in holidays_of_year(target_year).items():
+        print(f"{holiday.isoformat()} ({'月火水木金土日'[holiday.weekday()]}) {holiday_name}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+JSONファイルキャッシュ
+ファイルの内容をメモリに保持し、更新日時（mtime）かサイズが変わったときだけ読み直す
+"""
+
+import json
+import os
+import threading
+import time
+
+
+def file_signature(path):
+    """ファイルの変更検知用シグネチャ（存在しなければ None）"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class JSONFileCache:
+    """プロセス内で共有するJSONファイルのキャッシュ
+
+    build を指定すると、読み込んだJSONを build(data) で変換した結果をキャッシュする。
+    check_interval 秒以内の再確認は stat も省略する。
+    """
+
+    def __init__(self, path, default=dict, build=None, check_interval=0, **json_options):
+        self.path = path
+        self.default = default
+        self.build = build
+        self.check_interval = check_interval
+        self.json_options = json_options
+        self.lock = threading.RLock()
+        self.signature = None
+        self.last_check = 0
+        self.data = None
+        self.value = None
+        self.version = 0
+        self.reload()
+
+    def reload(self):
+        """ファイルを読み直す"""
+        with self.lock:
+            signature = file_signature(self.path)
+            data = self.default()
+            if signature is not None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    data = self.default()
+            # 変換後の値ごと入れ替えるので、読み手が途中の状態を見ることはない
+            self.value = self.build(data) if self.build else data
+            self.data = data
+            self.signature = signature
+            self.version += 1
+
+    def refresh(self):
+        """ファイルが変わっていれば読み直し、読み直したら True を返す"""
+        now = time.monotonic()
+        if self.check_interval and now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+        if file_signature(self.path) == self.signature:
+            return False
+        with self.lock:
+            if file_signature(self.path) == self.signature:
+                return False
+            self.reload()
+            return True
+
+    def get(self):
+        """最新の値を返す"""
+        self.refresh()
+        return self.value
+
+    def save(self, data=None):
+        """データを書き込み、自分の書き込みでは読み直しが起きないようにする"""
+        with self.lock:
+            if data is None:
+                data = self.data
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, **self.json_options)
+            os.replace(tmp_path, self.path)
+            self.value = self.build(data) if self.build else data
+            self.data = data
+            self.signature = file_signature(self.path)
+            self.version += 1
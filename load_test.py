@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+負荷試験（画面の利用を再現する HTTP クライアント）
+asyncio で仮想ユーザーを並行に動かし、手元で起動したサーバーに次の流れを繰り返す。
+
+    ログイン画面を開く → /api/auth/login → 分析画面の HTML/CSS/JS → /api/auth/check を数回 → /api/auth/logout
+
+仮想ユーザーは --ramp-up 秒かけて少しずつ増やし、--duration 秒たったら新しい操作を始めない。
+結果は種類（ログイン・認証チェック・静的ファイル・ログアウト）ごとの件数・エラー・
+1秒あたりのリクエスト数・p50/p95/p99 で表示する（--json で保存）。
+標準ライブラリだけで動き、外部のサービスは使わない。HTTPS は自己署名証明書をそのまま受け入れる。
+
+使い方:
+    python3 hotel_secure_server.py --http-only &
+    python3 load_test.py --url http://localhost:8001 --users 50 --ramp-up 10 --duration 60
+    python3 integrated_server.py &
+    python3 load_test.py --profile integrated --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import json
+import ssl
+import time
+import urllib.parse
+from collections import Counter
+
+# 対象ごとの既定のアカウントと画面のファイル
+PROFILES = {
+    'secure': {
+        'username': 'hotel_viewer',
+        'password': 'View@2024',
+        'assets': ['/login.html', '/hotel_price_analysis.html', '/hotel_price_style.css', '/hotel_price_app.js'],
+    },
+    'integrated': {
+        'username': 'demo',
+        'password': 'demo123',
+        'assets': ['/login.html', '/tourism_web.html', '/tourism_style.css', '/tourism_app.js'],
+    },
+}
+KINDS = ('login', 'check', 'static', 'logout')
+KIND_LABELS = {'login': 'ログイン', 'check': '認証チェック', 'static': '静的ファイル', 'logout': 'ログアウト'}
+LOGIN_PATH = '/api/auth/login'
+CHECK_PATH = '/api/auth/check'
+LOGOUT_PATH = '/api/auth/logout'
+REQUEST_TIMEOUT = 30.0
+MAX_HEADER_LINES = 100
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class HTTPError(Exception):
+    """応答が読めない"""
+
+
+class Connection:
+    """1本の HTTP/1.1 接続（サーバーが閉じたら次のリクエストでつなぎ直す）"""
+
+    def __init__(self, host, port, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.reader = None
+        self.writer = None
+        self.connects = 0
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context, server_hostname=self.host if self.ssl_context else None)
+        self.connects += 1
+
+    async def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """(ステータス, ヘッダー, 本文) を返す
+
+        使い回した接続がサーバー側で閉じられていた（アイドルタイムアウトなど）場合は
+        つなぎ直して1回だけ送り直す
+        """
+        reused = self.writer is not None
+        try:
+            return await self.exchange(method, path, body, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            await self.close()
+            return await self.exchange(method, path, body, headers)
+
+    async def exchange(self, method, path, body, headers):
+        if self.writer is None:
+            await self.open()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Accept-Encoding: gzip"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        if body or method == 'POST':
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("応答の前に接続が閉じられました")
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise HTTPError(f"応答が正しくありません: {status_line[:80]!r}")
+        version, status = parts[0], int(parts[1])
+        response_headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            # Set-Cookie は最初のものだけ使う
+            response_headers.setdefault(name, value.strip())
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await self.read_chunked()
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif status in (204, 304) or method == 'HEAD':
+            data = b''
+        else:
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+            await self.close()
+        return status, response_headers, data
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                # 末尾のヘッダー（trailer）を読み捨てる
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+class Stats:
+    """種類ごとの所要時間・エラー・ステータス"""
+
+    def __init__(self):
+        self.latencies = {kind: [] for kind in KINDS}
+        self.errors = Counter()
+        self.statuses = Counter()
+        self.sessions = 0
+        self.connects = 0
+        self.active_users = 0
+        self.peak_users = 0
+
+    def record(self, kind, elapsed, status):
+        self.latencies[kind].append(elapsed)
+        self.statuses[status] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[kind] += 1
+
+    def report(self, elapsed):
+        total = sum(len(values) for values in self.latencies.values())
+        rows = {}
+        for kind in KINDS + ('all',):
+            values = self.latencies[kind] if kind != 'all' else [v for vs in self.latencies.values() for v in vs]
+            if not values:
+                continue
+            rows[kind] = {
+                'requests': len(values),
+                'errors': self.errors[kind] if kind != 'all' else sum(self.errors.values()),
+                'rps': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(max(values) * 1000, 2),
+            }
+        return {
+            'elapsed_sec': round(elapsed, 2),
+            'requests': total,
+            'rps': round(total / elapsed, 2) if elapsed else 0,
+            'sessions': self.sessions,
+            'connections': self.connects,
+            'peak_users': self.peak_users,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            'kinds': rows,
+        }
+
+
+class VirtualUser:
+    """画面の利用を繰り返す仮想ユーザー"""
+
+    def __init__(self, target, options, stats):
+        self.connection = Connection(*target)
+        self.options = options
+        self.stats = stats
+        self.cookie = ''
+
+    async def call(self, kind, method, path, body=b''):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        if body:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = time.perf_counter()
+        try:
+            status, headers, _ = await asyncio.wait_for(
+                self.connection.request(method, path, body, headers), REQUEST_TIMEOUT)
+        except (OSError, ssl.SSLError, asyncio.IncompleteReadError, asyncio.TimeoutError, HTTPError, ValueError) as e:
+            await self.connection.close()
+            self.stats.record(kind, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.stats.record(kind, time.perf_counter() - start, status)
+        cookie = headers.get('set-cookie')
+        if cookie:
+            self.cookie = cookie.split(';')[0]
+        return status
+
+    async def session(self):
+        options = self.options
+        login = urllib.parse.urlencode({'username': options.username, 'password': options.password}).encode()
+        await self.call('static', 'GET', options.assets[0])
+        if await self.call('login', 'POST', LOGIN_PATH, login) != 200:
+            # ログインできなければ少し待ってやり直す（サーバーが混んでいる場合など）
+            await asyncio.sleep(options.think_time)
+            return
+        for path in options.assets[1:]:
+            await self.call('static', 'GET', path)
+        for _ in range(options.polls):
+            await asyncio.sleep(options.think_time)
+            await self.call('check', 'GET', CHECK_PATH)
+        await self.call('logout', 'GET', LOGOUT_PATH)
+        self.cookie = ''
+        self.stats.sessions += 1
+
+    async def run(self, deadline):
+        self.stats.active_users += 1
+        self.stats.peak_users = max(self.stats.peak_users, self.stats.active_users)
+        try:
+            while time.perf_counter() < deadline:
+                await self.session()
+        finally:
+            self.stats.active_users -= 1
+            self.stats.connects += self.connection.connects
+            await self.connection.close()
+
+
+async def run_load(options):
+    url = urllib.parse.urlsplit(options.url)
+    ssl_context = None
+    if url.scheme == 'https':
+        # 自己署名証明書を許可
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    target = (url.hostname, url.port or (443 if url.scheme == 'https' else 80), ssl_context)
+
+    stats = Stats()
+    started = time.perf_counter()
+    deadline = started + options.duration
+
+    async def start_user(i):
+        # ramp-up の間に均等に開始する
+        await asyncio.sleep(options.ramp_up * i / options.users)
+        await VirtualUser(target, options, stats).run(deadline)
+
+    await asyncio.gather(*(start_user(i) for i in range(options.users)))
+    return stats.report(time.perf_counter() - started)
+
+
+def print_report(report, options):
+    print(f"\n対象: {options.url}  仮想ユーザー: {options.users}（{options.ramp_up:g}秒で増加）  "
+          f"時間: {report['elapsed_sec']:g}秒")
+    print(f"セッション: {report['sessions']:,}  接続: {report['connections']:,}  "
+          f"ステータス: {', '.join(f'{s}={n:,}' for s, n in report['statuses'].items())}\n")
+    print(f"{'種類':<12} {'件数':>9} {'エラー':>7} {'RPS':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'最大(ms)':>9}")
+    print("-" * 82)
+    for kind, row in report['kinds'].items():
+        print(f"{KIND_LABELS.get(kind, '合計'):<12} {row['requests']:>9,} {row['errors']:>7,} {row['rps']:>9.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='画面の利用を再現する負荷試験')
+    parser.add_argument('--url', default='http://localhost:8001', help='サーバーのURL（http / https）')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='secure',
+                        help='既定のアカウント・画面のファイル（secure: hotel_secure_server, integrated: integrated_server）')
+    parser.add_argument('--users', type=int, default=20, help='仮想ユーザー数（同時接続数）')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='全員がそろうまでの秒数')
+    parser.add_argument('--duration', type=float, default=30.0, help='新しい操作を始める秒数')
+    parser.add_argument('--polls', type=int, default=5, help='1セッションでの認証チェックの回数')
+    parser.add_argument('--think-time', type=float, default=1.0, help='認証チェックの間隔（秒）')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--assets', help='ログイン画面と分析画面のファイル（カンマ区切り。先頭はログイン前に開く）')
+    parser.add_argument('--json', help='結果を保存する JSON ファイル')
+    options = parser.parse_args()
+    if options.users < 1 or options.duration <= 0 or options.ramp_up < 0:
+        parser.error('--users は1以上、--duration は0より大きく、--ramp-up は0以上にしてください')
+
+    profile = PROFILES[options.profile]
+    options.username = options.username or profile['username']
+    options.password = options.password or profile['password']
+    options.assets = options.assets.split(',') if options.assets else profile['assets']
+
+    report = asyncio.run(run_load(options))
+    print_report(report, options)
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(report, url=options.url, users=options.users, ramp_up=options.ramp_up),
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {options.json} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+持続的接続とTLSセッション再開の効果測定
+分析画面の読み込み（ページ本体＋CSS/JS＋認証チェック）を繰り返し、
+リクエストごとに新しい接続を張る従来の方式と比較する
+
+使い方:
+    python3 hotel_secure_server.py &
+    python3 measure_keepalive.py --url https://localhost:8443
+"""
+
+import argparse
+import http.client
+import ssl
+import time
+import urllib.parse
+
+DEFAULT_ASSETS = [
+    '/hotel_price_analysis.html',
+    '/hotel_price_style.css',
+    '/hotel_price_app.js',
+    '/api/auth/check'
+]
+
+
+class ResumingHTTPSConnection(http.client.HTTPSConnection):
+    """前回のTLSセッションを渡して再開を試みるHTTPS接続"""
+
+    def __init__(self, host, port, ssl_context, session=None, timeout=10):
+        super().__init__(host, port, timeout=timeout, context=ssl_context)
+        self.ssl_context = ssl_context
+        self.session = session
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self.ssl_context.wrap_socket(self.sock, server_hostname=self.host,
+                                                 session=self.session)
+
+
+class Client:
+    """接続方式を切り替えられる計測用クライアント"""
+
+    def __init__(self, url, keep_alive, resume):
+        parts = urllib.parse.urlsplit(url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.keep_alive = keep_alive
+        self.resume = resume
+        self.cookie = ''
+        self.conn = None
+        self.session = None
+        self.handshakes = 0
+        self.resumed = 0
+        self.ssl_context = ssl.create_default_context()
+        # 自己署名証明書を許可
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+
+    def connection(self):
+        if self.conn is not None:
+            return self.conn
+        if self.https:
+            session = self.session if self.resume else None
+            self.conn = ResumingHTTPSConnection(self.host, self.port, self.ssl_context, session)
+        else:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        self.conn.connect()
+        if self.https:
+            self.handshakes += 1
+            self.resumed += int(self.conn.sock.session_reused)
+        return self.conn
+
+    def request(self, method, path, body=None):
+        headers = {'Cookie': self.cookie, 'Accept-Encoding': 'gzip'}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+
+        conn = self.connection()
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        data = response.read()
+        if response.getheader('Set-Cookie'):
+            self.cookie = response.getheader('Set-Cookie').split(';')[0]
+        if not self.keep_alive or response.will_close:
+            self.close()
+        return response.status, data
+
+    def close(self):
+        if self.conn is None:
+            return
+        if self.https:
+            # TLS 1.3 ではチケットがハンドシェイク後に届くので、閉じる直前のセッションを使う
+            self.session = self.conn.sock.session
+        self.conn.close()
+        self.conn = None
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def measure(url, username, password, assets, pages, keep_alive, resume):
+    client = Client(url, keep_alive, resume)
+    status, _ = client.request('POST', '/api/auth/login',
+                               urllib.parse.urlencode({'username': username, 'password': password}))
+    if status != 200:
+        raise SystemExit(f"ログインに失敗しました（HTTP {status}）")
+
+    request_times = []
+    page_times = []
+    for _ in range(pages):
+        page_start = time.perf_counter()
+        for path in assets:
+            start = time.perf_counter()
+            client.request('GET', path)
+            request_times.append(time.perf_counter() - start)
+        page_times.append(time.perf_counter() - page_start)
+    client.close()
+
+    return {
+        'request_mean_ms': sum(request_times) / len(request_times) * 1000,
+        'request_p95_ms': percentile(request_times, 95) * 1000,
+        'page_mean_ms': sum(page_times) / len(page_times) * 1000,
+        'handshakes': client.handshakes,
+        'resumed': client.resumed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='持続的接続とTLSセッション再開の効果測定')
+    parser.add_argument('--url', default='https://localhost:8443', help='サーバーのURL')
+    parser.add_argument('--username', default='hotel_viewer')
+    parser.add_argument('--password', default='View@2024')
+    parser.add_argument('--pages', type=int, default=20, help='ページ読み込みの回数')
+    parser.add_argument('--assets', default=','.join(DEFAULT_ASSETS), help='1ページで取得するパス')
+    args = parser.parse_args()
+    assets = args.assets.split(',')
+
+    modes = [
+        ('従来（毎回新規接続）', False, False),
+        ('新規接続＋TLS再開', False, True),
+        ('持続的接続＋TLS再開', True, True),
+    ]
+    print(f"対象: {args.url}  ページ数: {args.pages}  1ページ {len(assets)} リクエスト\n")
+    print(f"{'方式':<20} {'平均(ms)':>10} {'p95(ms)':>10} {'ページ(ms)':>11} {'接続':>6} {'再開':>6}")
+    print("-" * 70)
+    for label, keep_alive, resume in modes:
+        result = measure(args.url, args.username, args.password, assets, args.pages, keep_alive, resume)
+        print(f"{label:<20} {result['request_mean_ms']:>10.2f} {result['request_p95_ms']:>10.2f} "
+              f"{result['page_mean_ms']:>11.2f} {result['handshakes']:>6} {result['resumed']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+メトリクス
+リクエスト数・応答時間・送信バイト数などを集計し、Prometheus のテキスト形式で返す。
+
+記録はスレッドごとの辞書に足すだけでロックを取らない（スレッドが初めて記録するときだけ
+辞書を登録する）。取得時に全スレッド分を合計し、終了したスレッドの分は合計へ畳み込む。
+セッション数・キャッシュのヒット数などは取得時に関数を呼んで値を読む。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 応答時間のヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# ルートの分類（パス -> ルート名）。ラベルの種類が増えすぎないよう、それ以外は大まかに分ける
+ROUTES = {
+    '/api/auth/login': 'login', '/auth/login': 'login',
+    '/api/auth/check': 'check', '/auth/check': 'check',
+    '/api/auth/logout': 'logout', '/auth/logout': 'logout',
+    '/metrics': 'metrics',
+}
+
+
+def route_of(command, path):
+    """リクエストのルート名（login / check / logout / metrics / api / static / other）"""
+    path = (path or '').partition('?')[0]
+    route = ROUTES.get(path)
+    if route is not None:
+        return route
+    if path.startswith('/api/') or path.startswith('/auth/'):
+        return 'api'
+    if command in ('GET', 'HEAD'):
+        return 'static'
+    return 'other'
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class ShardedMetric:
+    """スレッドごとの辞書（ラベルの値 -> 値）に記録するメトリクスの基底クラス"""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # (スレッド, 辞書) の一覧と、終了したスレッドの分を畳み込んだ辞書
+        self.shards = []
+        self.retired = {}
+
+    def shard(self):
+        """このスレッドの辞書"""
+        try:
+            return self.local.values
+        except AttributeError:
+            values = self.local.values = {}
+            with self.lock:
+                self.shards.append((threading.current_thread(), values))
+            return values
+
+    def collect(self):
+        """全スレッドの合計（ラベルの値 -> 値）"""
+        with self.lock:
+            alive = []
+            for thread, values in self.shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    self.merge(self.retired, values)
+            self.shards = alive
+            total = {}
+            self.merge(total, self.retired)
+            for _, values in alive:
+                # 記録中のスレッドが項目を足しても壊れないよう、写しを取ってから合計する
+                self.merge(total, values.copy())
+        return total
+
+    def merge(self, total, values):
+        raise NotImplementedError
+
+    def render(self):
+        raise NotImplementedError
+
+
+class Counter(ShardedMetric):
+    """増えるだけの値"""
+
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        values = self.shard()
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def merge(self, total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self):
+        return [f'{self.name}{format_labels(self.labels, key)} {format_value(value)}'
+                for key, value in sorted(self.collect().items())]
+
+
+class Histogram(ShardedMetric):
+    """値の分布（境界ごとの件数と合計）"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        values = self.shard()
+        state = values.get(label_values)
+        if state is None:
+            # 境界ごとの件数（最後は +Inf）と合計
+            state = values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def time(self, *label_values):
+        """with 文で囲んだ処理の時間を記録する"""
+        return Timer(self, label_values)
+
+    def merge(self, total, values):
+        for key, (counts, value_sum) in values.items():
+            state = total.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += value_sum
+
+    def render(self):
+        lines = []
+        for key, (counts, value_sum) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = (('le', format_value(float(bound))),)
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_value(value_sum)}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+class CallbackMetric:
+    """取得時に関数を呼んで値を読むメトリクス
+
+    func は数値か、ラベルの値のタプル -> 数値 の辞書を返す。
+    """
+
+    def __init__(self, name, help, func, kind='gauge', labels=()):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+        self.labels = tuple(labels)
+
+    def render(self):
+        value = self.func()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{format_labels(self.labels, key)} {format_value(v)}'
+                for key, v in sorted(value.items())]
+
+
+class Registry:
+    """メトリクスの登録先（同じ名前で登録し直すと置き換える）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        # キャッシュ名 -> hits / misses を持つキャッシュ
+        self.caches = {}
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, func, labels=()):
+        return self.register(CallbackMetric(name, help, func, 'gauge', labels))
+
+    def register_cache(self, name, cache):
+        """hits / misses を数えているキャッシュを登録する（ヒット数・ミス数・ヒット率を出す）"""
+        with self.lock:
+            first = not self.caches
+            self.caches[name] = cache
+        if first:
+            self.register(CallbackMetric('cache_hits_total', 'キャッシュのヒット数',
+                                         lambda: self.cache_values('hits'), 'counter', ('cache',)))
+            self.register(CallbackMetric('cache_misses_total', 'キャッシュのミス数',
+                                         lambda: self.cache_values('misses'), 'counter', ('cache',)))
+            self.register(CallbackMetric('cache_hit_ratio', 'キャッシュのヒット率（起動時から）',
+                                         self.cache_ratios, 'gauge', ('cache',)))
+
+    def cache_values(self, attribute):
+        with self.lock:
+            caches = list(self.caches.items())
+        return {(name,): getattr(cache, attribute) for name, cache in caches}
+
+    def cache_ratios(self):
+        hits, misses = self.cache_values('hits'), self.cache_values('misses')
+        return {key: hits[key] / (hits[key] + misses[key]) if hits[key] + misses[key] else 0.0 for key in hits}
+
+    def render(self):
+        """Prometheus のテキスト形式"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter('http_requests_total', 'HTTPリクエスト数', ('route', 'code'))
+REQUEST_SECONDS = REGISTRY.histogram('http_request_duration_seconds', 'リクエストの処理時間（秒）', ('route',))
+RESPONSE_BYTES = REGISTRY.counter('http_response_bytes_total', '応答本文の送信バイト数', ('route',))
+SESSION_WRITE_SECONDS = REGISTRY.histogram('session_store_write_seconds',
+                                           'セッションストアへの書き込み時間（秒）', ('operation',))
+
+
+class MetricsMixin:
+    """BaseHTTPRequestHandler 用のミックスイン
+
+    リクエストごとにルート・ステータス・処理時間・Content-Length を記録する。
+    KeepAliveMixin と組み合わせるときはその後ろに置く（次のリクエストを待つ時間を含めない）。
+    """
+
+    def handle_one_request(self):
+        self.metrics_start = None
+        self.metrics_status = None
+        self.metrics_bytes = 0
+        super().handle_one_request()
+        if self.metrics_start is None or self.metrics_status is None:
+            return
+        route = route_of(self.command, self.path)
+        REQUESTS.inc(route, str(self.metrics_status))
+        REQUEST_SECONDS.observe(time.perf_counter() - self.metrics_start, route)
+        if self.metrics_bytes and self.command != 'HEAD':
+            RESPONSE_BYTES.inc(route, amount=self.metrics_bytes)
+
+    def parse_request(self):
+        # リクエスト行を読み終えたところから計る
+        self.metrics_start = time.perf_counter()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self.metrics_status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self.metrics_bytes = int(value)
+        super().send_header(keyword, value)
+
+    def send_metrics(self):
+        """メトリクスをテキスト形式で返す"""
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.send_common_headers()
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+パスワードハッシュ
+scrypt / PBKDF2 による低速KDFを専用のワーカープールで実行する
+
+ハッシュ文字列にはアルゴリズムとコストパラメータを含めるので、ユーザーごとに異なる
+コストで保存できる。従来の無塩SHA-256（16進64文字）も検証でき、ログイン時に
+needs_rehash() で判定して新しい形式へ移行する。
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DEFAULT_ALGORITHM = 'scrypt'
+DEFAULT_PARAMS = {
+    'scrypt': {'n': 2 ** 14, 'r': 8, 'p': 1},
+    'pbkdf2_sha256': {'iterations': 600000},
+}
+DEFAULT_WORKERS = max(2, os.cpu_count() or 2)
+# ワーカー数に対する待ち行列の倍率と、空きを待つ時間（秒）
+QUEUE_FACTOR = 8
+QUEUE_TIMEOUT = 5.0
+
+SALT_BYTES = 16
+SCRYPT_MAXMEM = 64 * 1024 * 1024
+LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class HashingBusy(Exception):
+    """ハッシュ処理の待ち行列が一杯"""
+
+
+def b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def derive(password, algorithm, params, salt):
+    """KDFで鍵を導出"""
+    if algorithm == 'scrypt':
+        return hashlib.scrypt(password.encode(), salt=salt, n=params['n'], r=params['r'],
+                              p=params['p'], maxmem=SCRYPT_MAXMEM)
+    if algorithm == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params['iterations'])
+    raise ValueError(f"未対応のアルゴリズム: {algorithm}")
+
+
+def hash_password(password, algorithm=DEFAULT_ALGORITHM, params=None):
+    """パスワードをハッシュ化（例: scrypt$16384$8$1$<salt>$<hash>）"""
+    params = params or DEFAULT_PARAMS[algorithm]
+    salt = os.urandom(SALT_BYTES)
+    digest = derive(password, algorithm, params, salt)
+    if algorithm == 'scrypt':
+        cost = f"{params['n']}${params['r']}${params['p']}"
+    else:
+        cost = f"{params['iterations']}"
+    return f"{algorithm}${cost}${b64encode(salt)}${b64encode(digest)}"
+
+
+def parse_hash(stored):
+    """ハッシュ文字列を (algorithm, params, salt, digest) に分解（不明な形式は None）"""
+    parts = stored.split('$')
+    try:
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            params = {'n': int(parts[1]), 'r': int(parts[2]), 'p': int(parts[3])}
+        elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            params = {'iterations': int(parts[1])}
+        else:
+            return None
+        return parts[0], params, base64.b64decode(parts[-2]), base64.b64decode(parts[-1])
+    except ValueError:
+        return None
+
+
+def verify_password(password, stored):
+    """パスワードを検証（従来のSHA-256形式にも対応）"""
+    if not stored:
+        return False
+    if LEGACY_SHA256.match(stored):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+    parsed = parse_hash(stored)
+    if parsed is None:
+        return False
+    algorithm, params, salt, digest = parsed
+    return hmac.compare_digest(derive(password, algorithm, params, salt), digest)
+
+
+class PasswordHasher:
+    """KDFを専用プールで実行するハッシャー
+
+    待ち行列は workers * QUEUE_FACTOR 件まで。空きが QUEUE_TIMEOUT 秒でできなければ
+    HashingBusy を送出するので、呼び出し側は 503 を返せばよい。
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, algorithm=DEFAULT_ALGORITHM, params=None,
+                 use_processes=False, queue_size=None, queue_timeout=QUEUE_TIMEOUT):
+        self.algorithm = algorithm
+        self.params = params or DEFAULT_PARAMS[algorithm]
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(queue_size or workers * QUEUE_FACTOR)
+        # hashlib の scrypt / pbkdf2_hmac はGILを解放するのでスレッドで並列に動く
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=workers)
+
+    def run(self, func, *args):
+        """プールで実行して結果を待つ"""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        """パスワードのハッシュ化"""
+        return self.run(hash_password, password, self.algorithm, self.params)
+
+    def verify(self, password, stored):
+        """パスワードの検証"""
+        return self.run(verify_password, password, stored)
+
+    def needs_rehash(self, stored):
+        """現在の設定でハッシュし直すべきかどうか（従来形式・コスト変更時）"""
+        parsed = parse_hash(stored or '')
+        if parsed is None:
+            return True
+        algorithm, params, _, _ = parsed
+        return algorithm != self.algorithm or params != self.params
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_default_hasher = None
+_default_lock = threading.Lock()
+
+
+def default_hasher():
+    """プロセス内で共有するハッシャー"""
+    global _default_hasher
+    with _default_lock:
+        if _default_hasher is None:
+            _default_hasher = PasswordHasher()
+        return _default_hasher
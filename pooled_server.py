@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+スレッドプール型HTTPサーバー
+接続ごとにスレッドを作らず、上限付きのワーカープールでリクエストを処理する
+"""
+
+import io
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# デフォルトのワーカー数（月末の同時利用30名以上を想定）
+DEFAULT_WORKERS = 32
+# ワーカー数に対する待ち行列の倍率（これを超えるとacceptを止めてバックプレッシャーをかける）
+QUEUE_FACTOR = 4
+# TLSハンドシェイクのタイムアウト（秒）
+HANDSHAKE_TIMEOUT = 10
+# 持続的接続のアイドルタイムアウト（秒）と1接続あたりの最大リクエスト数
+KEEPALIVE_TIMEOUT = 5
+MAX_KEEPALIVE_REQUESTS = 100
+
+
+class PooledTCPServer(socketserver.TCPServer):
+    """上限付きスレッドプールでリクエストを並行処理するTCPサーバー"""
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=DEFAULT_WORKERS,
+                 ssl_context=None, bind_and_activate=True):
+        self.max_workers = max_workers
+        self.ssl_context = ssl_context
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='hotel-http')
+        self.slots = threading.BoundedSemaphore(max_workers * QUEUE_FACTOR)
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        """リクエストをワーカープールに投入"""
+        # 待ち行列が一杯ならここで待つ（未acceptの接続はカーネルのbacklogに残る）
+        self.slots.acquire()
+        try:
+            self.executor.submit(self.process_request_worker, request, client_address)
+        except RuntimeError:
+            # シャットダウン中
+            self.slots.release()
+            self.shutdown_request(request)
+
+    def process_request_worker(self, request, client_address):
+        """ワーカースレッドでの処理（TLSハンドシェイクもここで行う）"""
+        try:
+            if self.ssl_context is not None:
+                try:
+                    request.settimeout(HANDSHAKE_TIMEOUT)
+                    request = self.ssl_context.wrap_socket(request, server_side=True)
+                    request.settimeout(None)
+                except OSError:
+                    # ハンドシェイク失敗は従来どおり黙って切断
+                    return
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+class BodyReader(io.RawIOBase):
+    """Content-Length 分だけ読めるリクエスト本文のストリーム"""
+
+    def __init__(self, rfile, length):
+        super().__init__()
+        self.rfile = rfile
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        n = self.rfile.readinto(memoryview(buffer)[:size])
+        if not n:
+            raise ConnectionError("リクエスト本文が途中で切れました")
+        self.remaining -= n
+        return n
+
+
+class KeepAliveMixin:
+    """BaseHTTPRequestHandler 用の HTTP/1.1 持続的接続ミックスイン
+
+    アイドル状態が KEEPALIVE_TIMEOUT 秒続くか、MAX_KEEPALIVE_REQUESTS 件処理したら接続を閉じる。
+    応答には必ず Content-Length を付けること。本文を読まなかったリクエストの後は接続を閉じる。
+    """
+
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    # ヘッダーと本文を別々に書くので、Nagle と遅延ACKで応答が遅れないようにする
+    disable_nagle_algorithm = True
+    max_keepalive_requests = MAX_KEEPALIVE_REQUESTS
+
+    def setup(self):
+        super().setup()
+        self.requests_handled = 0
+
+    def handle_one_request(self):
+        if self.requests_handled:
+            # 次のリクエストを待つ（アイドルタイムアウトはエラーとして記録しない）
+            try:
+                if not self.rfile.peek(1):
+                    self.close_connection = True
+                    return
+            except OSError:
+                self.close_connection = True
+                return
+
+        self.body_read = False
+        self.body_reader = None
+        super().handle_one_request()
+
+        # 読み残した本文が次のリクエストとして解釈されないようにする
+        headers = getattr(self, 'headers', None)
+        if headers is not None and not self.body_read and int(headers.get('Content-Length') or 0) > 0:
+            self.close_connection = True
+        if self.body_reader is not None and self.body_reader.remaining:
+            self.close_connection = True
+
+    def read_body(self):
+        """リクエスト本文を読む"""
+        self.body_read = True
+        content_length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(content_length)
+
+    def body_stream(self):
+        """リクエスト本文を少しずつ読むストリーム（読み切らなければ応答後に接続を閉じる）"""
+        self.body_read = True
+        self.body_reader = BodyReader(self.rfile, int(self.headers.get('Content-Length') or 0))
+        return self.body_reader
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        self.requests_handled += 1
+        if self.requests_handled >= self.max_keepalive_requests:
+            self.send_header('Connection', 'close')
+        elif not self.close_connection:
+            remaining = self.max_keepalive_requests - self.requests_handled
+            self.send_header('Keep-Alive', f'timeout={self.timeout}, max={remaining}')
+
+
+def create_server(server_address, handler_class, workers=DEFAULT_WORKERS, ssl_context=None):
+    """ワーカー数に応じてサーバーを作成（1以下なら従来のシングルスレッド）"""
+    if workers and workers > 1:
+        return PooledTCPServer(server_address, handler_class,
+                               max_workers=workers, ssl_context=ssl_context)
+
+    httpd = socketserver.TCPServer(server_address, handler_class)
+    if ssl_context is not None:
+        httpd.socket = ssl_context.wrap_socket(httpd.socket, server_side=True)
+    return httpd
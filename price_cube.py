@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+PriceCube（分析用の列指向料金データ）
+施設・部屋タイプ・プラン・URL・取得日時は辞書（重複のない文字列リスト）への番号、
+日付は 1970-01-01 からの日数（int32）、料金は円の int32、満室はビットマップで持つ。
+1つのバイナリファイルへ保存・読み込みできるほか、料金ストアのスナップショット
+（dataset_snapshot）をコピーせずに開ける。
+
+ファイル形式:
+    MAGIC(8) | ヘッダー長(uint32 LE) | ヘッダーJSON | 列データ（8バイト境界に揃える）
+ヘッダーには行数・辞書・各列の dtype / offset / 要素数を入れる。
+"""
+
+import json
+import os
+import struct
+from datetime import date
+
+import numpy as np
+
+MAGIC = b'PRCCUBE1'
+EPOCH = date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+ALIGNMENT = 8
+
+# 辞書で持つ列（数値の列はリトルエンディアン固定）
+DICTIONARY_COLUMNS = ('facility', 'room_type', 'plan_name', 'url', 'fetch_time')
+
+
+def day_to_iso(day):
+    return date.fromordinal(int(day) + EPOCH_ORDINAL).isoformat()
+
+
+def encode_strings(values):
+    """文字列の列を (番号の配列, 辞書) にする"""
+    uniques, codes = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    return codes.astype('<i4'), [str(value) for value in uniques]
+
+
+class PriceCube:
+    """列指向の料金データ（行の追加はせず、まとめて作って読むだけ）"""
+
+    def __init__(self, dictionaries, codes, day, price, guests, sold_out_bits=None):
+        self.dictionaries = dictionaries
+        self.codes = codes
+        self.day = day
+        self.price = price
+        self.guests = guests
+        # 満室ビットマップ（np.packbits 形式）。省略時は料金0を満室とする
+        self.sold_out_bits = np.packbits(price <= 0) if sold_out_bits is None else sold_out_bits
+
+    def __len__(self):
+        return len(self.price)
+
+    @property
+    def sold_out(self):
+        """行ごとの満室フラグ（bool配列）"""
+        return np.unpackbits(self.sold_out_bits, count=len(self)).astype(bool)
+
+    @property
+    def nbytes(self):
+        """列データと辞書の合計バイト数（辞書は UTF-8 換算）"""
+        total = self.day.nbytes + self.price.nbytes + self.guests.nbytes + self.sold_out_bits.nbytes
+        total += sum(codes.nbytes for codes in self.codes.values())
+        total += sum(len(value.encode()) for values in self.dictionaries.values() for value in values)
+        return total
+
+    @classmethod
+    def from_records(cls, records):
+        """画面側と同じ形式の辞書のリスト（facility / date / price / roomType / planName / url ...）から作る"""
+        columns = {name: [] for name in DICTIONARY_COLUMNS}
+        days, prices, guests = [], [], []
+        keys = {'facility': 'facility', 'room_type': 'roomType', 'plan_name': 'planName',
+                'url': 'url', 'fetch_time': 'fetchTime'}
+        for record in records:
+            for name, key in keys.items():
+                columns[name].append(record.get(key) or '')
+            days.append(date.fromisoformat(record['date']).toordinal() - EPOCH_ORDINAL)
+            prices.append(int(record.get('price') or 0))
+            guests.append(int(record.get('guests', 2)))
+
+        dictionaries, codes = {}, {}
+        for name in DICTIONARY_COLUMNS:
+            codes[name], dictionaries[name] = encode_strings(columns[name])
+        return cls(dictionaries, codes, np.array(days, dtype='<i4'), np.array(prices, dtype='<i4'),
+                   np.array(guests, dtype='<i2'))
+
+    @classmethod
+    def from_store(cls, store):
+        """price_store.PriceStore から作る（辞書はストアの StringPool をそのまま使う）
+
+        新しい行に置き換えられた行は含めない
+        """
+        with store.lock:
+            columns = store.columns
+            dictionaries = {name: list(store.pools[name].values) for name in DICTIONARY_COLUMNS}
+            codes = {name: np.array(columns[name], dtype='<i4') for name in DICTIONARY_COLUMNS}
+            day = np.array(columns['date'], dtype='<i4')
+            price = np.array(columns['price'], dtype='<i4')
+            guests = np.array(columns['guests'], dtype='<i2')
+            superseded = np.array(sorted(store.superseded), dtype=np.intp)
+        cube = cls(dictionaries, codes, day, price, guests)
+        return cube.without_rows(superseded) if len(superseded) else cube
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """PriceStore.save() したスナップショットから作る
+
+        列は mmap のまま使う（置き換えられた行があるときだけ、それを除いてコピーする）
+        """
+        dictionaries = {name: snapshot.dictionary(name) for name in DICTIONARY_COLUMNS}
+        codes = {name: snapshot.column(name) for name in DICTIONARY_COLUMNS}
+        cube = cls(dictionaries, codes, snapshot.column('date'), snapshot.column('price'),
+                   snapshot.column('guests'), snapshot.column('sold_out_bits'))
+        if 'superseded_rows' in snapshot and len(snapshot.column('superseded_rows')):
+            return cube.without_rows(snapshot.column('superseded_rows'))
+        return cube
+
+    def without_rows(self, rows):
+        """指定した行を除いた PriceCube（辞書は共有する）"""
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.asarray(rows, dtype=np.intp)] = False
+        codes = {name: values[keep] for name, values in self.codes.items()}
+        return PriceCube(self.dictionaries, codes, self.day[keep], self.price[keep], self.guests[keep])
+
+    def record(self, row):
+        """1行を画面側の形式の辞書にする"""
+        return {
+            'facility': self.dictionaries['facility'][self.codes['facility'][row]],
+            'date': day_to_iso(self.day[row]),
+            'price': int(self.price[row]),
+            'available': not (self.sold_out_bits[row >> 3] >> (7 - (row & 7))) & 1,
+            'roomType': self.dictionaries['room_type'][self.codes['room_type'][row]],
+            'planName': self.dictionaries['plan_name'][self.codes['plan_name'][row]],
+            'url': self.dictionaries['url'][self.codes['url'][row]],
+            'fetchTime': self.dictionaries['fetch_time'][self.codes['fetch_time'][row]],
+            'guests': int(self.guests[row])
+        }
+
+    def column_arrays(self):
+        """保存する列（名前 -> 配列）"""
+        arrays = {f'{name}_code': codes for name, codes in self.codes.items()}
+        arrays.update(day=self.day, price=self.price, guests=self.guests, sold_out_bits=self.sold_out_bits)
+        return arrays
+
+    def save(self, path):
+        """1つのバイナリファイルに保存"""
+        arrays = self.column_arrays()
+        layout, offset = {}, 0
+        for name, values in arrays.items():
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            layout[name] = {'dtype': values.dtype.str, 'offset': offset, 'length': len(values)}
+            offset += values.nbytes
+
+        header = json.dumps({'rows': len(self), 'dictionaries': self.dictionaries, 'columns': layout},
+                            ensure_ascii=False).encode()
+        data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header)) + header)
+            for name, values in arrays.items():
+                f.seek(data_start + layout[name]['offset'])
+                f.write(np.ascontiguousarray(values).tobytes())
+            # 末尾の列が空でもファイル長を揃える
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """save() したファイルを読み込み"""
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"PriceCube のファイルではありません: {path}")
+            header_length, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_length))
+            data = f.read()
+
+        data_start = -(-(len(MAGIC) + 4 + header_length) // ALIGNMENT) * ALIGNMENT
+        skip = data_start - len(MAGIC) - 4 - header_length
+        arrays = {}
+        for name, info in header['columns'].items():
+            arrays[name] = np.frombuffer(data, dtype=info['dtype'], count=info['length'],
+                                         offset=skip + info['offset'])
+        codes = {name: arrays[f'{name}_code'] for name in DICTIONARY_COLUMNS}
+        return cls(header['dictionaries'], codes, arrays['day'], arrays['price'], arrays['guests'],
+                   arrays['sold_out_bits'])
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+料金予測
+料金行列（price_pivot.PriceMatrix）を 施設×日付 の numpy 配列にして、全施設をまとめて予測する。
+予測方法:
+    seasonal_naive  前週の同じ曜日の料金
+    weekday_average 直近の移動平均 × 曜日ごとの係数
+    exponential     単純指数平滑
+予測区間は過去の予測誤差の標準偏差から正規分布で求める。
+満室・データなしの日は欠損として扱う。
+"""
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from price_pivot import CELL_PRICE
+
+METHODS = ('seasonal_naive', 'weekday_average', 'exponential')
+SEASON = 7
+DEFAULT_HORIZON = 14
+MAX_HORIZON = 90
+DEFAULT_INTERVAL = 0.8
+# weekday_average で使う直近の日数
+DEFAULT_WINDOW = 28
+# exponential の平滑化係数
+DEFAULT_ALPHA = 0.3
+
+
+def history_grid(matrix):
+    """行列を (最初の日, 施設×連続した日付の float 配列) にする。料金のない日は NaN"""
+    facilities, width = matrix.shape
+    if not facilities or not width:
+        return None, np.empty((facilities, 0))
+    dates = np.asarray(matrix.dates, dtype=np.int64)
+    values = np.frombuffer(matrix.values, dtype=np.int32, count=facilities * width).reshape(facilities, width)
+    mask = np.frombuffer(matrix.mask, dtype=np.uint8).reshape(facilities, width)
+
+    first_day = int(dates[0])
+    grid = np.full((facilities, int(dates[-1]) - first_day + 1), np.nan)
+    grid[:, dates - first_day] = np.where(mask == CELL_PRICE, values, np.nan)
+    return first_day, grid
+
+
+def nan_mean(values, axis):
+    """NaN を除いた平均（すべて NaN なら NaN。警告を出さない）"""
+    seen = ~np.isnan(values)
+    counts = seen.sum(axis=axis)
+    sums = np.where(seen, values, 0).sum(axis=axis)
+    return np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0)
+
+
+def residual_sigma(errors, axis=1):
+    """予測誤差の標準偏差（誤差がない施設は NaN）"""
+    return np.sqrt(nan_mean(errors ** 2, axis))
+
+
+def forward_fill(values):
+    """欠損を時間方向に直前の値で埋める"""
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return values[np.arange(len(values))[:, None], index]
+
+
+def seasonal_naive(grid, horizon):
+    """前週の同じ曜日の料金（その曜日の最後の実績。同じ曜日の実績がなければ最後の実績）"""
+    facilities, days = grid.shape
+    last_season = np.full((facilities, SEASON), np.nan)
+    for phase in range(SEASON):
+        # phase 番目の列は、最後の7日のうち phase 日目と同じ曜日
+        column = grid[:, (days - SEASON + phase) % SEASON::SEASON]
+        if column.shape[1]:
+            last_season[:, phase] = forward_fill(column)[:, -1]
+    last_value = forward_fill(grid)[:, -1:]
+    last_season = np.where(np.isnan(last_season), last_value, last_season)
+    steps = np.arange(horizon)
+    forecast = last_season[:, steps % SEASON]
+
+    sigma = residual_sigma(grid[:, SEASON:] - grid[:, :-SEASON])
+    # 何週先かに応じて広げる
+    spread = np.sqrt(steps // SEASON + 1)
+    return forecast, sigma[:, None] * spread
+
+
+def weekday_average(grid, horizon, first_day, window=DEFAULT_WINDOW):
+    """直近 window 日の平均に曜日ごとの係数（曜日平均 / 全体平均）を掛ける"""
+    facilities, days = grid.shape
+    recent = grid[:, max(0, days - window):]
+    recent_days = np.arange(days - recent.shape[1], days) + first_day
+    level = nan_mean(recent, 1)
+
+    factors = np.ones((facilities, SEASON))
+    weekdays = recent_days % SEASON
+    for weekday in range(SEASON):
+        columns = recent[:, weekdays == weekday]
+        if columns.shape[1]:
+            factors[:, weekday] = nan_mean(columns, 1) / level
+    factors[np.isnan(factors)] = 1.0
+
+    forecast_weekdays = (np.arange(horizon) + first_day + days) % SEASON
+    forecast = level[:, None] * factors[:, forecast_weekdays]
+    sigma = residual_sigma(recent - level[:, None] * factors[:, weekdays])
+    return forecast, np.repeat(sigma[:, None], horizon, axis=1)
+
+
+def exponential(grid, horizon, alpha=DEFAULT_ALPHA):
+    """単純指数平滑（施設ごとの水準を日付順に更新する。欠損の日は水準をそのまま）"""
+    facilities, days = grid.shape
+    level = np.full(facilities, np.nan)
+    squared_errors = np.zeros(facilities)
+    error_counts = np.zeros(facilities)
+    for day in range(days):
+        observed = grid[:, day]
+        seen = ~np.isnan(observed)
+        errors = observed - level
+        scored = seen & ~np.isnan(level)
+        squared_errors[scored] += errors[scored] ** 2
+        error_counts[scored] += 1
+        level = np.where(seen, np.where(np.isnan(level), observed, level + alpha * errors), level)
+
+    sigma = np.sqrt(np.divide(squared_errors, error_counts, out=np.full(facilities, np.nan),
+                              where=error_counts > 0))
+    # h 日先の予測誤差の分散は 1 + (h - 1) * alpha^2 倍
+    spread = np.sqrt(1 + np.arange(horizon) * alpha ** 2)
+    return np.repeat(level[:, None], horizon, axis=1), sigma[:, None] * spread
+
+
+class Forecast:
+    """施設ごとの予測値と予測区間（施設×予測日の配列）"""
+
+    def __init__(self, facilities, start_day, values, lower, upper, method, interval):
+        self.facilities = facilities
+        self.start_day = start_day
+        self.values = values
+        self.lower = lower
+        self.upper = upper
+        self.method = method
+        self.interval = interval
+
+    @property
+    def horizon(self):
+        return self.values.shape[1]
+
+    def to_json(self, format_date):
+        """JSON応答用（円に丸める。予測できない施設・日は null）"""
+        def rows(values):
+            rounded = np.rint(values)
+            return [[None if math.isnan(value) else int(value) for value in row] for row in rounded.tolist()]
+
+        dates = [] if self.start_day is None else [format_date(self.start_day + step)
+                                                   for step in range(self.horizon)]
+        return {
+            'method': self.method,
+            'interval': self.interval,
+            'facilities': self.facilities,
+            'dates': dates,
+            'forecast': rows(self.values),
+            'lower': rows(self.lower),
+            'upper': rows(self.upper)
+        }
+
+
+def forecast_matrix(matrix, method='weekday_average', horizon=DEFAULT_HORIZON, interval=DEFAULT_INTERVAL,
+                    window=DEFAULT_WINDOW, alpha=DEFAULT_ALPHA):
+    """行列の全施設を予測（最後のデータの翌日から horizon 日分）"""
+    if method not in METHODS:
+        raise ValueError(f"未対応の予測方法: {method}")
+    if not 1 <= horizon <= MAX_HORIZON or not 0 < interval < 1:
+        raise ValueError(horizon, interval)
+    if window < 1 or not 0 < alpha <= 1:
+        raise ValueError(window, alpha)
+
+    first_day, grid = history_grid(matrix)
+    if first_day is None:
+        empty = np.full((len(matrix.facilities), horizon), np.nan)
+        return Forecast(matrix.facilities, None, empty, empty, empty, method, interval)
+
+    if method == 'seasonal_naive':
+        values, sigma = seasonal_naive(grid, horizon)
+    elif method == 'weekday_average':
+        values, sigma = weekday_average(grid, horizon, first_day, window)
+    else:
+        values, sigma = exponential(grid, horizon, alpha)
+
+    z = NormalDist().inv_cdf((1 + interval) / 2)
+    lower = np.maximum(values - z * sigma, 0)
+    upper = values + z * sigma
+    return Forecast(matrix.facilities, first_day + grid.shape[1], values, lower, upper, method, interval)
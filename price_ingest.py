@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+スクレイピング結果CSVの逐次取り込み
+Shift-JIS（cp932）/ UTF-8 のCSVを受信しながらデコード・解析し、一定件数ごとに
+料金ストアへ書き込む。ファイル全体をメモリに載せないので、数百MBのCSVでも
+取り込み中のメモリ使用量はバッチ1つ分で済む。
+取り込み済みの行と重なるCSVを再アップロードした場合、追加されるのは新しい行と
+内容が変わった行だけ（price_store の識別キーで判定）。
+
+ヘッダーの対応は画面側（hotel_csv_parser.js）と同じ:
+取得日時, 検索条件, ホテル名, 日付, プラン名, 部屋名称/部屋タイプ, 料金, URL
+"""
+
+import codecs
+import csv
+import io
+import re
+
+from price_store import ADD_RESULTS, INT32_MAX, INT32_MIN, SKIPPED, parse_guests
+
+# ストアへまとめて書き込む件数
+BATCH_SIZE = 5000
+# 文字コード判定に使う先頭のバイト数
+DETECT_BYTES = 64 * 1024
+READ_BUFFER = 256 * 1024
+# 満室として料金0で取り込む表記
+CLOSED_MARKERS = ('CLOSE', 'CLOSED', '満室', '×')
+
+FULLWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+PRICE_NOISE = re.compile(r'[,，\s円¥￥]')
+
+
+class IngestError(ValueError):
+    """CSVとして取り込めない"""
+
+
+def header_map(header):
+    """ヘッダー行から列番号を求める（画面側の headerMap と同じ判定順）"""
+    columns = {}
+    for index, name in enumerate(header):
+        name = name.strip().lstrip('\ufeff')
+        if '日時' in name:
+            columns['fetch_time'] = index
+        elif '検索条件' in name:
+            columns['search_condition'] = index
+        elif 'ホテル名' in name or '施設' in name:
+            columns['facility'] = index
+        elif '日付' in name:
+            columns['date'] = index
+        elif 'プラン' in name:
+            columns['plan_name'] = index
+        elif '部屋' in name:
+            columns['room_type'] = index
+        elif '料金' in name or '価格' in name:
+            columns['price'] = index
+        elif 'URL' in name:
+            columns['url'] = index
+    return columns
+
+
+def parse_price(text):
+    """料金表記を整数に（満室表記は 0、読めない・int32 に収まらなければ None）"""
+    text = (text or '').strip()
+    if text.upper() in CLOSED_MARKERS:
+        return 0
+    normalized = PRICE_NOISE.sub('', text.translate(FULLWIDTH_DIGITS))
+    try:
+        price = int(float(normalized))
+    except (ValueError, OverflowError):
+        # inf や 1e400 など整数にできない表記も読めない料金として扱う
+        return None
+    return price if INT32_MIN <= price <= INT32_MAX else None
+
+
+def detect_encoding(sample):
+    """先頭のバイト列から文字コードを判定（UTF-8 として読めなければ cp932）"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # 途中で切れた多バイト文字はエラーにしない
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp932'
+
+
+def open_text(raw, encoding=None):
+    """バイトストリームを逐次デコードするテキストストリームにする"""
+    buffered = io.BufferedReader(raw, buffer_size=READ_BUFFER)
+    if encoding is None:
+        encoding = detect_encoding(buffered.peek(DETECT_BYTES)[:DETECT_BYTES])
+    elif encoding.lower().replace('-', '_') in ('shift_jis', 'sjis'):
+        # 機種依存文字（①、髙 など）を含むので cp932 で読む
+        encoding = 'cp932'
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise IngestError(f"未対応の文字コード: {encoding}")
+    return io.TextIOWrapper(buffered, encoding=encoding, errors='replace', newline=''), encoding
+
+
+def iter_records(text, default_guests=None):
+    """CSVの各行を add_batch 用のタプルにする（取り込めない行は None）"""
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        raise IngestError("CSVが空です")
+    columns = header_map(header)
+    missing = [name for name in ('facility', 'date', 'price') if name not in columns]
+    if missing:
+        raise IngestError(f"必要な列がありません: {', '.join(missing)}")
+
+    def cell(row, name):
+        index = columns.get(name)
+        return row[index] if index is not None and index < len(row) else ''
+
+    for row in reader:
+        if not row or not any(row):
+            continue
+        price = parse_price(cell(row, 'price'))
+        if price is None:
+            yield None
+            continue
+        guests = default_guests or parse_guests(cell(row, 'search_condition'))
+        yield (cell(row, 'facility').strip(), cell(row, 'date').strip(), price,
+               cell(row, 'room_type'), cell(row, 'plan_name'), cell(row, 'url'),
+               cell(row, 'fetch_time'), guests)
+
+
+def ingest_csv(raw, store, encoding=None, guests=None, batch_size=BATCH_SIZE):
+    """CSVを読みながら batch_size 件ごとにストアへ書き込み、結果ごとの件数を返す
+
+    inserted: 新しい行 / unchanged: 取り込み済みと同じ行 /
+    superseded: 取り込み済みの行と料金などが変わった行 / skipped: 読めない行
+    """
+    text, encoding = open_text(raw, encoding)
+    rows = 0
+    counts = dict.fromkeys(ADD_RESULTS, 0)
+    batch = []
+
+    def flush():
+        for result, count in store.add_batch(batch).items():
+            counts[result] += count
+        batch.clear()
+
+    for record in iter_records(text, guests):
+        rows += 1
+        if record is None:
+            counts[SKIPPED] += 1
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return dict(counts, encoding=encoding, rows=rows)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+料金ピボット（施設×日付の行列）
+料金ストアの検索結果を施設×日付の密な int32 行列と状態マスクにまとめる。
+同じ施設・日付の複数プランは最安値または中央値に集約する。
+行列は絞り込み条件ごとにキャッシュし、ストアの version が変わったら作り直す。
+"""
+
+import base64
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+# マスクの値
+CELL_PRICE = 0   # 料金あり
+CELL_CLOSED = 1  # 満室（CLOSE）
+CELL_EMPTY = 2   # データなし
+AGGREGATES = ('min', 'median')
+# キャッシュする行列の数
+PIVOT_CACHE_ENTRIES = 32
+
+
+def median_price(prices):
+    """中央値（偶数個のときは平均に近い方。画面側の中央値表示と同じ）"""
+    ordered = sorted(prices)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    mean = sum(ordered) / len(ordered)
+    low, high = ordered[middle - 1], ordered[middle]
+    return low if abs(low - mean) <= abs(high - mean) else high
+
+
+class PriceMatrix:
+    """施設×日付の料金行列（行優先、values[施設 * 日数 + 日付]）"""
+
+    def __init__(self, facilities, dates, values, mask, aggregate):
+        self.facilities = facilities
+        self.dates = dates
+        self.values = values
+        self.mask = mask
+        self.aggregate = aggregate
+        # 表のページング用（price_table が初回に作る）
+        self.row_stats = None
+        self.orderings = {}
+
+    @property
+    def shape(self):
+        return len(self.facilities), len(self.dates)
+
+    def cell(self, facility_index, date_index):
+        """(料金, マスク値)"""
+        i = facility_index * len(self.dates) + date_index
+        return self.values[i], self.mask[i]
+
+    def to_json(self, format_date):
+        """JSON応答用（行列はリトルエンディアンの int32 / uint8 を base64 で）"""
+        values = self.values
+        if sys.byteorder == 'big':
+            values = array('i', values)
+            values.byteswap()
+        return {
+            'aggregate': self.aggregate,
+            'facilities': self.facilities,
+            'dates': [format_date(ordinal) for ordinal in self.dates],
+            'shape': list(self.shape),
+            'dtype': 'int32',
+            'values': base64.b64encode(values.tobytes()).decode('ascii'),
+            'mask': base64.b64encode(bytes(self.mask)).decode('ascii'),
+            'mask_codes': {'price': CELL_PRICE, 'closed': CELL_CLOSED, 'empty': CELL_EMPTY}
+        }
+
+
+def build_matrix(store, rows, aggregate='min'):
+    """検索結果の行番号から行列を作る（施設は名前順、日付はデータのある日のみ）"""
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"未対応の集約方法: {aggregate}")
+
+    columns = store.columns
+    facility_column, date_column, price_column = columns['facility'], columns['date'], columns['price']
+    names = store.pools['facility'].values
+
+    facility_ids = sorted({facility_column[row] for row in rows}, key=names.__getitem__)
+    dates = sorted({date_column[row] for row in rows})
+    facility_pos = {facility_id: i for i, facility_id in enumerate(facility_ids)}
+    date_pos = {ordinal: i for i, ordinal in enumerate(dates)}
+    width = len(dates)
+    size = len(facility_ids) * width
+
+    values = array('i', bytes(4 * size))
+    mask = bytearray([CELL_EMPTY]) * size
+    groups = {}
+    for row in rows:
+        i = facility_pos[facility_column[row]] * width + date_pos[date_column[row]]
+        price = price_column[row]
+        if price <= 0:
+            if mask[i] == CELL_EMPTY:
+                mask[i] = CELL_CLOSED
+        elif aggregate == 'min':
+            if mask[i] != CELL_PRICE or price < values[i]:
+                values[i] = price
+                mask[i] = CELL_PRICE
+        else:
+            groups.setdefault(i, []).append(price)
+            mask[i] = CELL_PRICE
+
+    for i, prices in groups.items():
+        values[i] = median_price(prices)
+
+    return PriceMatrix([names[facility_id] for facility_id in facility_ids], dates, values, mask, aggregate)
+
+
+class PivotCache:
+    """絞り込み条件ごとの行列キャッシュ（LRU）"""
+
+    def __init__(self, max_entries=PIVOT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        """キャッシュがあれば返し、なければ build() で作る（version が違えば作り直す）"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = build()
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+期間集計の索引
+施設（× 人数）ごとに日付を軸にした配列を持ち、任意の期間の件数・合計・最小・最大を
+観測数によらず施設数に比例する時間で求める。
+
+    件数・合計    累積和（期間の両端の差）
+    最小・最大    日ごとの値と、BLOCK 日ごとの最小・最大のスパーステーブル
+                  （期間の中のブロックはテーブル2回の参照、両端の半端なブロックは直接見る）
+
+満室・置き換え済みの行は含めない。追加された行は日ごとの配列に足し、置き換えられた行は引いて
+（最小・最大だった行ならその日の値をストアの行から求め直して）、変わった系列の累積和とテーブルだけを作り直す。
+
+日付の配列は、日付の範囲が近い系列をまとめた「まとまり」（SeriesGroup）ごとに持つ。
+まとまりの日付の範囲はその系列の範囲だけを覆い、ストア全体の範囲には広げない。
+系列の範囲がまとまりを大きく（GROUP_GROWTH 倍を超えて）はみ出したら、その系列だけを
+覆える別のまとまりへ移す（誤った日付の行が1件あっても、広がるのはその系列の配列だけ）。
+配列は行・日数とも余裕を持って確保し、余りに収まらないときだけ広げてまとまり全体を作り直す。
+"""
+
+import threading
+
+import numpy as np
+
+from price_sketch import group_order, read_changes
+from price_store import parse_date
+
+# スパーステーブルを作るブロックの日数
+BLOCK = 16
+# 配列を広げるときに余分に確保する日数の下限（今の大きさの 1/4 と大きい方）と、
+# 行を広げるときに余分に確保するセル数の下限（日数の長いまとまりほど少ない行だけ足す）
+GROW_DAYS = 32
+GROW_CELLS = 64 * 400
+# まとまりの日数をこの倍（か GROUP_MIN_DAYS）まではそのまま広げ、それを超える系列は別のまとまりへ移す
+GROUP_GROWTH = 2
+GROUP_MIN_DAYS = 400
+NO_MIN = np.iinfo(np.int32).max
+NO_MAX = np.iinfo(np.int32).min
+
+
+def block_table(daily, reduce, empty):
+    """ブロックごとの最小（最大）と、それを 2^j ブロック分ずつまとめたスパーステーブル"""
+    series, days = daily.shape
+    blocks = -(-days // BLOCK)
+    padded = np.full((series, blocks * BLOCK), empty, dtype=np.int32)
+    padded[:, :days] = daily
+    table = [reduce.reduce(padded.reshape(series, blocks, BLOCK), axis=2)]
+    width = 1
+    while width * 2 <= blocks:
+        previous = table[-1]
+        table.append(reduce(previous[:, :-width], previous[:, width:]))
+        width *= 2
+    return table
+
+
+def range_extreme(daily, table, rows, first, last, reduce):
+    """rows の各系列の first〜last 日（配列の位置）の最小（最大）"""
+    first_block, last_block = first // BLOCK, last // BLOCK
+    if first_block == last_block:
+        return reduce.reduce(daily[rows, first:last + 1], axis=1)
+    result = reduce(reduce.reduce(daily[rows, first:(first_block + 1) * BLOCK], axis=1),
+                    reduce.reduce(daily[rows, last_block * BLOCK:last + 1], axis=1))
+    inner_first, inner_last = first_block + 1, last_block - 1
+    if inner_first <= inner_last:
+        level = (inner_last - inner_first + 1).bit_length() - 1
+        blocks = table[level]
+        result = reduce(result, reduce(blocks[rows, inner_first], blocks[rows, inner_last - (1 << level) + 1]))
+    return result
+
+
+class SeriesGroup:
+    """日付の範囲が近い系列をまとめた日ごとの値（確保した行 × 日）と累積和・スパーステーブル
+
+    使っていない行（他のまとまりへ移した系列の跡を含む）と、系列のない日は空
+    """
+
+    def __init__(self, first_day, days):
+        self.first_day = first_day
+        self.used = 0
+        self.count = np.zeros((0, days), dtype=np.int32)
+        self.total = np.zeros((0, days), dtype=np.int64)
+        self.low = np.full((0, days), NO_MIN, dtype=np.int32)
+        self.high = np.full((0, days), NO_MAX, dtype=np.int32)
+        # 累積和（行 × (日数 + 1)）とスパーステーブル。rebuild なら次の build_derived で全体を作り直す
+        self.count_prefix = np.zeros((0, days + 1), dtype=np.int32)
+        self.total_prefix = np.zeros((0, days + 1), dtype=np.int64)
+        self.low_table = []
+        self.high_table = []
+        self.rebuild = True
+
+    @property
+    def days(self):
+        return self.count.shape[1]
+
+    @property
+    def last_day(self):
+        return self.first_day + self.days - 1
+
+    @property
+    def nbytes(self):
+        arrays = [self.count, self.total, self.low, self.high, self.count_prefix, self.total_prefix]
+        return sum(array.nbytes for array in arrays + self.low_table + self.high_table)
+
+    def covers(self, first, last):
+        return self.first_day <= first and last <= self.last_day
+
+    def can_grow(self, first, last):
+        """[first, last] まで広げてもよいか"""
+        days = max(last, self.last_day) - min(first, self.first_day) + 1
+        return days <= max(GROUP_MIN_DAYS, self.days * GROUP_GROWTH)
+
+    def grow(self, first, last):
+        """[first, last] を覆うよう日付の範囲を広げる（余分に GROW_DAYS か 1/4 を足す）"""
+        before = after = 0
+        if first < self.first_day:
+            before = self.first_day - first + max(GROW_DAYS, self.days // 4)
+        if last > self.last_day:
+            after = last - self.last_day + max(GROW_DAYS, self.days // 4)
+        if before or after:
+            self.pad(0, before, after)
+            self.first_day -= before
+
+    def new_row(self):
+        """空いている行の番号（足りなければ行を広げる）"""
+        if self.used == self.count.shape[0]:
+            self.pad(max(1, self.used // 4, GROW_CELLS // self.days), 0, 0)
+        self.used += 1
+        return self.used - 1
+
+    def pad(self, rows, before, after):
+        padding = ((0, rows), (before, after))
+        self.count = np.pad(self.count, padding)
+        self.total = np.pad(self.total, padding)
+        self.low = np.pad(self.low, padding, constant_values=NO_MIN)
+        self.high = np.pad(self.high, padding, constant_values=NO_MAX)
+        self.rebuild = True
+
+    def build_derived(self, rows):
+        """累積和とスパーステーブルを作る（作り直しが必要でなければ rows の行だけ）"""
+        if self.rebuild:
+            self.count_prefix = np.zeros((self.count.shape[0], self.days + 1), dtype=np.int32)
+            self.total_prefix = np.zeros((self.count.shape[0], self.days + 1), dtype=np.int64)
+            np.cumsum(self.count, axis=1, out=self.count_prefix[:, 1:])
+            np.cumsum(self.total, axis=1, out=self.total_prefix[:, 1:])
+            self.low_table = block_table(self.low, np.minimum, NO_MIN)
+            self.high_table = block_table(self.high, np.maximum, NO_MAX)
+            self.rebuild = False
+            return
+
+        self.count_prefix[rows, 1:] = np.cumsum(self.count[rows], axis=1)
+        self.total_prefix[rows, 1:] = np.cumsum(self.total[rows], axis=1)
+        for table, daily, reduce, empty in ((self.low_table, self.low, np.minimum, NO_MIN),
+                                            (self.high_table, self.high, np.maximum, NO_MAX)):
+            for level, blocks in enumerate(block_table(daily[rows], reduce, empty)):
+                table[level][rows] = blocks
+
+    def query(self, rows, start_day, end_day):
+        """rows の行の期間の (件数, 合計, 最小, 最大)。期間がまとまりの外なら None"""
+        first = 0 if start_day is None else max(0, start_day - self.first_day)
+        last = self.days - 1 if end_day is None else min(self.days - 1, end_day - self.first_day)
+        if first > last:
+            return None
+        count = self.count_prefix[rows, last + 1] - self.count_prefix[rows, first]
+        total = self.total_prefix[rows, last + 1] - self.total_prefix[rows, first]
+        low = range_extreme(self.low, self.low_table, rows, first, last, np.minimum)
+        high = range_extreme(self.high, self.high_table, rows, first, last, np.maximum)
+        return count, total, low, high
+
+
+class RangeIndex:
+    """(人数, 施設) ごとの日付配列による期間集計"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.rows = 0
+        self.superseded = 0
+        # (人数, 施設番号) -> 系列番号
+        self.series = {}
+        self.series_guests = np.empty(0, dtype=np.int64)
+        self.series_facility = np.empty(0, dtype=np.int64)
+        # 系列ごとのまとまりの番号・まとまりの中の行と、取り込んだ行の日付の範囲
+        self.series_group = np.empty(0, dtype=np.int64)
+        self.series_row = np.empty(0, dtype=np.int64)
+        self.series_first = np.empty(0, dtype=np.int64)
+        self.series_last = np.empty(0, dtype=np.int64)
+        self.groups = []
+
+    @property
+    def nbytes(self):
+        return sum(group.nbytes for group in self.groups)
+
+    def refresh(self, store):
+        """ストアに追加された行を足し、置き換えられた行を引く"""
+        with self.lock:
+            changes = read_changes(store, self.rows, self.superseded)
+            if changes is None:
+                return
+            n, superseded, added, removed = changes
+            changed = np.union1d(self.add_daily(*added), self.remove_daily(store, n, *removed))
+            self.build_derived(changed)
+            self.rows, self.superseded = n, superseded
+
+    def add(self, guests, facility, day, price):
+        """行（人数, 施設番号, 日付, 料金 の配列）を足し、変わった系列の累積和とテーブルを作り直す"""
+        self.build_derived(self.add_daily(guests, facility, day, price))
+
+    def cells(self, series, day):
+        """系列・日付の配列を (まとまりの番号, 行, 日の位置) にする"""
+        groups = self.series_group[series]
+        first_days = np.array([group.first_day for group in self.groups], dtype=np.int64)
+        return groups, self.series_row[series], day - first_days[groups]
+
+    def add_daily(self, guests, facility, day, price):
+        """行を日ごとの値に足して、変わった系列を返す"""
+        if not len(price):
+            return np.empty(0, dtype=np.int64)
+        pairs, inverse = np.unique((guests << 32) | facility, return_inverse=True)
+        keys = [(pair >> 32, pair & 0xffffffff) for pair in pairs.tolist()]
+        series = self.series_numbers(keys)
+        first = np.full(len(keys), np.iinfo(np.int64).max)
+        last = np.full(len(keys), np.iinfo(np.int64).min)
+        np.minimum.at(first, inverse, day)
+        np.maximum.at(last, inverse, day)
+        self.place(series, first, last)
+        series = series[inverse]
+
+        groups, rows, offsets = self.cells(series, day)
+        order, starts = group_order(groups, rows, offsets)
+        groups, rows, offsets, price = groups[order], rows[order], offsets[order], price[order]
+        heads = starts[:-1]
+        sizes = np.diff(starts).astype(np.int32)
+        sums = np.add.reduceat(price, heads)
+        lows = np.minimum.reduceat(price, heads)
+        highs = np.maximum.reduceat(price, heads)
+        for number in np.unique(groups[heads]).tolist():
+            group = self.groups[number]
+            cells = groups[heads] == number
+            cell_rows, cell_offsets = rows[heads][cells], offsets[heads][cells]
+            group.count[cell_rows, cell_offsets] += sizes[cells]
+            group.total[cell_rows, cell_offsets] += sums[cells]
+            group.low[cell_rows, cell_offsets] = np.minimum(group.low[cell_rows, cell_offsets], lows[cells])
+            group.high[cell_rows, cell_offsets] = np.maximum(group.high[cell_rows, cell_offsets], highs[cells])
+        return np.unique(series)
+
+    def series_numbers(self, keys):
+        """(人数, 施設番号) の系列番号の配列（新しい系列はまだどのまとまりにも置かない）"""
+        new_keys = [key for key in keys if key not in self.series]
+        for key in new_keys:
+            self.series[key] = len(self.series)
+        if new_keys:
+            extra = len(new_keys)
+            self.series_guests = np.append(self.series_guests, [key[0] for key in new_keys])
+            self.series_facility = np.append(self.series_facility, [key[1] for key in new_keys])
+            self.series_group = np.append(self.series_group, np.full(extra, -1))
+            self.series_row = np.append(self.series_row, np.full(extra, -1))
+            self.series_first = np.append(self.series_first, np.full(extra, np.iinfo(np.int64).max))
+            self.series_last = np.append(self.series_last, np.full(extra, np.iinfo(np.int64).min))
+        return np.array([self.series[key] for key in keys], dtype=np.int64)
+
+    def place(self, series, first, last):
+        """系列の日付の範囲を [first, last] まで広げ、それを覆うまとまりに置く"""
+        first = np.minimum(first, self.series_first[series])
+        last = np.maximum(last, self.series_last[series])
+        self.series_first[series], self.series_last[series] = first, last
+        for number, low, high in zip(series.tolist(), first.tolist(), last.tolist()):
+            current = self.series_group[number]
+            if current >= 0:
+                group = self.groups[current]
+                if group.covers(low, high):
+                    continue
+                if group.can_grow(low, high):
+                    group.grow(low, high)
+                    continue
+            self.move(number, self.group_for(low, high))
+
+    def group_for(self, first, last):
+        """[first, last] を覆える（広げれば覆える）まとまりの番号。なければ作る"""
+        for number, group in enumerate(self.groups):
+            if group.covers(first, last):
+                return number
+        for number, group in enumerate(self.groups):
+            if group.can_grow(first, last):
+                group.grow(first, last)
+                return number
+        days = last - first + 1
+        self.groups.append(SeriesGroup(first, days + max(GROW_DAYS, days // 4)))
+        return len(self.groups) - 1
+
+    def move(self, series, number):
+        """系列を別のまとまりの新しい行へ移す（日ごとの値も写す）"""
+        target = self.groups[number]
+        row = target.new_row()
+        current = self.series_group[series]
+        if current >= 0:
+            source, source_row = self.groups[current], self.series_row[series]
+            # 取り込んだ日付の範囲は移す先が覆っている
+            first = max(source.first_day, target.first_day)
+            last = min(source.last_day, target.last_day)
+            if first <= last:
+                source_days = slice(first - source.first_day, last - source.first_day + 1)
+                target_days = slice(first - target.first_day, last - target.first_day + 1)
+                for name in ('count', 'total', 'low', 'high'):
+                    getattr(target, name)[row, target_days] = getattr(source, name)[source_row, source_days]
+            source.count[source_row] = 0
+            source.total[source_row] = 0
+            source.low[source_row] = NO_MIN
+            source.high[source_row] = NO_MAX
+            source.build_derived([source_row])
+        # 移した先の行の累積和・テーブルは、変わった系列として build_derived で作る
+        self.series_group[series], self.series_row[series] = number, row
+
+    def remove_daily(self, store, n, guests, facility, day, price):
+        """置き換えられた行を日ごとの値から引いて、変わった系列を返す
+
+        最小・最大だった値が引かれた日は、その施設の行（n 行目まで）から求め直す
+        """
+        if not len(price):
+            return np.empty(0, dtype=np.int64)
+        series = np.array([self.series[key] for key in zip(guests.tolist(), facility.tolist())], dtype=np.int64)
+        order, starts = group_order(series, day)
+        series, day, price = series[order], day[order], price[order]
+        heads = starts[:-1]
+        cell_series, cell_days = series[heads], day[heads]
+        groups, rows, offsets = self.cells(cell_series, cell_days)
+        sizes = np.diff(starts).astype(np.int32)
+        sums = np.add.reduceat(price, heads)
+        lows = np.minimum.reduceat(price, heads)
+        highs = np.maximum.reduceat(price, heads)
+        stale = np.zeros(len(heads), dtype=bool)
+        for number in np.unique(groups).tolist():
+            group = self.groups[number]
+            cells = groups == number
+            cell_rows, cell_offsets = rows[cells], offsets[cells]
+            group.count[cell_rows, cell_offsets] -= sizes[cells]
+            group.total[cell_rows, cell_offsets] -= sums[cells]
+            stale[cells] = ((lows[cells] <= group.low[cell_rows, cell_offsets])
+                            | (highs[cells] >= group.high[cell_rows, cell_offsets]))
+        self.recompute_extremes(store, n, cell_series[stale], cell_days[stale])
+        return np.unique(cell_series)
+
+    def recompute_extremes(self, store, n, series, days):
+        """系列・日の最小・最大を、その施設のストアの行（n 行目まで。置き換え済みを除く）から求め直す"""
+        for number in np.unique(series).tolist():
+            stale_days = days[series == number]
+            group, row = self.groups[self.series_group[number]], self.series_row[number]
+            guests, facility = int(self.series_guests[number]), int(self.series_facility[number])
+            with store.lock:
+                candidates = np.frombuffer(store.by_facility.get(facility, b''), dtype=np.int32)
+                candidates = candidates[candidates < n]
+                day, price, row_guests = (np.frombuffer(store.columns[name], dtype=np.int32)[candidates]
+                                          for name in ('date', 'price', 'guests'))
+                keep = (row_guests == guests) & (price > 0) & np.isin(day, stale_days)
+                keep[keep] = [r not in store.superseded for r in candidates[keep].tolist()]
+            group.low[row, stale_days - group.first_day] = NO_MIN
+            group.high[row, stale_days - group.first_day] = NO_MAX
+            np.minimum.at(group.low[row], day[keep] - group.first_day, price[keep])
+            np.maximum.at(group.high[row], day[keep] - group.first_day, price[keep])
+
+    def build_derived(self, series):
+        """変わった系列のまとまりの累積和とテーブルを作り直す"""
+        groups, rows = self.series_group[series], self.series_row[series]
+        for number, group in enumerate(self.groups):
+            if group.rebuild or (groups == number).any():
+                group.build_derived(rows[groups == number])
+
+    def query(self, start_day=None, end_day=None, facility_ids=None, guests=None):
+        """期間の施設ごとの (施設番号, 件数, 合計, 最小, 最大) の配列。該当なしは None"""
+        with self.lock:
+            selected = np.ones(len(self.series), dtype=bool)
+            if facility_ids is not None:
+                selected &= np.isin(self.series_facility, list(facility_ids))
+            if guests is not None:
+                selected &= self.series_guests == guests
+            parts = []
+            for number, group in enumerate(self.groups):
+                series = np.flatnonzero(selected & (self.series_group == number))
+                if not len(series):
+                    continue
+                values = group.query(self.series_row[series], start_day, end_day)
+                if values is not None:
+                    parts.append((self.series_facility[series], *values))
+            if not parts:
+                return None
+            facility, count, total, low, high = (np.concatenate(column) for column in zip(*parts))
+
+        # 施設ごとにまとめる（人数を指定しなければ人数ごとの系列を合わせる）
+        facilities, inverse = np.unique(facility, return_inverse=True)
+        merged = [np.zeros(len(facilities), dtype=np.int64), np.zeros(len(facilities), dtype=np.int64),
+                  np.full(len(facilities), NO_MIN, dtype=np.int32), np.full(len(facilities), NO_MAX, dtype=np.int32)]
+        for reduce, column, values in zip((np.add, np.add, np.minimum, np.maximum), merged, (count, total, low, high)):
+            reduce.at(column, inverse, values)
+        keep = merged[0] > 0
+        return (facilities[keep], *(column[keep] for column in merged))
+
+    def stats(self, store, start=None, end=None, facilities=None, guests=None):
+        """期間の施設ごとの統計と全体の統計（先にストアの追加分を取り込む）"""
+        self.refresh(store)
+        facility_ids = None
+        if facilities is not None:
+            pool = store.pools['facility'].ids
+            facility_ids = [pool[name] for name in facilities if name in pool]
+        result = self.query(parse_date(start) if start else None, parse_date(end) if end else None,
+                            facility_ids, guests)
+        if result is None:
+            result = (np.empty(0, dtype=np.int64),) * 5
+        facility_ids, count, total, low, high = result
+
+        names = store.pools['facility'].values
+        rows = [{'facility': names[facility_id], 'count': int(n), 'average': round(int(s) / int(n)),
+                 'min': int(minimum), 'max': int(maximum)}
+                for facility_id, n, s, minimum, maximum in zip(facility_ids.tolist(), count, total, low, high)]
+        rows.sort(key=lambda row: row['facility'])
+        overall_count = int(count.sum())
+        overall = {
+            'count': overall_count,
+            'average': round(int(total.sum()) / overall_count) if overall_count else None,
+            'min': int(low.min()) if overall_count else None,
+            'max': int(high.max()) if overall_count else None
+        }
+        return {'overall': overall, 'facilities': rows}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+曜日・祝日別の料金集計表
+料金ストアの行（満室・置き換え済みを除く）を
+    人数 × 施設 × 月 × 曜日 × 祝日かどうか
+のセルにまとめ、セルごとに件数・合計・最小・最大と分位点スケッチを持つ。
+施設で絞らない集計用に、施設をまとめた 人数 × 月 × 曜日 × 祝日かどうか のセルも持つ。
+曜日別・祝日別のグラフはセルを足し合わせるだけで作れるので、集計にかかる時間は
+行数ではなくセルの数で決まる（全施設の集計は施設数にもよらない）。
+取り込みのたびに追加された行だけをセルに足す（置き換えられた行があれば作り直す）。
+"""
+
+import threading
+from array import array
+
+import numpy as np
+
+from japanese_holidays import HolidayCalendar
+from price_sketch import DEFAULT_K, KLLSketch, describe, group_order, read_new_rows
+
+WEEKDAY_NAMES = ('日', '月', '火', '水', '木', '金', '土')
+GROUPS = ('weekday', 'holiday', 'weekday_holiday', 'month')
+KEY_COLUMNS = ('guests', 'facility', 'month', 'weekday', 'holiday')
+# 施設をまとめたセルのキー
+ALL_FACILITY_COLUMNS = ('guests', 'month', 'weekday', 'holiday')
+# セルごとのスケッチの大きさ（施設ごとのセルは小さいので問い合わせ用より小さくする）
+ROLLUP_K = 64
+ALL_FACILITY_K = DEFAULT_K
+
+
+def weekday_of(days):
+    """1970-01-01 からの日数の曜日（日曜 = 0。画面側の getDay() と同じ）"""
+    return (np.asarray(days, dtype=np.int64) + 4) % 7
+
+
+def month_of(days):
+    """1970-01-01 からの日数を 1970年1月からの月数にする"""
+    return np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def format_month(month):
+    year, month = divmod(int(month), 12)
+    return f"{1970 + year:04d}-{month + 1:02d}"
+
+
+class RollupCells:
+    """キー列の組ごとのセル（件数・合計・最小・最大と分位点スケッチ）"""
+
+    def __init__(self, key_columns, k):
+        self.key_columns = key_columns
+        self.k = k
+        self.clear()
+
+    def clear(self):
+        # キー -> セル番号
+        self.cells = {}
+        self.keys = {name: array('q') for name in self.key_columns}
+        self.counts = array('q')
+        self.sums = array('q')
+        self.mins = array('q')
+        self.maxs = array('q')
+        self.sketches = []
+
+    def __len__(self):
+        return len(self.sketches)
+
+    def add(self, columns, price):
+        """行（キー列名 -> 配列, 料金の配列）をセルに足す"""
+        keys = [columns[name] for name in self.key_columns]
+        order, starts = group_order(*keys)
+        keys = [key[order] for key in keys]
+        price = price[order]
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            key = tuple(int(column[lo]) for column in keys)
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = len(self.sketches)
+                for name, value in zip(self.key_columns, key):
+                    self.keys[name].append(value)
+                for column in (self.counts, self.sums, self.mins, self.maxs):
+                    column.append(0)
+                self.sketches.append(KLLSketch(self.k))
+            sketch = self.sketches[cell].update_many(price[lo:hi])
+            self.counts[cell], self.sums[cell] = sketch.count, sketch.total
+            self.mins[cell], self.maxs[cell] = sketch.min, sketch.max
+
+    def query(self, group, start_month=None, end_month=None, facility_ids=None, guests=None):
+        """group の値 -> 統計 の組のリスト"""
+        keys = {name: np.array(column, dtype=np.int64) for name, column in self.keys.items()}
+        selected = np.ones(len(self), dtype=bool)
+        if guests is not None:
+            selected &= keys['guests'] == guests
+        if facility_ids is not None:
+            selected &= np.isin(keys['facility'], list(facility_ids))
+        if start_month is not None:
+            selected &= keys['month'] >= start_month
+        if end_month is not None:
+            selected &= keys['month'] <= end_month
+
+        if group == 'weekday_holiday':
+            groups = keys['weekday'] * 2 + keys['holiday']
+        else:
+            groups = keys['month' if group == 'month' else group]
+        counts, sums = np.array(self.counts), np.array(self.sums)
+        mins, maxs = np.array(self.mins), np.array(self.maxs)
+
+        result = []
+        for value in np.unique(groups[selected]).tolist():
+            cells = np.flatnonzero(selected & (groups == value))
+            # セルのスケッチは小さいので、結合せずに要素をまとめて分位点を求める
+            items = [self.sketches[cell].items() for cell in cells.tolist()]
+            values = np.concatenate([cell_values for cell_values, _ in items])
+            levels = np.concatenate([cell_levels for _, cell_levels in items])
+            result.append((value, describe(values, levels, (int(counts[cells].sum()), int(sums[cells].sum()),
+                                                            int(mins[cells].min()), int(maxs[cells].max())))))
+        return result
+
+
+class PriceRollup:
+    """人数 × 施設 × 月 × 曜日 × 祝日 の集計表（と施設をまとめた集計表）"""
+
+    def __init__(self, calendar=None, k=ROLLUP_K):
+        self.calendar = calendar or HolidayCalendar()
+        self.by_facility = RollupCells(KEY_COLUMNS, k)
+        self.all_facilities = RollupCells(ALL_FACILITY_COLUMNS, ALL_FACILITY_K)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.rows = 0
+        self.superseded = 0
+        self.by_facility.clear()
+        self.all_facilities.clear()
+
+    def __len__(self):
+        return len(self.by_facility)
+
+    def refresh(self, store):
+        """ストアに追加された行をセルに足す（置き換えられた行があれば作り直す）"""
+        with self.lock:
+            changes = read_new_rows(store, self.rows, self.superseded)
+            if changes is None:
+                return
+            n, superseded, rebuild, columns = changes
+            if rebuild:
+                self.clear()
+            self.add(*columns)
+            self.rows, self.superseded = n, superseded
+
+    def add(self, guests, facility, day, price):
+        """行（人数, 施設番号, 日付, 料金 の配列）をセルに足す"""
+        columns = {'guests': guests, 'facility': facility, 'month': month_of(day), 'weekday': weekday_of(day),
+                   'holiday': self.calendar.is_holiday(day).astype(np.int64)}
+        self.by_facility.add(columns, price)
+        self.all_facilities.add(columns, price)
+
+    def query(self, group='weekday', start_month=None, end_month=None, facility_ids=None, guests=None):
+        """group ごとの件数・平均・最小・最大・p10・中央値・p90 の行"""
+        if group not in GROUPS:
+            raise ValueError(f"未対応の集計単位: {group}")
+        with self.lock:
+            if facility_ids is None:
+                groups = self.all_facilities.query(group, start_month, end_month, guests=guests)
+            else:
+                groups = self.by_facility.query(group, start_month, end_month, facility_ids, guests)
+        return [dict(self.group_label(group, value), **stats) for value, stats in groups]
+
+    def group_label(self, group, value):
+        if group == 'weekday':
+            return {'weekday': value, 'label': WEEKDAY_NAMES[value]}
+        if group == 'holiday':
+            return {'holiday': bool(value), 'label': '祝日' if value else '祝日以外'}
+        if group == 'weekday_holiday':
+            weekday, holiday = divmod(value, 2)
+            return {'weekday': weekday, 'holiday': bool(holiday),
+                    'label': WEEKDAY_NAMES[weekday] + ('・祝' if holiday else '')}
+        return {'month': format_month(value), 'label': format_month(value)}
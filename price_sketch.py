@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+"""
+料金の分位点スケッチ
+KLL スケッチで料金の分布を要約し、中央値・10 / 90 パーセンタイルを生の行を
+並べ替えずに求める。スケッチ同士は結合でき、結合しても誤差の上限は変わらない
+（k=200 で順位の誤差はおおむね 1% 以内）。
+
+SketchIndex は料金ストアの行（満室・置き換え済みを除く）から
+    施設 × 人数 × 日付 ごとのスケッチ（葉。連続した配列にまとめて持つ）
+    施設 × 人数 ごとに葉を 2, 4, 8, ... 日単位にまとめたスケッチ（ノード。行数の多いものだけ持つ）
+    人数 × 日付 ごとのスケッチを 1, 2, 4, ... 日単位にまとめた木
+    施設 × 人数 ごとの全期間のスケッチ
+を作り、絞り込み条件に合うスケッチだけを結合して答える。
+施設と日付の範囲で絞るときは、範囲を覆うノード（なければその日の葉）を施設ごとに結合するので、
+読む要素数は期間の長さではなく k × 段数 で抑えられる。
+追加された行はスケッチに足していく。KLL スケッチは行を取り除けないので、置き換えられた行が
+あったときは、その行の施設 × 人数 の組と 人数 × 日付 のスケッチだけを現在の行から作り直す
+（ストアの列を numpy で1回読み、該当する行だけを使う。日付の木の上の段は子の結合で作り直す）。
+葉は組ごとの要素を入れ替えて並べ直すので、追加行がたまったときの作り直しと同じ手間がかかる。
+"""
+
+import math
+import random
+import threading
+
+import numpy as np
+
+from price_store import parse_date
+
+DEFAULT_K = 200
+MIN_CAPACITY = 8
+QUANTILES = {'p10': 0.1, 'median': 0.5, 'p90': 0.9}
+# 日付の木の段数（2^12 日 = 約11年を1つのスケッチで覆える）
+DAY_TREE_LEVELS = 13
+# 葉に入っていない追加行がこれ（と葉の要素数の 1/8）を超えたら葉を作り直す
+LEAF_REBUILD_ROWS = 100000
+# 施設 × 人数 の日付の木で、行数が k のこの倍を超えるノードだけスケッチを持つ（それ以外は葉を読む）
+NODE_MIN_FACTOR = 2
+# 葉・ノードのキーで日付（ノードの番号）に使うビット数と、段の位置
+DAY_BITS = 24
+LEVEL_SHIFT = 56
+# 葉・ノードのキーでは日付にこれを足す（1970年より前の負の日付も 0 以上にする）。
+# 2^(DAY_TREE_LEVELS - 1) の倍数なので、ノードの番号は >> 段 で求めてから (DAY_OFFSET >> 段) を足しても同じ
+DAY_OFFSET = 1 << (DAY_BITS - 1)
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+class KLLSketch:
+    """KLL 分位点スケッチ（levels[h] の要素は 2^h 行分を表す）
+
+    件数・合計・最小・最大は正確に持つ
+    """
+
+    # 集計表のセルごとに持つので、インスタンスの辞書を作らない
+    __slots__ = ('k', 'levels', 'count', 'total', 'min', 'max')
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.levels = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def capacity(self, level):
+        """段ごとの上限（上の段ほど大きい）"""
+        depth = len(self.levels) - level - 1
+        return max(MIN_CAPACITY, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update_many(self, values):
+        """値をまとめて追加"""
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.total += int(values.sum())
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.add_items(0, values)
+        self.compress()
+        return self
+
+    def merge(self, other):
+        """別のスケッチを結合"""
+        if not other.count:
+            return self
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        for level, items in enumerate(other.levels):
+            if len(items):
+                self.add_items(level, items)
+        self.compress()
+        return self
+
+    def copy(self):
+        sketch = KLLSketch(self.k)
+        sketch.levels = list(self.levels)
+        sketch.count, sketch.total, sketch.min, sketch.max = self.count, self.total, self.min, self.max
+        return sketch
+
+    def add_items(self, level, items):
+        while len(self.levels) <= level:
+            self.levels.append(EMPTY)
+        current = self.levels[level]
+        self.levels[level] = np.concatenate((current, items)) if len(current) else items
+
+    def compress(self):
+        """上限を超えた段を並べ替え、1つおきに上の段へ送る（送らなかった半分は捨てる）"""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                items = np.sort(items)
+                # 奇数個のときは1つ残す（重みの合計は変わらない）
+                keep = len(items) % 2
+                self.levels[level] = items[len(items) - keep:]
+                self.add_items(level + 1, items[random.getrandbits(1):len(items) - keep:2])
+            level += 1
+
+    def items(self):
+        """(値, 段) の配列"""
+        values = [items for items in self.levels if len(items)]
+        if not values:
+            return EMPTY, np.empty(0, dtype=np.uint8)
+        levels = [np.full(len(items), level, dtype=np.uint8) for level, items in enumerate(self.levels)
+                  if len(items)]
+        return np.concatenate(values), np.concatenate(levels)
+
+
+def weighted_quantiles(values, levels, quantiles):
+    """重み付きの要素から分位点を求める（重み = 2^段）"""
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(np.left_shift(1, levels[order].astype(np.int64)))
+    # 0 始まりの順位 floor(q * (n - 1)) の行を含む要素
+    ranks = np.floor(np.asarray(quantiles) * (cumulative[-1] - 1))
+    positions = np.searchsorted(cumulative, ranks, side='right')
+    return values[order][positions]
+
+
+def describe(values, levels, exact=None):
+    """件数・平均・最小・最大・分位点（exact は正確な (件数, 合計, 最小, 最大)）"""
+    if exact is None:
+        if not len(values):
+            exact = (0, 0, None, None)
+        else:
+            weights = np.left_shift(1, levels.astype(np.int64))
+            exact = (int(weights.sum()), int((values * weights).sum()), int(values.min()), int(values.max()))
+    count, total, minimum, maximum = exact
+    result = {'count': count, 'average': round(total / count) if count else None,
+              'min': minimum, 'max': maximum}
+    estimates = weighted_quantiles(values, levels, list(QUANTILES.values())) if count else [None] * len(QUANTILES)
+    for name, value in zip(QUANTILES, estimates):
+        result[name] = None if value is None else int(value)
+    return result
+
+
+def group_order(*keys):
+    """キー列の組でまとめる並び順と、組ごとの開始位置（末尾を含む）
+
+    キーを1つの int64 にしてから並べ替える（lexsort より速い。組の中の順序は問わない）
+    """
+    combined = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        if len(key):
+            low = key.min()
+            combined = combined * (int(key.max()) - int(low) + 1) + (key - low)
+    order = np.argsort(combined)
+    combined = combined[order]
+    change = np.ones(len(combined), dtype=bool)
+    change[1:] = combined[1:] != combined[:-1]
+    return order, np.append(np.flatnonzero(change), len(combined))
+
+
+def read_new_rows(store, rows, superseded):
+    """前回までに取り込んだ行数・置き換え済みの行数から、ストアの新しい行を読む
+
+    (行数, 置き換え済みの行数, 作り直すか, [人数, 施設番号, 日付, 料金]) を返す（変化がなければ None）。
+    置き換えられた行が増えていれば全行を返す。満室（料金0）と置き換え済みの行は除く
+    """
+    with store.lock:
+        n = len(store)
+        superseded_now = len(store.superseded)
+        if n == rows and superseded_now == superseded:
+            return None
+        start = 0 if superseded_now != superseded else rows
+        return n, superseded_now, start == 0, read_live_rows(store, start, n)
+
+
+def read_live_rows(store, start, end):
+    """行 [start, end) のうち満室（料金0）と置き換え済みを除いた [人数, 施設番号, 日付, 料金]（ロックを持って呼ぶ）"""
+    columns = [np.frombuffer(store.columns[name][start:end], dtype=np.int32).astype(np.int64)
+               for name in ('guests', 'facility', 'date', 'price')]
+    dead = np.array([row - start for row in store.superseded if start <= row < end], dtype=np.int64)
+    live = columns[3] > 0
+    live[dead] = False
+    return [column[live] for column in columns]
+
+
+def gather_ranges(starts, ends):
+    """範囲 [starts[i], ends[i]) をつなげた添字"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return EMPTY
+    shifts = starts - np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.repeat(shifts, lengths) + np.arange(total)
+
+
+def read_changes(store, rows, superseded):
+    """前回までに取り込んだ行数・置き換え済みの行数から、追加された行と新しく置き換えられた行を読む
+
+    (行数, 置き換え済みの行数, 追加行, 取り除く行) を返す（変化がなければ None）。
+    追加行・取り除く行はどちらも [人数, 施設番号, 日付, 料金] の配列で、満室（料金0）の行は含めない。
+    取り除く行は取り込み済みの行のうち置き換えられたもの、追加行は置き換え済みのものを除く
+    """
+    names = ('guests', 'facility', 'date', 'price')
+    with store.lock:
+        n = len(store)
+        superseded_now = len(store.superseded_order)
+        if n == rows and superseded_now == superseded:
+            return None
+        added = [np.frombuffer(store.columns[name][rows:n], dtype=np.int32).astype(np.int64) for name in names]
+        dead = np.array([row - rows for row in store.superseded if row >= rows], dtype=np.int64)
+        removed_rows = np.array(store.superseded_order[superseded:superseded_now], dtype=np.int64)
+        removed_rows = removed_rows[removed_rows < rows]
+        removed = [np.frombuffer(store.columns[name], dtype=np.int32)[removed_rows].astype(np.int64)
+                   for name in names]
+
+    live = added[3] > 0
+    live[dead] = False
+    kept = removed[3] > 0
+    return n, superseded_now, [column[live] for column in added], [column[kept] for column in removed]
+
+
+def pair_key(high, low):
+    """2つの int32 の列を1つの int64 にする（組の照合用。桁あふれしても組ごとに別の値になる）"""
+    return (high << 32) + low
+
+
+def day_cover(start, end):
+    """日付の範囲 [start, end] を覆う木のノード (段, 番号) のリスト"""
+    nodes = []
+    while start <= end:
+        level = 0
+        while (level + 1 < DAY_TREE_LEVELS and start % (2 << level) == 0
+               and start + (2 << level) - 1 <= end):
+            level += 1
+        nodes.append((level, start >> level))
+        start += 1 << level
+    return nodes
+
+
+class SketchIndex:
+    """絞り込み条件ごとの料金統計をスケッチの結合で答える索引"""
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.rows = 0
+        self.superseded = 0
+        # 人数 -> {(段, 番号): スケッチ}
+        self.day_trees = {}
+        # (人数, 施設番号) -> スケッチ
+        self.facility_sketches = {}
+        # 施設 × 人数 の組: (人数, 施設番号) -> 組の番号、組ごとの人数・施設番号
+        self.pair_ids = {}
+        self.pair_guests = EMPTY
+        self.pair_facility = EMPTY
+        # 葉: キー（組の番号 << DAY_BITS | 日付 + DAY_OFFSET）の昇順と、葉ごとの要素の開始位置
+        self.leaf_keys = EMPTY
+        self.leaf_offsets = np.zeros(1, dtype=np.int64)
+        self.item_values = EMPTY
+        self.item_levels = np.empty(0, dtype=np.uint8)
+        # ノード: キー（段 << LEVEL_SHIFT | 組の番号 << DAY_BITS | 番号 + (DAY_OFFSET >> 段)）の昇順と要素
+        self.node_keys = EMPTY
+        self.node_offsets = np.zeros(1, dtype=np.int64)
+        self.node_values = EMPTY
+        self.node_levels = np.empty(0, dtype=np.uint8)
+        # 葉に入っていない追加行（人数, 施設番号, 日付, 料金）
+        self.pending = [np.empty(0, dtype=np.int64)] * 4
+        self.first_day = None
+        self.last_day = None
+
+    def refresh(self, store):
+        """ストアに追加された行を取り込む（置き換えられた行があればその組・日付だけ作り直す）"""
+        with store.lock:
+            changes = read_changes(store, self.rows, self.superseded)
+            if changes is None:
+                return
+            n, superseded, added, removed = changes
+            # 作り直す組・日付の行は、同じロックの中で読んだ現在の行から取る
+            live = read_live_rows(store, 0, n) if self.rows and len(removed[0]) else None
+        if not self.rows:
+            self.build(*added)
+        elif live is None:
+            self.extend(*added)
+        else:
+            self.replace(live, added, removed)
+        self.rows, self.superseded = n, superseded
+
+    def build(self, guests, facility, day, price):
+        """全行から作り直す"""
+        self.clear()
+        self.add_to_sketches(guests, facility, day, price)
+        self.build_leaves(guests, facility, day, price)
+
+    def extend(self, guests, facility, day, price):
+        """追加行をスケッチに足す（葉は溜まってから作り直す）"""
+        self.add_to_sketches(guests, facility, day, price)
+        self.pending = [np.concatenate((old, new)) for old, new in zip(self.pending, (guests, facility, day, price))]
+        if len(self.pending[0]) > max(LEAF_REBUILD_ROWS, len(self.item_values) // 8):
+            values, levels = self.leaf_rows()
+            self.build_leaves(*(np.concatenate((old, new)) for old, new in zip(values, self.pending)),
+                              levels=np.concatenate((levels, np.zeros(len(self.pending[0]), dtype=np.uint8))))
+
+    def replace(self, live, added, removed):
+        """置き換えられた行（removed）を含むスケッチを現在の行（live）から作り直し、ほかには追加行を足す"""
+        guests, facility, day, price = live
+        pairs = np.unique(pair_key(removed[0], removed[1]))
+        cells = np.unique(pair_key(removed[0], removed[2]))
+        in_pairs = np.isin(pair_key(guests, facility), pairs)
+        in_cells = np.isin(pair_key(guests, day), cells)
+        added_in_pairs = np.isin(pair_key(added[0], added[1]), pairs)
+        added_in_cells = np.isin(pair_key(added[0], added[2]), cells)
+
+        # 施設ごとのスケッチ: 該当する組は全行から、ほかの組は追加行だけを足す
+        for key in set(zip(removed[0].tolist(), removed[1].tolist())):
+            self.facility_sketches.pop(key, None)
+        self.add_to_facility_sketches(guests[in_pairs], facility[in_pairs], price[in_pairs])
+        self.add_to_facility_sketches(added[0][~added_in_pairs], added[1][~added_in_pairs],
+                                      added[3][~added_in_pairs])
+
+        # 日付の木: ほかの日付に追加行を足してから、該当する日付とその上の段を作り直す
+        self.add_to_day_trees(added[0][~added_in_cells], added[2][~added_in_cells], added[3][~added_in_cells])
+        self.rebuild_day_nodes(guests[in_cells], day[in_cells], price[in_cells],
+                               set(zip(removed[0].tolist(), removed[2].tolist())))
+
+        # 葉: 該当する組の要素を現在の行に入れ替え、追加行と合わせて並べ直す
+        values, levels = self.leaf_rows()
+        values = [np.concatenate((old, new)) for old, new in zip(values, self.pending)]
+        levels = np.concatenate((levels, np.zeros(len(self.pending[0]), dtype=np.uint8)))
+        keep = ~np.isin(pair_key(values[0], values[1]), pairs)
+        parts = [np.concatenate((old[keep], new[~added_in_pairs], current[in_pairs]))
+                 for old, new, current in zip(values, added, live)]
+        self.build_leaves(*parts, levels=np.concatenate(
+            (levels[keep], np.zeros(len(parts[0]) - int(keep.sum()), dtype=np.uint8))))
+
+    def rebuild_day_nodes(self, guests, day, price, cells):
+        """人数 × 日付 のセル（(人数, 日付) の集合）の木のノードを、セルの現在の行から作り直す
+
+        一番下の段は行から、上の段は2つの子を結合して作る（該当するノードだけ）
+        """
+        for g, d in cells:
+            self.day_trees.get(g, {}).pop((0, d), None)
+        order, starts = group_order(guests, day)
+        g, d, p = guests[order], day[order], price[order]
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            self.day_trees.setdefault(int(g[lo]), {})[(0, int(d[lo]))] = KLLSketch(self.k).update_many(p[lo:hi])
+
+        nodes = cells
+        for level in range(1, DAY_TREE_LEVELS):
+            nodes = {(g, index >> 1) for g, index in nodes}
+            for g, index in nodes:
+                tree = self.day_trees.setdefault(g, {})
+                sketch = KLLSketch(self.k)
+                for child in (2 * index, 2 * index + 1):
+                    if (level - 1, child) in tree:
+                        sketch.merge(tree[(level - 1, child)])
+                if sketch.count:
+                    tree[(level, index)] = sketch
+                else:
+                    tree.pop((level, index), None)
+
+    def add_to_sketches(self, guests, facility, day, price):
+        """日付の木と施設ごとのスケッチに行を足す"""
+        self.add_to_day_trees(guests, day, price)
+        self.add_to_facility_sketches(guests, facility, price)
+
+    def add_to_day_trees(self, guests, day, price):
+        """人数 × 日付 の木に行を足す"""
+        if not len(price):
+            return
+        self.first_day = int(day.min()) if self.first_day is None else min(self.first_day, int(day.min()))
+        self.last_day = int(day.max()) if self.last_day is None else max(self.last_day, int(day.max()))
+
+        order, starts = group_order(guests, day)
+        g, d, p = guests[order], day[order], price[order]
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            sketch = KLLSketch(self.k).update_many(p[lo:hi])
+            tree = self.day_trees.setdefault(int(g[lo]), {})
+            for level in range(DAY_TREE_LEVELS):
+                node = (level, int(d[lo]) >> level)
+                if node in tree:
+                    tree[node].merge(sketch)
+                else:
+                    tree[node] = sketch.copy()
+
+    def add_to_facility_sketches(self, guests, facility, price):
+        """施設 × 人数 ごとの全期間のスケッチに行を足す"""
+        if not len(price):
+            return
+        order, starts = group_order(guests, facility)
+        g, f, p = guests[order], facility[order], price[order]
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            key = (int(g[lo]), int(f[lo]))
+            sketch = self.facility_sketches.get(key)
+            if sketch is None:
+                sketch = self.facility_sketches[key] = KLLSketch(self.k)
+            sketch.update_many(p[lo:hi])
+
+    def leaf_rows(self):
+        """葉の要素を (人数, 施設番号, 日付, 値) の配列に戻す"""
+        sizes = np.diff(self.leaf_offsets)
+        pairs = self.leaf_keys >> DAY_BITS
+        days = (self.leaf_keys & ((1 << DAY_BITS) - 1)) - DAY_OFFSET
+        return ((np.repeat(self.pair_guests[pairs], sizes), np.repeat(self.pair_facility[pairs], sizes),
+                 np.repeat(days, sizes), self.item_values), self.item_levels)
+
+    def build_leaves(self, guests, facility, day, values, levels=None):
+        """施設 × 人数 × 日付 ごとの葉を作る（k を超える葉だけ KLL で縮める）"""
+        if levels is None:
+            levels = np.zeros(len(values), dtype=np.uint8)
+        order, starts = group_order(guests, facility, day)
+        guests, facility, day = guests[order], facility[order], day[order]
+        values, levels = values[order], levels[order]
+        sizes = np.diff(starts)
+
+        value_parts, level_parts, done = [], [], 0
+        for leaf in np.flatnonzero(sizes > self.k):
+            lo, hi = starts[leaf], starts[leaf + 1]
+            value_parts.append(values[done:lo])
+            level_parts.append(levels[done:lo])
+            sketch = KLLSketch(self.k)
+            for level in np.unique(levels[lo:hi]):
+                sketch.add_items(int(level), values[lo:hi][levels[lo:hi] == level])
+            sketch.compress()
+            leaf_values, leaf_levels = sketch.items()
+            value_parts.append(leaf_values)
+            level_parts.append(leaf_levels)
+            sizes[leaf] = len(leaf_values)
+            done = hi
+        value_parts.append(values[done:])
+        level_parts.append(levels[done:])
+
+        # group_order は人数・施設・日付の順に並べるので、組ごとの葉は日付順に連続する
+        leaf_starts = starts[:-1]
+        leaf_guests, leaf_facility = guests[leaf_starts], facility[leaf_starts]
+        change = np.ones(len(leaf_starts), dtype=bool)
+        change[1:] = (leaf_guests[1:] != leaf_guests[:-1]) | (leaf_facility[1:] != leaf_facility[:-1])
+        self.pair_guests, self.pair_facility = leaf_guests[change], leaf_facility[change]
+        self.pair_ids = {pair: number for number, pair in
+                         enumerate(zip(self.pair_guests.tolist(), self.pair_facility.tolist()))}
+        self.leaf_keys = ((np.cumsum(change) - 1) << DAY_BITS) | (day[leaf_starts] + DAY_OFFSET)
+        self.leaf_offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self.item_values = np.concatenate(value_parts)
+        self.item_levels = np.concatenate(level_parts)
+        self.pending = [np.empty(0, dtype=np.int64)] * 4
+        self.build_nodes()
+
+    def build_nodes(self):
+        """葉を2日、4日、... 単位にまとめ、行数が k × NODE_MIN_FACTOR を超えるノードのスケッチを作る
+
+        ノードを持たない範囲は葉（の連続した範囲）を読む。子の行数は親以下なので、
+        スケッチを持つノードの子は、スケッチを持つノードか葉のどちらか。
+        """
+        node_keys, node_items = [], []
+        # 1つ下の段の単位: 組・番号（DAY_OFFSET を足した日付から）・行数と、中身（ノードの番号か、葉の範囲）
+        unit_pair = self.leaf_keys >> DAY_BITS
+        unit_index = self.leaf_keys & ((1 << DAY_BITS) - 1)
+        unit_lo = np.arange(len(self.leaf_keys))
+        unit_hi = unit_lo + 1
+        unit_node = np.full(len(self.leaf_keys), -1)
+        unit_count = EMPTY
+        if len(self.leaf_keys):
+            unit_count = np.add.reduceat(np.left_shift(1, self.item_levels.astype(np.int64)), self.leaf_offsets[:-1])
+
+        for level in range(1, DAY_TREE_LEVELS):
+            if not len(unit_pair):
+                break
+            parent = unit_index >> 1
+            change = np.ones(len(parent), dtype=bool)
+            change[1:] = (unit_pair[1:] != unit_pair[:-1]) | (parent[1:] != parent[:-1])
+            starts = np.flatnonzero(change)
+            ends = np.append(starts[1:], len(parent))
+            count = np.add.reduceat(unit_count, starts)
+            node = np.full(len(starts), -1)
+            for number in np.flatnonzero(count > self.k * NODE_MIN_FACTOR):
+                sketch = KLLSketch(self.k)
+                for child in range(starts[number], ends[number]):
+                    if unit_node[child] >= 0:
+                        values, levels = node_items[unit_node[child]]
+                    else:
+                        lo, hi = self.leaf_offsets[unit_lo[child]], self.leaf_offsets[unit_hi[child]]
+                        values, levels = self.item_values[lo:hi], self.item_levels[lo:hi]
+                    for item_level in np.unique(levels):
+                        sketch.add_items(int(item_level), values[levels == item_level])
+                sketch.compress()
+                node[number] = len(node_items)
+                node_items.append(sketch.items())
+                node_keys.append((level << LEVEL_SHIFT) | (int(unit_pair[starts[number]]) << DAY_BITS)
+                                 | int(parent[starts[number]]))
+            unit_pair, unit_index = unit_pair[starts], parent[starts]
+            unit_lo, unit_hi = unit_lo[starts], unit_hi[ends - 1]
+            unit_node, unit_count = node, count
+
+        self.node_keys = np.array(node_keys, dtype=np.int64)
+        self.node_offsets = np.concatenate(([0], np.cumsum([len(values) for values, _ in node_items],
+                                                           dtype=np.int64)))
+        self.node_values = np.concatenate([values for values, _ in node_items]) if node_items else EMPTY
+        self.node_levels = (np.concatenate([levels for _, levels in node_items]) if node_items
+                            else np.empty(0, dtype=np.uint8))
+
+    def query(self, start_day=None, end_day=None, min_price=None, max_price=None, facility_ids=None,
+              guests=None):
+        """条件に合う料金の統計（件数・平均・最小・最大・p10・中央値・p90）"""
+        with self.lock:
+            guests_values = list(self.day_trees) if guests is None else [guests]
+            if self.first_day is None:
+                return describe(EMPTY, np.empty(0, dtype=np.uint8))
+            first = self.first_day if start_day is None else max(start_day, self.first_day)
+            last = self.last_day if end_day is None else min(end_day, self.last_day)
+
+            sketch, values, levels = None, EMPTY, np.empty(0, dtype=np.uint8)
+            if facility_ids is None:
+                # 日付の木から範囲を覆うノードを結合
+                sketch = KLLSketch(self.k)
+                for g in guests_values:
+                    tree = self.day_trees.get(g, {})
+                    for node in day_cover(first, last):
+                        if node in tree:
+                            sketch.merge(tree[node])
+            elif start_day is None and end_day is None:
+                sketch = KLLSketch(self.k)
+                for g in guests_values:
+                    for f in facility_ids:
+                        if (g, f) in self.facility_sketches:
+                            sketch.merge(self.facility_sketches[(g, f)])
+            else:
+                values, levels = self.range_items(first, last, facility_ids, guests_values)
+
+        if sketch is not None:
+            values, levels = sketch.items()
+        if min_price is not None or max_price is not None:
+            # 料金帯はスケッチの要素を絞って近似する
+            keep = np.ones(len(values), dtype=bool)
+            if min_price is not None:
+                keep &= values >= min_price
+            if max_price is not None:
+                keep &= values <= max_price
+            return describe(values[keep], levels[keep])
+        if sketch is not None:
+            return describe(values, levels, (sketch.count, sketch.total, sketch.min, sketch.max))
+        return describe(values, levels)
+
+    def range_items(self, first, last, facility_ids, guests_values):
+        """施設ごとに日付範囲を覆うノード（スケッチがなければその範囲の葉）の要素を取り出す"""
+        pairs = np.array([self.pair_ids[(g, f)] for g in guests_values for f in facility_ids
+                          if (g, f) in self.pair_ids], dtype=np.int64)
+        node_lo, node_hi, leaf_lo, leaf_hi = [], [], [], []
+        for level, index in day_cover(first, last):
+            rest = pairs
+            if level and len(self.node_keys):
+                keys = (level << LEVEL_SHIFT) | (pairs << DAY_BITS) | (index + (DAY_OFFSET >> level))
+                position = np.minimum(np.searchsorted(self.node_keys, keys), len(self.node_keys) - 1)
+                found = self.node_keys[position] == keys
+                node_lo.append(self.node_offsets[position[found]])
+                node_hi.append(self.node_offsets[position[found] + 1])
+                rest = pairs[~found]
+            lo = np.searchsorted(self.leaf_keys, (rest << DAY_BITS) | ((index << level) + DAY_OFFSET))
+            hi = np.searchsorted(self.leaf_keys, (rest << DAY_BITS) | (((index + 1) << level) - 1 + DAY_OFFSET),
+                                 side='right')
+            leaf_lo.append(self.leaf_offsets[lo])
+            leaf_hi.append(self.leaf_offsets[hi])
+
+        value_parts, level_parts = [], []
+        if node_lo:
+            positions = gather_ranges(np.concatenate(node_lo), np.concatenate(node_hi))
+            value_parts.append(self.node_values[positions])
+            level_parts.append(self.node_levels[positions])
+        if leaf_lo:
+            positions = gather_ranges(np.concatenate(leaf_lo), np.concatenate(leaf_hi))
+            value_parts.append(self.item_values[positions])
+            level_parts.append(self.item_levels[positions])
+
+        pending_guests, pending_facility, pending_day, pending_price = self.pending
+        if len(pending_price):
+            keep = (np.isin(pending_guests, guests_values) & np.isin(pending_facility, list(facility_ids))
+                    & (pending_day >= first) & (pending_day <= last))
+            value_parts.append(pending_price[keep])
+            level_parts.append(np.zeros(int(keep.sum()), dtype=np.uint8))
+        if not value_parts:
+            return EMPTY, np.empty(0, dtype=np.uint8)
+        return np.concatenate(value_parts), np.concatenate(level_parts)
+
+    def stats(self, store, start=None, end=None, min_price=None, max_price=None, facilities=None,
+              guests=None):
+        """PriceStore.query() と同じ条件で統計を求める（先にストアの追加分を取り込む）"""
+        with self.lock:
+            self.refresh(store)
+        facility_ids = None
+        if facilities is not None:
+            pool = store.pools['facility'].ids
+            facility_ids = [pool[name] for name in facilities if name in pool]
+        return self.query(parse_date(start) if start else None, parse_date(end) if end else None,
+                          min_price, max_price, facility_ids, guests)
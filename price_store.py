@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+料金データストア
+アップロードされた料金データ（施設・日付・料金・部屋タイプ・プラン・URL・取得日時・人数）を
+列ごとの配列で保持し、列ごとの索引で期間・料金帯・施設・人数の絞り込みを行う
+
+文字列の列は StringPool で番号に置き換えて持つ。日付は 1970-01-01 からの日数。
+行は追加のみで、行番号は追加順。
+
+同じスクレイピング結果を何度アップロードしても二重に数えないよう、
+(施設, 宿泊日, 部屋タイプ, プラン, 人数, 取得日時) を行の識別キーにして
+KeyIndex で最新の行を引く。料金・URLが同じ行は追加せず、変わった行は
+新しい行を追加して古い行を「置き換え済み」として検索から外す。
+
+保存は dataset_snapshot の形式（列ごとのファイル）で、索引も一緒に保存する。
+読み込んだ列はスナップショットを mmap したままコピーせずに使い、最初の追加時に
+メモリ上の配列へ移す。
+
+前回の保存から追加された行だけを書く差分保存では、列ファイルに追記し、追加行の索引を
+別の「ラン」として保存する。読み込み時にランを本体の索引へ差し込む。ランが
+MAX_SNAPSHOT_RUNS 個たまったら全体を書き直す。
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import date
+
+import numpy as np
+
+from dataset_snapshot import SnapshotWriter, current_generation, open_snapshot, write_snapshot
+
+DEFAULT_GUESTS = 2
+# 1回の検索で返す最大件数
+MAX_QUERY_ROWS = 50000
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# 差分保存で追加する索引のランの上限（超えたら全体を書き直す）
+MAX_SNAPSHOT_RUNS = 8
+# 列は int32 なので、料金・人数はこの範囲のものだけ受け付ける
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+# 識別キーのハッシュ（64bit の FNV 風。衝突は列の値で確かめる）
+KEY_HASH_MULTIPLIER = 0x100000001B3
+KEY_HASH_MASK = 2 ** 64 - 1
+
+DATE_PATTERNS = [
+    (re.compile(r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})'), (0, 1, 2)),
+    (re.compile(r'^(\d{1,2})[/-](\d{1,2})[/-](\d{4})$'), (2, 0, 1)),
+    (re.compile(r'^(\d{4})年(\d{1,2})月(\d{1,2})日$'), (0, 1, 2)),
+]
+GUESTS_PATTERN = re.compile(r'大人の人数:\s*(\d+)')
+
+# add() の結果
+INSERTED = 'inserted'      # 新しい行
+UNCHANGED = 'unchanged'    # 同じキー・同じ内容の行がある
+SUPERSEDED = 'superseded'  # 同じキーで内容が変わった（古い行を置き換え）
+SKIPPED = 'skipped'        # 読めない行
+ADD_RESULTS = (INSERTED, UNCHANGED, SUPERSEDED, SKIPPED)
+
+
+def parse_date(value):
+    """日付文字列を 1970-01-01 からの日数に変換（YYYY-MM-DD / YYYY/M/D / M/D/YYYY / YYYY年M月D日）"""
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH_ORDINAL
+    text = str(value or '').strip()
+    for pattern, order in DATE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            parts = match.groups()
+            try:
+                stay_date = date(int(parts[order[0]]), int(parts[order[1]]), int(parts[order[2]]))
+                return stay_date.toordinal() - EPOCH_ORDINAL
+            except ValueError:
+                return None
+    return None
+
+
+def int_view(values):
+    """int32 の numpy 配列を、コピーせずに int で読める memoryview にする"""
+    if sys.byteorder != 'little':
+        copied = array('i')
+        copied.frombytes(np.asarray(values, dtype='=i4').tobytes())
+        return copied
+    return memoryview(np.ascontiguousarray(values)).cast('B').cast('i')
+
+
+def to_array(values):
+    """memoryview などを追加できる array('i') にする"""
+    if isinstance(values, array):
+        return values
+    copied = array('i')
+    copied.frombytes(memoryview(values).cast('B'))
+    return copied
+
+
+def concat_rows(first, second):
+    """行番号のリストをつなげた array('i')（first が array ならそれに足す）"""
+    combined = to_array(first)
+    combined.frombytes(memoryview(second).cast('B'))
+    return combined
+
+
+def merge_sorted(order, keys, new_order, new_keys):
+    """値で並べた (行番号, 値) に、値で並べた新しい行を差し込む
+
+    新しい行は既存の行より行番号が大きいので、同じ値の後ろに入れれば行番号順が保たれる
+    """
+    positions = np.searchsorted(keys, new_keys, side='right')
+    return np.insert(order, positions, new_order), np.insert(keys, positions, new_keys)
+
+
+def sort_rows(values, first_row):
+    """first_row から始まる行の値を並べた (行番号, 値)"""
+    order = np.argsort(values, kind='stable')
+    return (order + first_row).astype('<i4'), values[order].astype('<i4')
+
+
+def group_rows(column, keys):
+    """値ごとの行番号を (行番号を値の順に並べた配列, 各値の開始位置) にする"""
+    values = np.asarray(column, dtype='<i4')
+    order = np.argsort(values, kind='stable').astype('<i4')
+    offsets = np.searchsorted(values[order], keys).astype('<i4')
+    return order, np.append(offsets, len(values)).astype('<i4')
+
+
+def key_hashes(key_columns):
+    """識別キーの列（int32 の numpy 配列）から行ごとのハッシュ（uint64）を求める"""
+    hashes = np.zeros(len(key_columns[0]) if key_columns else 0, dtype=np.uint64)
+    multiplier = np.uint64(KEY_HASH_MULTIPLIER)
+    for values in key_columns:
+        # uint64 の掛け算・足し算は桁あふれで折り返す（key_hash と同じ値になる）
+        hashes = hashes * multiplier + values.view(np.uint32)
+    return hashes
+
+
+def key_hash(key):
+    """key_hashes() と同じハッシュを1件分求める"""
+    hashed = 0
+    for value in key:
+        hashed = (hashed * KEY_HASH_MULTIPLIER + (value & 0xFFFFFFFF)) & KEY_HASH_MASK
+    return hashed
+
+
+def same_key(key_columns, order, candidates):
+    """order で並べた行のうち、次の行とキーが同じもの（candidates の中から確かめる）"""
+    same = candidates.copy()
+    for values in key_columns:
+        ordered = values[order]
+        same &= ordered[1:] == ordered[:-1]
+    return same
+
+
+class KeyIndex:
+    """識別キー -> 最新の行番号
+
+    作った時点の行はキーのハッシュで並べた numpy 配列（行番号とハッシュ）を二分探索し、
+    その後に追加した行だけを辞書に持つ。作るのは numpy の並べ替えだけなので、
+    再起動後の最初の追加でも全行を Python で回さない。
+    """
+
+    def __init__(self, key_columns, rows, hashes):
+        self.key_columns = key_columns
+        if len(hashes) > 1 and (hashes[1:] < hashes[:-1]).any():
+            order = np.argsort(hashes, kind='stable')
+            rows, hashes = rows[order], hashes[order]
+        self.hashes = hashes
+        self.rows = rows
+        self.added = {}
+
+    def get(self, key):
+        row = self.added.get(key)
+        if row is not None:
+            return row
+        hashed = np.uint64(key_hash(key))
+        i = int(np.searchsorted(self.hashes, hashed))
+        while i < len(self.hashes) and self.hashes[i] == hashed:
+            row = int(self.rows[i])
+            if all(values[row] == value for values, value in zip(self.key_columns, key)):
+                return row
+            i += 1
+        return None
+
+    def __setitem__(self, key, row):
+        self.added[key] = row
+
+
+def parse_guests(search_condition, default=DEFAULT_GUESTS):
+    """検索条件の「大人の人数: N」から人数を取り出す"""
+    match = GUESTS_PATTERN.search(search_condition or '')
+    return int(match.group(1)) if match else default
+
+
+class StringPool:
+    """文字列 <-> 番号の対応表"""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.ids = {value: i for i, value in enumerate(self.values)}
+
+    def intern(self, value):
+        value = value or ''
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[value] = string_id
+            self.values.append(value)
+        return string_id
+
+    def __len__(self):
+        return len(self.values)
+
+
+class PriceStore:
+    """列指向の料金データストア
+
+    施設・人数は値ごとの行番号リスト、日付・料金は値で並べた行番号の配列を索引に持つ。
+    検索では条件ごとの候補数を索引から求め、最も少ない候補だけを他の列で確かめる。
+    """
+
+    STRING_COLUMNS = ('facility', 'room_type', 'plan_name', 'url', 'fetch_time')
+    INT_COLUMNS = ('date', 'price', 'guests')
+    # 行の識別キーになる列
+    KEY_COLUMNS = ('facility', 'date', 'room_type', 'plan_name', 'guests', 'fetch_time')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # 保存は1つずつ（差分保存の元になる世代が入れ替わらないように）
+        self.save_lock = threading.Lock()
+        self.pools = {name: StringPool() for name in self.STRING_COLUMNS}
+        self.columns = {name: array('i') for name in self.STRING_COLUMNS + self.INT_COLUMNS}
+        # 施設番号 / 人数 -> 行番号（追加順なので昇順）
+        self.by_facility = {}
+        self.by_guests = {}
+        # 値の順に並べた行番号と値（numpy 配列。追加後の最初の検索で追加行を差し込む）
+        empty = np.empty(0, dtype='<i4')
+        self.sorted_index = {'date': (empty, empty), 'price': (empty, empty)}
+        self.indexed_rows = 0
+        # データが変わるたびに増える（検索結果のキャッシュ用）
+        self.version = 0
+        self.date_strings = {}
+        # 識別キー -> 最新の行番号（KeyIndex。最初の追加時に列から作る）
+        self.row_keys = None
+        # 新しい行に置き換えられた行番号と、そのうち保存していないもの
+        self.superseded = set()
+        self.unsaved_superseded = []
+        # 置き換えられた順の行番号（集計の索引が前回からの差分を読む）
+        self.superseded_order = []
+        # 列・索引がスナップショットの読み取り専用ビューかどうか
+        self.mapped = False
+        # 最後に読み込んだ・保存したスナップショットとその行数（差分保存の元）
+        self.snapshot = None
+        self.saved_rows = 0
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    def count(self):
+        """置き換えられた行を除いた行数"""
+        return len(self) - len(self.superseded)
+
+    def add(self, facility, observed_date, price, room_type='', plan_name='', url='',
+            fetch_time='', guests=DEFAULT_GUESTS):
+        """1件追加して結果（INSERTED / UNCHANGED / SUPERSEDED）を返す
+
+        施設名がない・日付や料金が読めない（int32 に収まらない）ものは追加せず None。
+        列に書き始める前にすべての値を確かめるので、追加しなかった行で列の長さがずれることはない
+        """
+        day = parse_date(observed_date)
+        try:
+            price = int(round(float(price or 0)))
+            guests = int(guests)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        strings = (facility, room_type, plan_name, url, fetch_time)
+        if not all(value is None or isinstance(value, (str, int, float)) for value in strings):
+            return None
+        facility, room_type, plan_name, url, fetch_time = (str(value) if value else '' for value in strings)
+        if not facility or day is None:
+            return None
+        if not (INT32_MIN <= price <= INT32_MAX and INT32_MIN <= guests <= INT32_MAX):
+            return None
+        with self.lock:
+            pools = self.pools
+            facility_id = pools['facility'].intern(facility)
+            room_id = pools['room_type'].intern(room_type)
+            plan_id = pools['plan_name'].intern(plan_name)
+            url_id = pools['url'].intern(url)
+            fetch_id = pools['fetch_time'].intern(fetch_time)
+            key = (facility_id, day, room_id, plan_id, guests, fetch_id)
+            row_keys = self.key_index()
+            previous = row_keys.get(key)
+            if previous is not None:
+                if self.columns['price'][previous] == price and self.columns['url'][previous] == url_id:
+                    return UNCHANGED
+                self.supersede(previous)
+
+            if self.mapped:
+                self.materialize()
+            row = len(self)
+            columns = self.columns
+            columns['facility'].append(facility_id)
+            columns['room_type'].append(room_id)
+            columns['plan_name'].append(plan_id)
+            columns['url'].append(url_id)
+            columns['fetch_time'].append(fetch_id)
+            columns['date'].append(day)
+            columns['price'].append(price)
+            columns['guests'].append(guests)
+            self.by_facility.setdefault(facility_id, array('i')).append(row)
+            self.by_guests.setdefault(guests, array('i')).append(row)
+            row_keys[key] = row
+            self.version += 1
+        return INSERTED if previous is None else SUPERSEDED
+
+    def key_index(self):
+        """識別キーの索引（ロックを持って呼ぶ）
+
+        行をキーのハッシュで並べ（安定ソートなので同じキーは行番号順）、隣と同じキーの行は
+        後ろに新しい行がある。以前の形式で保存された重複行は、ここで古い方を置き換え済みにする
+        """
+        if self.row_keys is None:
+            n = len(self)
+            # array('i') はスライスでコピーしてから読む（ビューを残すと追加できなくなる）
+            key_columns = [np.frombuffer(self.columns[name][:n], dtype='=i4') for name in self.KEY_COLUMNS]
+            hashes = key_hashes(key_columns)
+            order = np.argsort(hashes, kind='stable')
+            same_hash = hashes[order][1:] == hashes[order][:-1]
+            duplicate = same_key(key_columns, order, same_hash)
+            if (duplicate != same_hash).any():
+                # ハッシュが衝突した別のキーがある（まれ）。同じキーが隣り合うよう列の値で並べ直す
+                order = np.lexsort(key_columns[::-1])
+                duplicate = same_key(key_columns, order, np.ones(n - 1, dtype=bool))
+            older = set(order[:-1][duplicate].tolist()) - self.superseded
+            for row in sorted(older):
+                self.supersede(row)
+            if older:
+                self.version += 1
+            latest = np.delete(order, np.flatnonzero(duplicate)).astype('<i4')
+            self.row_keys = KeyIndex(key_columns, latest, hashes[latest])
+        return self.row_keys
+
+    def supersede(self, row):
+        """行を置き換え済みにする（ロックを持って呼ぶ）"""
+        self.superseded.add(row)
+        self.unsaved_superseded.append(row)
+        self.superseded_order.append(row)
+
+    def add_many(self, observations, guests=DEFAULT_GUESTS):
+        """辞書のリストを追加（キーは画面側と同じ facility / date / price / roomType ...）"""
+        counts = dict.fromkeys(ADD_RESULTS, 0)
+        with self.lock:
+            for item in observations:
+                if not isinstance(item, dict):
+                    counts[SKIPPED] += 1
+                    continue
+                result = self.add(item.get('facility'), item.get('date'), item.get('price'),
+                                  item.get('roomType', ''), item.get('planName', ''),
+                                  item.get('url', ''), item.get('fetchTime', ''),
+                                  item.get('guests', guests))
+                counts[result or SKIPPED] += 1
+        return counts
+
+    def add_batch(self, records):
+        """(施設, 日付, 料金, 部屋タイプ, プラン, URL, 取得日時, 人数) のタプルをまとめて追加し、結果ごとの件数を返す"""
+        counts = dict.fromkeys(ADD_RESULTS, 0)
+        with self.lock:
+            for record in records:
+                counts[self.add(*record) or SKIPPED] += 1
+        return counts
+
+    def materialize(self):
+        """スナップショットのビューを追加できる配列に移す（ロックを持って呼ぶ）"""
+        self.columns = {name: to_array(column) for name, column in self.columns.items()}
+        self.by_facility = {key: to_array(rows) for key, rows in self.by_facility.items()}
+        self.by_guests = {key: to_array(rows) for key, rows in self.by_guests.items()}
+        self.mapped = False
+
+    def ensure_indexes(self):
+        """日付・料金の索引を最新にして (行数, 索引) を返す"""
+        with self.lock:
+            n = len(self)
+            if self.indexed_rows < n:
+                # 追加行だけを並べて、並び済みの索引に差し込む
+                for name in self.sorted_index:
+                    values = np.frombuffer(self.columns[name][self.indexed_rows:n], dtype='=i4')
+                    self.sorted_index[name] = merge_sorted(*self.sorted_index[name],
+                                                           *sort_rows(values, self.indexed_rows))
+                self.indexed_rows = n
+            return n, dict(self.sorted_index)
+
+    def query(self, start=None, end=None, min_price=None, max_price=None, facilities=None,
+              guests=None):
+        """条件に一致する行番号（追加順）"""
+        n, sorted_index = self.ensure_indexes()
+        columns = self.columns
+        candidates = []
+
+        start_day = parse_date(start) if start else None
+        end_day = parse_date(end) if end else None
+        if start_day is not None or end_day is not None:
+            date_order, date_keys = sorted_index['date']
+            d_lo = int(np.searchsorted(date_keys, start_day, 'left')) if start_day is not None else 0
+            d_hi = int(np.searchsorted(date_keys, end_day, 'right')) if end_day is not None else len(date_keys)
+            candidates.append((d_hi - d_lo, lambda: date_order[d_lo:d_hi].tolist()))
+
+        if min_price is not None or max_price is not None:
+            price_order, price_keys = sorted_index['price']
+            p_lo = int(np.searchsorted(price_keys, min_price, 'left')) if min_price is not None else 0
+            p_hi = int(np.searchsorted(price_keys, max_price, 'right')) if max_price is not None else len(price_keys)
+            candidates.append((p_hi - p_lo, lambda: price_order[p_lo:p_hi].tolist()))
+
+        facility_ids = None
+        if facilities is not None:
+            pool = self.pools['facility'].ids
+            facility_ids = {pool[name] for name in facilities if name in pool}
+            lists = [self.by_facility[fid] for fid in facility_ids]
+            candidates.append((sum(len(rows) for rows in lists),
+                               lambda: [row for rows in lists for row in rows[:bisect_left(rows, n)]]))
+
+        if guests is not None:
+            guest_rows = self.by_guests.get(guests, array('i'))
+            candidates.append((len(guest_rows), lambda: guest_rows[:bisect_left(guest_rows, n)]))
+
+        superseded = self.superseded
+        if not candidates:
+            return [row for row in range(n) if row not in superseded] if superseded else list(range(n))
+
+        # 最も絞り込める索引から候補を取り、残りの条件は列の値で確かめる
+        _, candidate_rows = min(candidates, key=lambda candidate: candidate[0])
+        dates, prices = columns['date'], columns['price']
+        facility_column, guests_column = columns['facility'], columns['guests']
+        result = []
+        for row in candidate_rows():
+            if start_day is not None and dates[row] < start_day:
+                continue
+            if end_day is not None and dates[row] > end_day:
+                continue
+            if min_price is not None and prices[row] < min_price:
+                continue
+            if max_price is not None and prices[row] > max_price:
+                continue
+            if facility_ids is not None and facility_column[row] not in facility_ids:
+                continue
+            if guests is not None and guests_column[row] != guests:
+                continue
+            if superseded and row in superseded:
+                continue
+            result.append(row)
+        result.sort()
+        return result
+
+    def format_date(self, day):
+        text = self.date_strings.get(day)
+        if text is None:
+            text = self.date_strings[day] = date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+        return text
+
+    def row(self, row):
+        """行を画面側のデータ形式の辞書にする"""
+        columns, pools = self.columns, self.pools
+        price = columns['price'][row]
+        return {
+            'facility': pools['facility'].values[columns['facility'][row]],
+            'date': self.format_date(columns['date'][row]),
+            'price': price,
+            'available': price > 0,
+            'roomType': pools['room_type'].values[columns['room_type'][row]],
+            'planName': pools['plan_name'].values[columns['plan_name'][row]],
+            'url': pools['url'].values[columns['url'][row]],
+            'fetchTime': pools['fetch_time'].values[columns['fetch_time'][row]],
+            'guests': columns['guests'][row]
+        }
+
+    def summary(self):
+        """施設一覧・人数・期間（絞り込み画面用）"""
+        n, sorted_index = self.ensure_indexes()
+        _, dates = sorted_index['date']
+        return {
+            'count': self.count(),
+            'facilities': sorted(self.pools['facility'].values[fid] for fid in self.by_facility),
+            'guests': sorted(self.by_guests),
+            'start': self.format_date(int(dates[0])) if n else None,
+            'end': self.format_date(int(dates[-1])) if n else None,
+            'version': self.version
+        }
+
+    def save(self, path):
+        """列と索引をスナップショットとして保存
+
+        前回読み込んだ・保存したスナップショットが今も最新の世代なら、その後に追加された行と
+        置き換えられた行だけを書き足す（ランが多くなったら全体を書き直す）
+        """
+        with self.save_lock:
+            self.save_generation(path)
+
+    def save_generation(self, path):
+        with self.lock:
+            n, sorted_index = self.ensure_indexes()
+            parent = self.snapshot
+            if (parent is None or current_generation(path) != parent.generation
+                    or os.path.abspath(os.path.dirname(parent.path)) != os.path.abspath(path)
+                    or 'superseded_rows' not in parent or 'pool_sizes' not in parent.meta
+                    or len(parent.meta.get('runs', [])) >= MAX_SNAPSHOT_RUNS):
+                write = self.full_snapshot(n, sorted_index)
+            else:
+                write = self.delta_snapshot(n, parent)
+            saved_superseded = len(self.unsaved_superseded)
+
+        write(path)
+        with self.lock:
+            del self.unsaved_superseded[:saved_superseded]
+            self.saved_rows = n
+            self.snapshot = open_snapshot(path)
+
+    def full_snapshot(self, n, sorted_index):
+        """全体を書き直す関数を返す（列はロックを持っている間に写す）"""
+        columns = {name: np.frombuffer(column, dtype='=i4', count=n).astype('<i4')
+                   for name, column in self.columns.items()}
+        for name, (order, keys) in sorted_index.items():
+            columns[f'{name}_order'] = np.asarray(order, dtype='<i4')
+            columns[f'{name}_keys'] = np.asarray(keys, dtype='<i4')
+        columns['superseded_rows'] = np.array(sorted(self.superseded), dtype='<i4')
+        pools = {name: list(pool.values) for name, pool in self.pools.items()}
+        version = self.version
+
+        def write(path):
+            guests_values = sorted(set(columns['guests'].tolist()))
+            columns['facility_rows'], columns['facility_offsets'] = group_rows(
+                columns['facility'], np.arange(len(pools['facility'])))
+            columns['guests_rows'], columns['guests_offsets'] = group_rows(columns['guests'], guests_values)
+            # 分析用（price_cube.PriceCube）の満室ビットマップ
+            columns['sold_out_bits'] = np.packbits(columns['price'] <= 0)
+            meta = {'rows': n, 'version': version, 'guests_values': guests_values, 'runs': [],
+                    'pool_sizes': {name: len(values) for name, values in pools.items()}}
+            write_snapshot(path, columns, pools, meta)
+        return write
+
+    def delta_snapshot(self, n, parent):
+        """parent の後に追加された行・置き換えられた行を書き足す関数を返す"""
+        first = self.saved_rows
+        new = {name: np.frombuffer(column[first:n], dtype='=i4').astype('<i4')
+               for name, column in self.columns.items()}
+        # 満室ビットマップは途中のバイトから書き直す
+        bits_from = first // 8
+        sold_out_bits = np.packbits(np.frombuffer(self.columns['price'][bits_from * 8:n], dtype='=i4') <= 0)
+        superseded = np.array(sorted(self.unsaved_superseded), dtype='<i4')
+        pool_sizes = parent.meta['pool_sizes']
+        additions = {name: pool.values[pool_sizes[name]:] for name, pool in self.pools.items()}
+        meta = dict(parent.meta, rows=n, version=self.version,
+                    pool_sizes={name: len(pool) for name, pool in self.pools.items()})
+
+        def write(path):
+            run_columns = {}
+            if n > first:
+                run = f"run{first}"
+                for name in self.sorted_index:
+                    run_columns[f'{run}_{name}_order'], run_columns[f'{run}_{name}_keys'] = sort_rows(new[name], first)
+                guests_values = sorted(set(new['guests'].tolist()))
+                for name in ('facility', 'guests'):
+                    keys = np.unique(new[name])
+                    rows, offsets = group_rows(new[name], keys)
+                    run_columns[f'{run}_{name}_keys'] = keys.astype('<i4')
+                    run_columns[f'{run}_{name}_rows'] = (rows + first).astype('<i4')
+                    run_columns[f'{run}_{name}_offsets'] = offsets
+                meta['runs'] = parent.meta.get('runs', []) + [{'name': run, 'first': first, 'rows': n - first,
+                                                               'guests_values': guests_values}]
+
+            extended = set(new) | {'superseded_rows', 'sold_out_bits'}
+            with SnapshotWriter(path) as writer:
+                writer.link(parent, [name for name in parent.names if name not in extended])
+                for name, values in new.items():
+                    writer.extend(parent, name, values)
+                writer.extend(parent, 'superseded_rows', superseded)
+                writer.extend(parent, 'sold_out_bits', sold_out_bits, keep=bits_from)
+                writer.append(run_columns)
+                writer.extend_dictionaries(parent, additions)
+                writer.close(meta=meta)
+        return write
+
+    @classmethod
+    def load(cls, path):
+        """スナップショットを開く（なければ空のストア）。列はコピーせずにそのまま使う
+
+        差分保存のランがあれば、その索引を本体の索引に差し込む（差し込んだ索引と、
+        追加行のある施設・人数の行リストだけはメモリ上に作る）
+        """
+        store = cls()
+        snapshot = open_snapshot(path)
+        if snapshot is None:
+            return store
+
+        runs = snapshot.meta.get('runs', [])
+        store.pools = {name: StringPool(snapshot.dictionary(name)) for name in cls.STRING_COLUMNS}
+        store.columns = {name: int_view(snapshot.column(name)) for name in cls.STRING_COLUMNS + cls.INT_COLUMNS}
+        for name in store.sorted_index:
+            index = (snapshot.column(f'{name}_order'), snapshot.column(f'{name}_keys'))
+            for run in runs:
+                index = merge_sorted(*index, snapshot.column(f"{run['name']}_{name}_order"),
+                                     snapshot.column(f"{run['name']}_{name}_keys"))
+            store.sorted_index[name] = index
+        for attribute, name in (('by_facility', 'facility'), ('by_guests', 'guests')):
+            base_keys = snapshot.meta['guests_values'] if name == 'guests' else \
+                range(len(snapshot.column('facility_offsets')) - 1)
+            parts = [('', base_keys)] + [(f"{run['name']}_", snapshot.column(f"{run['name']}_{name}_keys").tolist())
+                                         for run in runs]
+            groups = {}
+            for prefix, keys in parts:
+                rows = int_view(snapshot.column(f'{prefix}{name}_rows'))
+                offsets = snapshot.column(f'{prefix}{name}_offsets').tolist()
+                for i, key in enumerate(keys):
+                    if offsets[i] < offsets[i + 1]:
+                        part = rows[offsets[i]:offsets[i + 1]]
+                        groups[key] = part if key not in groups else concat_rows(groups[key], part)
+            setattr(store, attribute, groups)
+        if 'superseded_rows' in snapshot:
+            store.superseded = set(snapshot.column('superseded_rows').tolist())
+            store.superseded_order = sorted(store.superseded)
+        store.indexed_rows = store.saved_rows = len(store)
+        store.version = snapshot.meta['version']
+        store.mapped = True
+        store.snapshot = snapshot
+        return store
+
+    @classmethod
+    def load_json(cls, path):
+        """以前のJSON形式（日付は date.toordinal()）から読み込み"""
+        store = cls()
+        with open(path, 'r') as f:
+            data = json.load(f)
+        records = zip(*(data['columns'][name] for name in ('facility', 'date', 'price', 'room_type',
+                                                           'plan_name', 'url', 'fetch_time', 'guests')))
+        pools = data['pools']
+        store.add_batch((pools['facility'][facility], date.fromordinal(ordinal), price,
+                         pools['room_type'][room_type], pools['plan_name'][plan_name], pools['url'][url],
+                         pools['fetch_time'][fetch_time], guests)
+                        for facility, ordinal, price, room_type, plan_name, url, fetch_time, guests in records)
+        return store
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+料金表のページング
+料金行列（price_pivot.PriceMatrix）の施設行を 施設名 / 平均 / 最安 / 最高 で並べ、
+1ページ分の行と集計行を返す。続きは前ページ最後の行の (並べ替えの値, 施設名) を
+カーソルにして探すので、途中でデータが追加されても行が重複・欠落しない。
+"""
+
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+
+from price_pivot import CELL_PRICE, median_price
+
+SORT_KEYS = ('name', 'average', 'min', 'max')
+SUMMARY_TYPES = ('average', 'median')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """カーソルが壊れているか、並べ替え条件と合わない"""
+
+
+def encode_cursor(sort, order, key):
+    data = json.dumps({'s': sort, 'o': order, 'k': key}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode('ascii')
+
+
+def decode_cursor(cursor, sort, order):
+    """カーソルから前ページ最後の行のキーを取り出す"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        key = data['k']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if data.get('s') != sort or data.get('o') != order or not isinstance(key, list) or len(key) != 2:
+        raise InvalidCursor(cursor)
+    value, name = key
+    value_type = str if sort == 'name' else (int, type(None))
+    if not isinstance(name, str) or not isinstance(value, value_type):
+        raise InvalidCursor(cursor)
+    return key
+
+
+def row_stats(matrix):
+    """施設ごとの (平均, 最安, 最高)。料金のない施設は None"""
+    if matrix.row_stats is not None:
+        return matrix.row_stats
+
+    width = len(matrix.dates)
+    values, mask = matrix.values, matrix.mask
+    stats = []
+    for f in range(len(matrix.facilities)):
+        prices = [values[i] for i in range(f * width, (f + 1) * width) if mask[i] == CELL_PRICE]
+        if prices:
+            stats.append((round(sum(prices) / len(prices)), min(prices), max(prices)))
+        else:
+            stats.append(None)
+    matrix.row_stats = stats
+    return stats
+
+
+class TableOrdering:
+    """1つの並べ替えキーでの施設の並び（料金のある施設を昇順、料金のない施設は名前順で最後）"""
+
+    def __init__(self, matrix, sort):
+        names = matrix.facilities
+        stats = row_stats(matrix)
+        priced, missing = [], []
+        for f, name in enumerate(names):
+            if sort == 'name':
+                priced.append(((name, name), f))
+            elif stats[f] is None:
+                missing.append((name, f))
+            else:
+                value = stats[f][SORT_KEYS.index(sort) - 1]
+                priced.append(((value, name), f))
+        priced.sort()
+        missing.sort()
+        self.keys = [key for key, _ in priced]
+        self.priced = [f for _, f in priced]
+        self.missing_names = [name for name, _ in missing]
+        self.missing = [f for _, f in missing]
+
+    def __len__(self):
+        return len(self.priced) + len(self.missing)
+
+    def after(self, key, descending):
+        """key の次の行から順に施設番号を返す（key が None なら先頭から）"""
+        if key is not None and key[0] is None:
+            # 料金のない施設の途中から
+            return iter(self.missing[bisect_right(self.missing_names, key[1]):])
+
+        if descending:
+            end = len(self.priced) if key is None else bisect_left(self.keys, tuple(key))
+            priced = reversed(self.priced[:end])
+        else:
+            start = 0 if key is None else bisect_right(self.keys, tuple(key))
+            priced = iter(self.priced[start:])
+        return chain(priced, self.missing)
+
+    def key_of(self, f, matrix, sort):
+        """カーソルに入れる行のキー"""
+        name = matrix.facilities[f]
+        if sort == 'name':
+            return [name, name]
+        stats = row_stats(matrix)[f]
+        return [None if stats is None else stats[SORT_KEYS.index(sort) - 1], name]
+
+
+def ordering(matrix, sort):
+    """並べ替えキーごとの並び（行列ごとにキャッシュ）"""
+    table_ordering = matrix.orderings.get(sort)
+    if table_ordering is None:
+        table_ordering = matrix.orderings[sort] = TableOrdering(matrix, sort)
+    return table_ordering
+
+
+def summary_row(matrix, facility_indexes, summary='average'):
+    """ページ内の施設の日付ごとの平均（または中央値）。料金がなければ 0"""
+    width = len(matrix.dates)
+    values, mask = matrix.values, matrix.mask
+    row = []
+    for d in range(width):
+        prices = [values[f * width + d] for f in facility_indexes if mask[f * width + d] == CELL_PRICE]
+        if not prices:
+            row.append(0)
+        elif summary == 'median':
+            row.append(median_price(prices))
+        else:
+            row.append(round(sum(prices) / len(prices)))
+    return row
+
+
+def table_page(matrix, sort='name', order='asc', cursor=None, limit=DEFAULT_PAGE_SIZE,
+               summary='average', format_date=str):
+    """1ページ分の表（不正なカーソルは InvalidCursor）"""
+    if sort not in SORT_KEYS or order not in ('asc', 'desc') or summary not in SUMMARY_TYPES:
+        raise ValueError(sort, order, summary)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    key = decode_cursor(cursor, sort, order) if cursor else None
+
+    table_ordering = ordering(matrix, sort)
+    page = list(islice(table_ordering.after(key, order == 'desc'), limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    width = len(matrix.dates)
+    stats = row_stats(matrix)
+    rows = []
+    for f in page:
+        cells = slice(f * width, (f + 1) * width)
+        average, minimum, maximum = stats[f] or (0, 0, 0)
+        rows.append({
+            'facility': matrix.facilities[f],
+            'prices': [price if status == CELL_PRICE else 0
+                       for price, status in zip(matrix.values[cells], matrix.mask[cells])],
+            'mask': list(matrix.mask[cells]),
+            'average': average,
+            'min': minimum,
+            'max': maximum
+        })
+
+    next_cursor = None
+    if has_more and page:
+        next_cursor = encode_cursor(sort, order, table_ordering.key_of(page[-1], matrix, sort))
+    return {
+        'sort': sort,
+        'order': order,
+        'total': len(table_ordering),
+        'dates': [format_date(ordinal) for ordinal in matrix.dates],
+        'rows': rows,
+        'summary': {'type': summary, 'prices': summary_row(matrix, page, summary)},
+        'next_cursor': next_cursor
+    }
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+リクエストのプロファイリング
+管理者が有効にしている間だけ、N件に1件（またはルート・パスが一致するリクエスト）を
+cProfile の下で処理し、一定時間ごとの枠にまとめた統計をリングバッファに残す。
+
+    pstats     pstats.Stats で読める marshal 形式（python -m pstats / snakeviz など）
+    collapsed  flamegraph.pl / speedscope などで読める折りたたみスタック形式（マイクロ秒）
+    text       累積時間順の上位の関数
+
+無効のときは 1 リクエストあたり属性を1回読むだけ。
+Python 3.12 以降は cProfile を同時に1つしか使えないので、他のリクエストを計測中なら
+そのリクエストは計測しない（他のスレッドの呼び出しも統計に混ざる）。
+"""
+
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import threading
+import time
+import urllib.parse
+from collections import Counter, deque
+
+from metrics import route_of
+
+DEFAULT_SAMPLE_EVERY = 100
+# 1枠の秒数と、残しておく枠の数
+WINDOW_SECONDS = 60
+RING_WINDOWS = 10
+# 折りたたみスタックの深さの上限と、出力しない小さな値（マイクロ秒）
+MAX_STACK_DEPTH = 64
+MIN_STACK_MICROSECONDS = 1
+TEXT_LIMIT = 50
+FORMATS = ('pstats', 'collapsed', 'text')
+
+
+def function_label(func):
+    """pstats の関数キー (ファイル名, 行, 関数名) をスタックの1段の表記にする"""
+    filename, line, name = func
+    if filename == '~':
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    return label.replace(';', ':')
+
+
+def collapsed_stacks(stats):
+    """pstats の統計から折りたたみスタック（スタック -> マイクロ秒）を作る
+
+    cProfile は呼び出し元と呼び出し先の組ごとの時間しか持たないので、関数の時間は
+    呼び出し元ごとの累積時間の比で各経路に配分する（再帰は打ち切る）。
+    """
+    callees = {}
+    roots = []
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, (_, _, _, edge_time) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_time))
+
+    result = Counter()
+
+    def walk(func, path, share):
+        _, _, own_time, total_time, _ = stats[func]
+        path = path + (func,)
+        own = own_time * share * 1e6
+        if own >= MIN_STACK_MICROSECONDS:
+            result[';'.join(function_label(f) for f in path)] += own
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            callee_total = stats[callee][3]
+            if callee in path or not callee_total:
+                continue
+            callee_share = share * edge_time / callee_total
+            if callee_total * callee_share * 1e6 >= MIN_STACK_MICROSECONDS:
+                walk(callee, path, min(callee_share, 1.0))
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return {stack: round(value) for stack, value in result.items() if round(value)}
+
+
+class ProfileWindow:
+    """一定時間の間に計測したリクエストの統計"""
+
+    def __init__(self, started):
+        self.started = started
+        self.requests = 0
+        self.routes = Counter()
+        self.stats = None
+
+    def add(self, stats, route):
+        self.requests += 1
+        self.routes[route] += 1
+        if self.stats is None:
+            self.stats = stats
+        else:
+            self.stats.add(stats)
+        # add() はリクエストごとにファイル名の一覧を伸ばすので捨てる
+        self.stats.files = []
+
+    def to_json(self):
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'requests': self.requests,
+            'routes': dict(self.routes),
+            'functions': len(self.stats.stats) if self.stats else 0
+        }
+
+
+class RequestProfiler:
+    """計測するリクエストの選択と、計測結果のリングバッファ"""
+
+    def __init__(self, window_seconds=WINDOW_SECONDS, windows=RING_WINDOWS):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.sample_every = DEFAULT_SAMPLE_EVERY
+        self.routes = None
+        self.window_seconds = window_seconds
+        self.windows = deque(maxlen=windows)
+        self.counter = itertools.count()
+
+    def start(self, sample_every=DEFAULT_SAMPLE_EVERY, routes=None, window_seconds=None):
+        """計測を始める（routes を指定したらそのルート名・パスに一致するものだけを N件に1件）"""
+        if sample_every < 1 or (window_seconds is not None and window_seconds <= 0):
+            raise ValueError(sample_every, window_seconds)
+        with self.lock:
+            self.sample_every = sample_every
+            self.routes = frozenset(routes) if routes else None
+            if window_seconds is not None:
+                self.window_seconds = window_seconds
+            self.counter = itertools.count()
+            self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.windows.clear()
+
+    def begin(self, command, path):
+        """このリクエストを計測するなら開始した cProfile.Profile を返す"""
+        route = route_of(command, path)
+        if self.routes is not None and route not in self.routes and path.partition('?')[0] not in self.routes:
+            return None
+        if next(self.counter) % self.sample_every:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 他のリクエストを計測中（Python 3.12 以降）
+            return None
+        return profile
+
+    def finish(self, profile, command, path):
+        """計測を終えて今の枠に足す"""
+        profile.disable()
+        stats = pstats.Stats(profile)
+        now = time.time()
+        with self.lock:
+            if not self.windows or now - self.windows[-1].started >= self.window_seconds:
+                self.windows.append(ProfileWindow(now))
+            self.windows[-1].add(stats, route_of(command, path))
+
+    def merged(self, windows=None):
+        """新しい方から windows 枠分（省略時は全部）を合わせた統計（なければ None）"""
+        with self.lock:
+            selected = list(self.windows)[-windows:] if windows else list(self.windows)
+            stats = [window.stats for window in selected if window.stats is not None]
+            if not stats:
+                return None
+            return pstats.Stats().add(*stats)
+
+    def dump(self, format, windows=None):
+        """(Content-Type, 本文) を返す"""
+        if format not in FORMATS:
+            raise ValueError(format)
+        stats = self.merged(windows)
+        if format == 'pstats':
+            return 'application/octet-stream', marshal.dumps(stats.stats if stats else {})
+        if format == 'collapsed':
+            stacks = collapsed_stacks(stats.stats) if stats else {}
+            text = ''.join(f"{stack} {value}\n" for stack, value in sorted(stacks.items()))
+            return 'text/plain; charset=utf-8', text.encode('utf-8')
+        stream = io.StringIO()
+        if stats:
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(TEXT_LIMIT)
+        return 'text/plain; charset=utf-8', stream.getvalue().encode('utf-8')
+
+    def status(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'sample_every': self.sample_every,
+                'routes': sorted(self.routes) if self.routes else None,
+                'window_seconds': self.window_seconds,
+                'windows': [window.to_json() for window in self.windows]
+            }
+
+
+PROFILER = RequestProfiler()
+
+
+class ProfilingMixin:
+    """BaseHTTPRequestHandler 用のミックスイン
+
+    PROFILER が有効なら、リクエスト行を読んだところから応答を返し終えるまでを計測する。
+    管理用の send_profile / control_profile は権限を確認してから呼ぶこと。
+    """
+
+    def handle_one_request(self):
+        self.request_profile = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_profile is not None:
+                PROFILER.finish(self.request_profile, self.command, self.path)
+                self.request_profile = None
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if PROFILER.enabled:
+            self.request_profile = PROFILER.begin(self.command, self.path)
+        return True
+
+    def send_profile(self, query):
+        """計測状態（format 指定なし）か、統計（?format=pstats|collapsed|text&windows=N）を返す"""
+        params = urllib.parse.parse_qs(query)
+        format = params.get('format', [None])[0]
+        if format is None:
+            self.send_json(200, dict(success=True, **PROFILER.status()))
+            return
+
+        try:
+            windows = int(params.get('windows', [0])[0] or 0) or None
+            content_type, body = PROFILER.dump(format, windows)
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '出力形式が正しくありません'})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if format == 'pstats':
+            self.send_header('Content-Disposition', 'attachment; filename="requests.pstats"')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.send_common_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def control_profile(self, query):
+        """計測の開始・停止・消去（?action=start&sample=N&route=login&window=60 / stop / reset）"""
+        params = urllib.parse.parse_qs(query)
+        action = params.get('action', [None])[0]
+        try:
+            if action == 'start':
+                window = params.get('window', [None])[0]
+                PROFILER.start(sample_every=int(params.get('sample', [DEFAULT_SAMPLE_EVERY])[0]),
+                               routes=params.get('route'),
+                               window_seconds=float(window) if window else None)
+            elif action == 'stop':
+                PROFILER.stop()
+            elif action == 'reset':
+                PROFILER.reset()
+            else:
+                raise ValueError(action)
+        except ValueError:
+            self.send_json(400, {'success': False, 'message': '計測条件が正しくありません'})
+            return
+
+        self.send_json(200, dict(success=True, **PROFILER.status()))
@@ -1,99 +1,359 @@
 #!/usr/bin/env python3
-import pandas as pd
+"""
+サンプルの宿泊施設料金データ生成（ベンチマーク・負荷試験用）
+曜日・季節による変動、±20% のばらつき、10% の満室という料金モデルを numpy でまとめて計算し、
+施設 × 日付 × 部屋タイプ × プラン × 人数 の料金を施設のまとまりごとに書き出す。
+同じ引数（シードとチャンクの大きさを含む）なら同じデータになる。
+
+出力（どれもチャンクごとに書き足すので、メモリ使用量はチャンク1つ分で済む）:
+    --excel     施設 × 日付のピボット形式（人数ごとのシート。部屋タイプ・プランの中で一番安い空室の料金）
+    --csv       スクレイピング結果と同じ縦持ちのCSV（Shift-JIS）
+    --columnar  料金ストアのスナップショット（PriceStore.load / PriceCube.from_snapshot で開ける）
+"""
+
+import argparse
+import csv
+import time
+from datetime import date
+
 import numpy as np
-from datetime import datetime, timedelta
-import random
-
-def generate_sample_hotel_data():
-    """サンプルの宿泊施設料金データを生成"""
-    
-    # 施設名リスト
-    facilities = [
-        "オーシャンビューリゾート那覇",
-        "サンセットビーチホテル",
-        "沖縄グランドホテル",
-        "ビジネスホテル国際通り",
-        "リゾートヴィラ恩納",
-        "シーサイドペンション",
-        "那覇シティホテル",
-        "美ら海リゾート",
-        "首里城ホテル",
-        "コーラルビーチリゾート"
-    ]
-    
-    # 日付範囲（3ヶ月分）
-    start_date = datetime(2024, 1, 1)
-    end_date = datetime(2024, 3, 31)
-    date_range = pd.date_range(start_date, end_date)
-    
-    # 施設タイプ別の基本価格
-    base_prices = {
-        "オーシャンビューリゾート那覇": 15000,
-        "サンセットビーチホテル": 12000,
-        "沖縄グランドホテル": 18000,
-        "ビジネスホテル国際通り": 6000,
-        "リゾートヴィラ恩納": 25000,
-        "シーサイドペンション": 4500,
-        "那覇シティホテル": 8000,
-        "美ら海リゾート": 20000,
-        "首里城ホテル": 10000,
-        "コーラルビーチリゾート": 16000
-    }
-    
-    # データフレームの作成
-    data = []
-    data.append(["施設名"] + [date.strftime("%Y-%m-%d") for date in date_range])
-    
-    for facility in facilities:
-        row = [facility]
-        base_price = base_prices[facility]
-        
-        for date in date_range:
-            # 曜日による価格変動
-            weekday = date.weekday()
-            weekday_factor = 1.0
-            if weekday == 5:  # 土曜日
-                weekday_factor = 1.3
-            elif weekday == 6:  # 日曜日
-                weekday_factor = 1.2
-            elif weekday == 4:  # 金曜日
-                weekday_factor = 1.15
-            
-            # 季節変動
-            month = date.month
-            seasonal_factor = 1.0
-            if month in [7, 8]:  # 夏季
-                seasonal_factor = 1.4
-            elif month in [12, 1]:  # 年末年始
-                seasonal_factor = 1.3
-            elif month == 3:  # 春休み
-                seasonal_factor = 1.2
-            
-            # ランダムな変動（±20%）
-            random_factor = 1 + random.uniform(-0.2, 0.2)
-            
-            # 空室率（10%の確率で満室）
-            if random.random() < 0.1:
-                price = 0  # 満室
-            else:
-                price = int(base_price * weekday_factor * seasonal_factor * random_factor)
-                # 100円単位に丸める
-                price = round(price / 100) * 100
-            
-            row.append(price)
-        
-        data.append(row)
-    
-    # Excelファイルとして保存
-    df = pd.DataFrame(data[1:], columns=data[0])
-    df.to_excel("sample_hotel_prices.xlsx", index=False)
-    print("サンプルデータを 'sample_hotel_prices.xlsx' として生成しました。")
-    
+
+from dataset_snapshot import SnapshotWriter
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# 元からある施設と基本料金（施設数がこれより多いときは地域・種別から名前を作る）
+BASE_PRICES = {
+    "オーシャンビューリゾート那覇": 15000,
+    "サンセットビーチホテル": 12000,
+    "沖縄グランドホテル": 18000,
+    "ビジネスホテル国際通り": 6000,
+    "リゾートヴィラ恩納": 25000,
+    "シーサイドペンション": 4500,
+    "那覇シティホテル": 8000,
+    "美ら海リゾート": 20000,
+    "首里城ホテル": 10000,
+    "コーラルビーチリゾート": 16000
+}
+AREAS = ('那覇', '恩納', '北谷', '名護', '宮古島', '石垣島', '本部', '読谷', '糸満', '豊見城')
+# 種別と基本料金の範囲
+KINDS = {
+    'リゾートホテル': (14000, 30000),
+    'シティホテル': (8000, 18000),
+    'ビジネスホテル': (5000, 9000),
+    'ペンション': (4000, 8000),
+    'コンドミニアム': (10000, 22000),
+}
+# 部屋タイプ・プランと料金の倍率（先頭から指定の数だけ使う）
+ROOM_TYPES = (('スタンダードツイン', 1.0), ('デラックスツイン', 1.35), ('和洋室', 1.5),
+              ('シングル', 0.7), ('オーシャンビュースイート', 2.2))
+PLANS = (('素泊まり', 1.0), ('朝食付き', 1.12), ('1泊2食付き', 1.45), ('早割28', 0.88), ('連泊割', 0.92))
+
+# 曜日（月曜 = 0）・月ごとの倍率
+WEEKDAY_FACTORS = np.array([1.0, 1.0, 1.0, 1.0, 1.15, 1.3, 1.2])
+SEASONAL_FACTORS = np.array([0, 1.3, 1.0, 1.2, 1.0, 1.0, 1.0, 1.4, 1.4, 1.0, 1.0, 1.0, 1.3])
+RANDOM_RANGE = 0.2
+SOLD_OUT_RATE = 0.1
+
+# 1チャンクの行数の目安（施設単位で区切る）
+DEFAULT_CHUNK_ROWS = 1_000_000
+# Excel の列数の上限（施設名の列を除く）
+MAX_EXCEL_DAYS = 16383
+CSV_HEADER = ['取得日時', '検索条件', 'ホテル名', '日付', 'プラン名', '部屋名称', '料金', 'URL']
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def facility_table(count, seed):
+    """施設名と基本料金（元の10施設のあとに 地域 + 種別 + 番号 の施設を足す）"""
+    names = list(BASE_PRICES)[:count]
+    prices = [BASE_PRICES[name] for name in names]
+    rng = np.random.default_rng([seed, 0])
+    kinds = list(KINDS)
+    for i in range(len(names), count):
+        kind = kinds[i // len(AREAS) % len(kinds)]
+        low, high = KINDS[kind]
+        names.append(f"{AREAS[i % len(AREAS)]}{kind}{i:05d}")
+        prices.append(int(rng.integers(low, high, endpoint=True)) // 500 * 500)
+    return names, np.array(prices, dtype=np.float64)
+
+
+class PriceModel:
+    """施設 × 日付 × 部屋タイプ × プラン × 人数 の料金（満室は 0）をチャンクごとに作る"""
+
+    def __init__(self, facilities=10, start='2024-01-01', end='2024-03-31', room_types=1, plans=1,
+                 guests=(2,), seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+        if not 1 <= room_types <= len(ROOM_TYPES) or not 1 <= plans <= len(PLANS):
+            raise ValueError(f"部屋タイプは1〜{len(ROOM_TYPES)}、プランは1〜{len(PLANS)}です")
+        self.start, self.end = date.fromisoformat(start), date.fromisoformat(end)
+        if self.end < self.start or facilities < 1 or not guests:
+            raise ValueError("施設数・期間・人数の指定が正しくありません")
+        self.names, self.base_prices = facility_table(facilities, seed)
+        self.first_day = self.start.toordinal() - EPOCH_ORDINAL
+        self.days = np.arange(self.first_day, self.end.toordinal() - EPOCH_ORDINAL + 1, dtype=np.int64)
+        self.room_types = ROOM_TYPES[:room_types]
+        self.plans = PLANS[:plans]
+        self.guests = np.array(sorted(set(guests)), dtype=np.int64)
+        self.seed = seed
+
+        # 日付ごとの倍率（曜日 × 季節）と、部屋タイプ × プラン × 人数 の倍率
+        dates = self.days.astype('datetime64[D]')
+        months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        self.day_factors = WEEKDAY_FACTORS[(self.days + 3) % 7] * SEASONAL_FACTORS[months]
+        self.cell_factors = (np.array([factor for _, factor in self.room_types])[:, None, None]
+                             * np.array([factor for _, factor in self.plans])[None, :, None]
+                             * ((self.guests / 2) ** 0.6)[None, None, :])
+        self.date_strings = np.datetime_as_string(dates).tolist()
+        self.facilities_per_chunk = max(1, chunk_rows // (len(self.days) * self.cell_factors.size))
+
+    @property
+    def shape(self):
+        """1施設分の (日付, 部屋タイプ, プラン, 人数)"""
+        return (len(self.days),) + self.cell_factors.shape
+
+    @property
+    def rows(self):
+        return len(self.names) * int(np.prod(self.shape))
+
+    def chunks(self):
+        """(施設番号の配列, 料金の配列 [施設, 日付, 部屋タイプ, プラン, 人数]) を順に返す"""
+        for first in range(0, len(self.names), self.facilities_per_chunk):
+            facility = np.arange(first, min(first + self.facilities_per_chunk, len(self.names)))
+            rng = np.random.default_rng([self.seed, 1, first])
+            shape = (len(facility),) + self.shape
+            price = (self.base_prices[facility][:, None, None, None, None]
+                     * self.day_factors[None, :, None, None, None]
+                     * self.cell_factors[None, None]
+                     * (1 + rng.uniform(-RANDOM_RANGE, RANDOM_RANGE, shape)))
+            # 100円単位に丸める
+            price = np.round(price.astype(np.int64) / 100).astype(np.int32) * 100
+            price[rng.random(shape) < SOLD_OUT_RATE] = 0
+            yield facility, price
+
+
+class PivotExcelWriter:
+    """施設 × 日付のピボット形式の Excel（openpyxl の書き込み専用モード）"""
+
+    def __init__(self, path, model):
+        if openpyxl is None:
+            raise RuntimeError("Excel の出力には openpyxl が必要です（pip install openpyxl）")
+        if len(model.days) > MAX_EXCEL_DAYS:
+            raise ValueError(f"Excel に書ける日数は {MAX_EXCEL_DAYS} 日までです")
+        self.path = path
+        self.model = model
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheets = []
+        for guests in model.guests.tolist():
+            sheet = self.workbook.create_sheet(f"{guests}名")
+            sheet.append(["施設名"] + model.date_strings)
+            self.sheets.append(sheet)
+
+    def write(self, facility, price):
+        # 部屋タイプ・プランの中で一番安い空室（全部満室なら 0）
+        available = np.where(price > 0, price, np.iinfo(np.int32).max).min(axis=(2, 3))
+        lowest = np.where(available == np.iinfo(np.int32).max, 0, available)
+        for g, sheet in enumerate(self.sheets):
+            for facility_id, row in zip(facility.tolist(), lowest[:, :, g].tolist()):
+                sheet.append([self.model.names[facility_id]] + row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class ScraperCSVWriter:
+    """スクレイピング結果と同じ縦持ちのCSV（price_ingest でそのまま取り込める）"""
+
+    def __init__(self, path, model, encoding='cp932'):
+        self.model = model
+        self.file = open(path, 'w', encoding=encoding, newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_HEADER)
+        self.fetch_time = f"{model.start.isoformat()} 09:00:00"
+        self.conditions = [f"大人の人数: {guests}名 / 部屋数: 1" for guests in model.guests.tolist()]
+
+    def write(self, facility, price):
+        model = self.model
+        rooms = [name for name, _ in model.room_types]
+        plans = [name for name, _ in model.plans]
+        f, d, r, p, g = (index.ravel().tolist() for index in np.indices(price.shape, sparse=False))
+        prices = price.ravel().tolist()
+        ids = facility.tolist()
+        self.writer.writerows(
+            (self.fetch_time, self.conditions[gi], model.names[ids[fi]], model.date_strings[di], plans[pi],
+             rooms[ri], value or '満室', f"https://example.com/hotel/{ids[fi]}")
+            for fi, di, ri, pi, gi, value in zip(f, d, r, p, g, prices))
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarWriter:
+    """料金ストアのスナップショット（PriceStore.load / PriceCube.from_snapshot でそのまま開ける）
+
+    行の列はチャンクごとに書き足す。日付・料金の索引と施設・人数ごとの行は、書き終えた列を
+    値の範囲ごとに読み直して作る（1回に扱う行数は chunk_rows 程度なので全体をメモリに載せない）。
+    """
+
+    def __init__(self, path, model, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.model = model
+        self.chunk_rows = chunk_rows
+        self.snapshot = SnapshotWriter(path)
+        self.rows = 0
+        # 満室ビットマップの8行に満たない端数
+        self.sold_out_tail = np.empty(0, dtype=bool)
+
+    def write(self, facility, price):
+        shape = price.shape
+        f, d, r, p, g = np.indices(shape, dtype=np.int32, sparse=True)
+        facility_ids = facility.astype(np.int32)[f]
+        self.snapshot.append({
+            'facility': np.broadcast_to(facility_ids, shape).ravel(),
+            'room_type': np.broadcast_to(r, shape).ravel(),
+            'plan_name': np.broadcast_to(p, shape).ravel(),
+            'url': np.broadcast_to(facility_ids, shape).ravel(),
+            'fetch_time': np.zeros(price.size, dtype='<i4'),
+            'date': np.broadcast_to(self.model.days.astype(np.int32)[d], shape).ravel(),
+            'price': price.ravel().astype('<i4'),
+            'guests': np.broadcast_to(self.model.guests.astype(np.int32)[g], shape).ravel(),
+        })
+        sold_out = np.concatenate((self.sold_out_tail, price.ravel() <= 0))
+        whole = len(sold_out) // 8 * 8
+        self.snapshot.append({'sold_out_bits': np.packbits(sold_out[:whole])})
+        self.sold_out_tail = sold_out[whole:]
+        self.rows += price.size
+
+    def sorted_rows(self, name):
+        """列を値で並べた (行番号, 値) をチャンクごとに返す（同じ値は行番号順）"""
+        column = self.snapshot.written(name)
+        counts = {}
+        for first in range(0, len(column), self.chunk_rows):
+            values, value_counts = np.unique(column[first:first + self.chunk_rows], return_counts=True)
+            for value, count in zip(values.tolist(), value_counts.tolist()):
+                counts[value] = counts.get(value, 0) + count
+
+        # 合わせて chunk_rows 行程度になる値の範囲ごとに、列を読み直して取り出す
+        values = sorted(counts)
+        start = 0
+        while start < len(values):
+            end, rows = start, 0
+            while end < len(values) and (end == start or rows + counts[values[end]] <= self.chunk_rows):
+                rows += counts[values[end]]
+                end += 1
+            low, high = values[start], values[end - 1]
+            order, keys = [], []
+            for first in range(0, len(column), self.chunk_rows):
+                part = column[first:first + self.chunk_rows]
+                selected = np.flatnonzero((part >= low) & (part <= high))
+                order.append(selected + first)
+                keys.append(part[selected])
+            order, keys = np.concatenate(order), np.concatenate(keys)
+            by_value = np.argsort(keys, kind='stable')
+            yield order[by_value].astype('<i4'), keys[by_value]
+            start = end
+
+    def write_indexes(self):
+        """日付・料金の索引と、施設・人数ごとの行番号（PriceStore.save と同じ列）"""
+        for name in ('date', 'price'):
+            for order, keys in self.sorted_rows(name):
+                self.snapshot.append({f'{name}_order': order, f'{name}_keys': keys})
+        guests_values = self.model.guests.tolist()
+        for name, keys in (('facility', range(len(self.model.names))), ('guests', guests_values)):
+            counts = dict.fromkeys(keys, 0)
+            for order, values in self.sorted_rows(name):
+                self.snapshot.append({f'{name}_rows': order})
+                for value, count in zip(*(array.tolist() for array in np.unique(values, return_counts=True))):
+                    counts[value] += count
+            offsets = np.concatenate(([0], np.cumsum(list(counts.values())))).astype('<i4')
+            self.snapshot.append({f'{name}_offsets': offsets})
+        self.snapshot.append({'superseded_rows': np.empty(0, dtype='<i4')})
+        return guests_values
+
+    def close(self):
+        model = self.model
+        if len(self.sold_out_tail):
+            self.snapshot.append({'sold_out_bits': np.packbits(self.sold_out_tail)})
+        guests_values = self.write_indexes()
+        dictionaries = {
+            'facility': model.names,
+            'room_type': [name for name, _ in model.room_types],
+            'plan_name': [name for name, _ in model.plans],
+            'url': [f"https://example.com/hotel/{i}" for i in range(len(model.names))],
+            'fetch_time': [f"{model.start.isoformat()} 09:00:00"],
+        }
+        meta = {'rows': self.rows, 'version': 1, 'guests_values': guests_values, 'runs': [],
+                'pool_sizes': {name: len(values) for name, values in dictionaries.items()}, 'seed': model.seed}
+        self.snapshot.close(dictionaries, meta)
+
+
+def generate_sample_hotel_data(excel="sample_hotel_prices.xlsx", csv_path=None, columnar=None, **options):
+    """サンプルの宿泊施設料金データを生成（options は PriceModel の引数）"""
+    model = PriceModel(**options)
+    writers = []
+    try:
+        if excel:
+            writers.append(PivotExcelWriter(excel, model))
+        if csv_path:
+            writers.append(ScraperCSVWriter(csv_path, model))
+        if columnar:
+            writers.append(ColumnarWriter(columnar, model, options.get('chunk_rows', DEFAULT_CHUNK_ROWS)))
+
+        started = time.perf_counter()
+        sold_out = 0
+        for facility, price in model.chunks():
+            sold_out += int(np.count_nonzero(price == 0))
+            for writer in writers:
+                writer.write(facility, price)
+        for writer in writers:
+            writer.close()
+    except BaseException:
+        for writer in writers:
+            if isinstance(writer, ColumnarWriter):
+                writer.snapshot.abort()
+        raise
+    elapsed = time.perf_counter() - started
+
+    for path, label in ((excel, 'Excel（ピボット形式）'), (csv_path, 'CSV（Shift-JIS）'), (columnar, '料金ストアのスナップショット')):
+        if path:
+            print(f"サンプルデータを '{path}' として生成しました。（{label}）")
+
     # データの概要を表示
     print(f"\n生成されたデータの概要:")
-    print(f"- 施設数: {len(facilities)}")
-    print(f"- 期間: {start_date.strftime('%Y-%m-%d')} 〜 {end_date.strftime('%Y-%m-%d')}")
-    print(f"- 日数: {len(date_range)}日")
+    print(f"- 施設数: {len(model.names):,}")
+    print(f"- 期間: {model.start.isoformat()} 〜 {model.end.isoformat()}")
+    print(f"- 日数: {len(model.days)}日")
+    print(f"- 部屋タイプ: {len(model.room_types)}  プラン: {len(model.plans)}  人数: {model.guests.tolist()}")
+    print(f"- 行数: {model.rows:,}（満室 {sold_out / model.rows:.1%}）  {elapsed:.1f}秒")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='サンプルの宿泊施設料金データ生成')
+    parser.add_argument('--facilities', type=int, default=10)
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--end', default='2024-03-31')
+    parser.add_argument('--room-types', type=int, default=1, help=f'部屋タイプの数（1〜{len(ROOM_TYPES)}）')
+    parser.add_argument('--plans', type=int, default=1, help=f'プランの数（1〜{len(PLANS)}）')
+    parser.add_argument('--guests', type=int, nargs='+', default=[2], help='人数（複数指定可）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='1チャンクの行数の目安')
+    parser.add_argument('--excel', help='ピボット形式の Excel（出力を指定しなければ sample_hotel_prices.xlsx）')
+    parser.add_argument('--csv', help='スクレイピング結果と同じ形式の CSV（Shift-JIS）')
+    parser.add_argument('--columnar', help='料金ストアのスナップショットを書くディレクトリ')
+    args = parser.parse_args()
+
+    excel = args.excel
+    if not (args.excel or args.csv or args.columnar):
+        excel = "sample_hotel_prices.xlsx"
+    try:
+        generate_sample_hotel_data(excel=excel, csv_path=args.csv, columnar=args.columnar,
+                                   facilities=args.facilities, start=args.start, end=args.end,
+                                   room_types=args.room_types, plans=args.plans, guests=args.guests,
+                                   seed=args.seed, chunk_rows=args.chunk_rows)
+    except (RuntimeError, ValueError) as e:
+        parser.error(str(e))
+
 
 if __name__ == "__main__":
-    generate_sample_hotel_data()
\ No newline at end of file
+    main()
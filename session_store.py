@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+セッションストア
+セッション辞書をメモリに保持し、変更分だけをディスクへ書き込むバックエンド群
+
+- json:    従来互換。変更のたびにファイル全体を書き直す
+- journal: 追記型ジャーナル＋定期的なコンパクション
+- sqlite:  SQLite にまとめてコミット
+
+各セッションは数値の有効期限 expires_ts（UNIX秒）を持ち、ストアは有効期限の
+最小ヒープを索引として保持する。SessionSweeper が期限切れをまとめて削除する。
+
+refresh() は他プロセスがファイルを書き換えたとき（mtime/サイズの変化）だけ読み直す。
+"""
+
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from datetime import datetime
+
+from json_file_cache import file_signature
+from metrics import SESSION_WRITE_SECONDS
+
+DEFAULT_BACKEND = 'journal'
+# スイーパーの実行間隔（秒）と1回あたりの削除上限
+SWEEP_INTERVAL = 60
+SWEEP_BATCH_SIZE = 500
+# 他プロセスによる変更を確認する間隔（秒）
+REFRESH_INTERVAL = 1.0
+
+
+def load_json_sessions(path):
+    """従来形式（辞書1つ）のセッションファイルを読み込み"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            return {}
+    return {}
+
+
+def session_expiry_ts(session):
+    """セッションの有効期限（UNIX秒）。expires_ts がない旧形式は expires_at から求める"""
+    expires_ts = session.get('expires_ts')
+    if expires_ts is None:
+        try:
+            expires_ts = int(datetime.fromisoformat(session['expires_at']).timestamp())
+        except (KeyError, TypeError, ValueError):
+            expires_ts = 0
+        session['expires_ts'] = expires_ts
+    return expires_ts
+
+
+def write_json_atomic(path, data):
+    """一時ファイル経由でJSONを書き込み、途中で落ちても壊れないようにする"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class SessionStore(MutableMapping):
+    """セッションストアの基底クラス（読み取りはメモリ上の辞書から）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.sessions = {}
+        # (expires_ts, session_id) の最小ヒープ。削除済みの要素は取り出し時に読み飛ばす
+        self.expiry_heap = []
+        self.signature = None
+        self.last_refresh = time.monotonic()
+
+    def load(self):
+        """永続化先からセッションを読み込む"""
+        raise NotImplementedError
+
+    def current_signature(self):
+        """永続化先の変更検知用シグネチャ"""
+        return None
+
+    def refresh(self, interval=REFRESH_INTERVAL):
+        """他プロセスによる変更があれば読み直す（interval 秒に1回だけ確認）"""
+        now = time.monotonic()
+        if now - self.last_refresh < interval:
+            return False
+        with self.lock:
+            self.last_refresh = now
+            if self.current_signature() == self.signature:
+                return False
+            self.load()
+            return True
+
+    def build_expiry_index(self):
+        """読み込んだセッションから有効期限の索引を作成"""
+        with self.lock:
+            self.expiry_heap = [(session_expiry_ts(s), sid) for sid, s in self.sessions.items()]
+            heapq.heapify(self.expiry_heap)
+
+    def __getitem__(self, session_id):
+        return self.sessions[session_id]
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def __iter__(self):
+        return iter(list(self.sessions))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, session_id, default=None):
+        return self.sessions.get(session_id, default)
+
+    def __setitem__(self, session_id, session):
+        with self.lock:
+            self.sessions[session_id] = session
+            heapq.heappush(self.expiry_heap, (session_expiry_ts(session), session_id))
+            if len(self.expiry_heap) > 2 * len(self.sessions) + 1000:
+                self.build_expiry_index()
+            with SESSION_WRITE_SECONDS.time('set'):
+                self.write_set(session_id, session)
+
+    def __delitem__(self, session_id):
+        with self.lock:
+            del self.sessions[session_id]
+            with SESSION_WRITE_SECONDS.time('delete'):
+                self.write_delete([session_id])
+
+    def delete_many(self, session_ids):
+        """複数セッションをまとめて削除（書き込みは1回）"""
+        with self.lock:
+            deleted = [sid for sid in session_ids if self.sessions.pop(sid, None) is not None]
+            if deleted:
+                with SESSION_WRITE_SECONDS.time('delete'):
+                    self.write_delete(deleted)
+            return deleted
+
+    def pop_expired(self, now=None, limit=SWEEP_BATCH_SIZE):
+        """期限切れのセッションを最大 limit 件削除し、削除したIDを返す"""
+        now = time.time() if now is None else now
+        expired = []
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] < now and len(expired) < limit:
+                expires_ts, session_id = heapq.heappop(self.expiry_heap)
+                session = self.sessions.get(session_id)
+                # 再作成・削除済みのセッションは索引の古い要素なので無視
+                if session is not None and session['expires_ts'] == expires_ts:
+                    expired.append(session_id)
+            if expired:
+                self.delete_many(expired)
+        return expired
+
+    def write_set(self, session_id, session):
+        raise NotImplementedError
+
+    def write_delete(self, session_ids):
+        raise NotImplementedError
+
+    def flush(self):
+        """未書き込みの変更をディスクへ反映"""
+
+    def close(self):
+        self.flush()
+
+
+class JSONSessionStore(SessionStore):
+    """従来互換のストア（変更のたびにファイル全体を書き直す）"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.sessions = load_json_sessions(self.path)
+            self.signature = self.current_signature()
+            self.build_expiry_index()
+
+    def current_signature(self):
+        return file_signature(self.path)
+
+    def write_set(self, session_id, session):
+        self.flush()
+
+    def write_delete(self, session_ids):
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            write_json_atomic(self.path, self.sessions)
+            self.signature = self.current_signature()
+
+
+class JournalSessionStore(SessionStore):
+    """追記型ジャーナルのストア
+
+    スナップショット（従来のJSONファイル）＋ジャーナル（1行1操作のJSON）で構成する。
+    ジャーナルが生存セッション数に比べて大きくなったらスナップショットへ畳み込む。
+    """
+
+    def __init__(self, path, compact_min=1000, compact_ratio=2.0, fsync=False):
+        super().__init__(path)
+        self.journal_path = f"{path}.journal"
+        self.compact_min = compact_min
+        self.compact_ratio = compact_ratio
+        self.fsync = fsync
+        self.journal = None
+        self.load()
+
+    def load(self):
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+            self.sessions = load_json_sessions(self.path)
+            self.journal_entries = self.replay_journal()
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+            self.signature = self.current_signature()
+            self.build_expiry_index()
+
+    def current_signature(self):
+        return (file_signature(self.path), file_signature(self.journal_path))
+
+    def replay_journal(self):
+        """ジャーナルをスナップショットに適用"""
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        entries = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で停止した行は無視
+                    continue
+                if entry['op'] == 'set':
+                    self.sessions[entry['id']] = entry['session']
+                elif entry['op'] == 'del':
+                    for session_id in entry['ids']:
+                        self.sessions.pop(session_id, None)
+                entries += 1
+        return entries
+
+    def append(self, entry):
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.journal_entries += 1
+        if self.journal_entries > max(self.compact_min, len(self.sessions) * self.compact_ratio):
+            self.compact()
+        else:
+            self.signature = self.current_signature()
+
+    def write_set(self, session_id, session):
+        self.append({'op': 'set', 'id': session_id, 'session': session})
+
+    def write_delete(self, session_ids):
+        self.append({'op': 'del', 'ids': list(session_ids)})
+
+    def compact(self):
+        """スナップショットを書き直してジャーナルを空にする"""
+        with self.lock:
+            write_json_atomic(self.path, self.sessions)
+            self.journal.close()
+            self.journal = open(self.journal_path, 'w', encoding='utf-8')
+            self.journal_entries = 0
+            self.signature = self.current_signature()
+
+    def flush(self):
+        with self.lock:
+            self.journal.flush()
+
+    def close(self):
+        with self.lock:
+            self.compact()
+            self.journal.close()
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLiteのストア（書き込みは batch_size 件または commit_interval 秒ごとにまとめてコミット）"""
+
+    def __init__(self, path, batch_size=100, commit_interval=1.0):
+        super().__init__(path)
+        self.db_path = f"{os.path.splitext(path)[0]}.sqlite3"
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.last_commit = time.monotonic()
+        self.timer = None
+
+        is_new = not os.path.exists(self.db_path)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+
+        if is_new:
+            # 従来のJSONファイルがあれば移行
+            legacy = load_json_sessions(path)
+            self.conn.executemany('INSERT OR REPLACE INTO sessions (id, data) VALUES (?, ?)',
+                                  [(sid, json.dumps(s)) for sid, s in legacy.items()])
+        self.conn.commit()
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.sessions = {session_id: json.loads(data)
+                             for session_id, data in self.conn.execute('SELECT id, data FROM sessions')}
+            self.signature = self.current_signature()
+            self.build_expiry_index()
+
+    def current_signature(self):
+        # data_version は他の接続がコミットしたときだけ変わる
+        with self.lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def write_set(self, session_id, session):
+        self.conn.execute('INSERT OR REPLACE INTO sessions (id, data) VALUES (?, ?)',
+                          (session_id, json.dumps(session)))
+        self.mark_pending()
+
+    def write_delete(self, session_ids):
+        self.conn.executemany('DELETE FROM sessions WHERE id = ?', [(sid,) for sid in session_ids])
+        self.mark_pending()
+
+    def mark_pending(self):
+        self.pending += 1
+        if self.pending >= self.batch_size or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.flush()
+        elif self.timer is None:
+            # 以降の書き込みがなくても commit_interval 後にはコミットする
+            self.timer = threading.Timer(self.commit_interval, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.pending:
+                self.conn.commit()
+                self.pending = 0
+            self.last_commit = time.monotonic()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+class SessionSweeper(threading.Thread):
+    """期限切れセッションを定期的にまとめて削除するバックグラウンドスレッド"""
+
+    def __init__(self, store, interval=SWEEP_INTERVAL, batch_size=SWEEP_BATCH_SIZE):
+        super().__init__(name='session-sweeper', daemon=True)
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+
+    def sweep(self):
+        """期限切れがなくなるまでバッチ単位で削除し、削除件数を返す"""
+        total = 0
+        while not self.stopped.is_set():
+            expired = self.store.pop_expired(limit=self.batch_size)
+            total += len(expired)
+            if len(expired) < self.batch_size:
+                break
+        return total
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sweep()
+
+    def stop(self):
+        self.stopped.set()
+
+
+BACKENDS = {
+    'json': JSONSessionStore,
+    'journal': JournalSessionStore,
+    'sqlite': SQLiteSessionStore,
+}
+
+
+def open_session_store(path, backend=DEFAULT_BACKEND, **options):
+    """バックエンド名を指定してセッションストアを開く"""
+    if backend not in BACKENDS:
+        raise ValueError(f"不明なセッションバックエンド: {backend}")
+    return BACKENDS[backend](path, **options)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+静的ファイルキャッシュ
+ファイルの中身を (パス, mtime, サイズ) をキーにメモリへ保持し、ETag / Last-Modified による
+条件付きGETには 304 で応答する。圧縮できるファイルは gzip / brotli 版も初回要求時に
+作成してキャッシュに持つ
+"""
+
+import email.utils
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+
+from content_encoding import MIN_COMPRESS_BYTES, compress, is_compressible, negotiate
+
+# キャッシュ全体の上限と、キャッシュ対象にする1ファイルの上限（バイト）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+class CachedAsset:
+    """キャッシュされた静的ファイル"""
+
+    def __init__(self, path, stat, body, content_type):
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.body = body
+        self.content_type = content_type
+        self.mtime = int(stat.st_mtime)
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        # 強いETag（内容のハッシュ）
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.compressible = is_compressible(content_type) and self.size >= MIN_COMPRESS_BYTES
+        # 圧縮方式 -> (本文, ETag)
+        self.variants = {}
+        self.variant_bytes = 0
+
+    def representation(self, encoding):
+        """指定の圧縮方式での (本文, ETag)。None は無圧縮"""
+        if encoding is None:
+            return self.body, self.etag
+        return self.variants[encoding]
+
+    def is_fresh(self, stat):
+        return self.mtime_ns == stat.st_mtime_ns and self.size == stat.st_size
+
+
+class StaticAssetCache:
+    """メモリ上限付きのLRUキャッシュ"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entry_bytes=DEFAULT_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, content_type):
+        """ファイルを返す（大きすぎてキャッシュしない場合は None、存在しなければ OSError）"""
+        stat = os.stat(path)
+        with self.lock:
+            asset = self.entries.get(path)
+            if asset is not None and asset.is_fresh(stat):
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return asset
+            self.misses += 1
+
+        if stat.st_size > self.max_entry_bytes:
+            return None
+
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            body = f.read()
+        asset = CachedAsset(path, stat, body, content_type)
+
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.total_bytes -= old.size + old.variant_bytes
+            self.entries[path] = asset
+            self.total_bytes += asset.size
+            self.evict()
+        return asset
+
+    def get_variant(self, asset, encoding):
+        """圧縮版を返す（なければ作成してキャッシュに加える）"""
+        if encoding is None or encoding in asset.variants:
+            return asset.representation(encoding)
+
+        body = compress(asset.body, encoding)
+        if len(body) >= asset.size:
+            # 小さくならなければ無圧縮版を使う（次回からは圧縮も試さない）
+            variant, added = (asset.body, asset.etag), 0
+        else:
+            variant, added = (body, f'{asset.etag[:-1]}-{encoding}"'), len(body)
+        with self.lock:
+            if encoding not in asset.variants:
+                asset.variants[encoding] = variant
+                asset.variant_bytes += added
+                if self.entries.get(asset.path) is asset:
+                    self.total_bytes += added
+                    self.evict()
+        return asset.variants[encoding]
+
+    def preload(self, paths, encodings=()):
+        """起動時に読み込みと圧縮を済ませておく"""
+        for path in paths:
+            path = os.path.abspath(path)
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            try:
+                asset = self.get(path, content_type)
+            except OSError:
+                continue
+            if asset is not None and asset.compressible:
+                for encoding in encodings:
+                    self.get_variant(asset, encoding)
+
+    def evict(self):
+        """上限を超えたら古いものから捨てる（ロックを持って呼ぶ）"""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.size + evicted.variant_bytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """キャッシュの統計情報"""
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0
+            }
+
+
+class CachedStaticMixin:
+    """SimpleHTTPRequestHandler 用のミックスイン
+
+    通常のファイルはキャッシュから返し、If-None-Match / If-Modified-Since が一致すれば
+    本文なしの 304 を返す。Accept-Encoding に応じて圧縮版を返す。
+    ディレクトリや大きなファイルは従来どおり処理する。
+    """
+
+    asset_cache = StaticAssetCache()
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or path.endswith('/'):
+            return super().send_head()
+
+        try:
+            asset = self.asset_cache.get(path, self.guess_type(path))
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        if asset is None:
+            return super().send_head()
+
+        encoding = None
+        if asset.compressible:
+            encoding = negotiate(self.headers.get('Accept-Encoding'))
+        body, etag = self.asset_cache.get_variant(asset, encoding)
+        if body is asset.body:
+            encoding = None
+
+        if self.is_not_modified(asset, etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validator_headers(asset, etag)
+            self.send_common_headers()
+            self.end_headers()
+            return None
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', asset.content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_validator_headers(asset, etag)
+        self.send_common_headers()
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def is_not_modified(self, asset, etag):
+        """条件付きGETが一致するかどうか"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match があれば If-Modified-Since は無視する（RFC 9110）
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, IndexError, OverflowError, ValueError):
+                return False
+            return since is not None and asset.mtime <= since.timestamp()
+        return False
+
+    def send_validator_headers(self, asset, etag):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        # 毎回再検証させる（変更がなければ 304 で済む）
+        self.send_header('Cache-Control', 'no-cache')
+        if asset.compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+
+    def send_common_headers(self):
+        """応答に追加するヘッダー（サブクラスで上書き）"""
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+ユーザーディレクトリ
+hotel_auth_config.json のユーザー一覧をID索引にし、ロール権限を事前に解決しておく
+"""
+
+
+class UserDirectory:
+    """ユーザーIDで引けるユーザー索引（設定が変わったら丸ごと作り直して入れ替える）"""
+
+    def __init__(self, users, roles):
+        self.users = {user['id']: user for user in users}
+        # 権限チェック用の frozenset と、応答用に設定ファイルの順序を保った tuple
+        self.role_permissions = {}
+        self.permission_lists = {}
+        for role, info in roles.items():
+            permissions = tuple(info.get('permissions', []))
+            self.role_permissions[role] = frozenset(permissions)
+            self.permission_lists[role] = permissions
+
+    @classmethod
+    def from_config(cls, config):
+        """設定ファイルの内容から作成"""
+        return cls(config.get('users', []), config.get('roles', {}))
+
+    def __len__(self):
+        return len(self.users)
+
+    def get(self, user_id):
+        """ユーザー情報の取得"""
+        return self.users.get(user_id)
+
+    def permissions(self, role):
+        """ロールの権限一覧"""
+        return self.permission_lists.get(role, ())
+
+    def has_permission(self, role, permission):
+        """ロールが権限を持つかどうか"""
+        return permission in self.role_permissions.get(role, frozenset())